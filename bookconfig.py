@@ -0,0 +1,118 @@
+#  图片册子拼版配置：读取 configs/*.ini 的 [page] 段，校验后保存在 LayoutConfig 对象里
+#  多个配置可以同时加载、互不影响；apply 时才写入拼版脚本（dankai）的模块变量
+
+import configparser
+import os
+
+from reportlab.lib.pagesizes import A4, A5, B5
+
+# 支持的纸张尺寸
+PAGE_SIZES = {"A4": A4, "A5": A5, "B5": B5}
+# 每个A5页面可以放的图片数
+A5_IMAGE_COUNTS = (1, 2, 4)
+
+# 配置项 -> (类型, 默认值, 拼版脚本中的变量名)
+FIELDS = {
+    "print_page_size": (str, "A5", "print_page_size"),
+    "current_a5_image_count": (int, 1, "CURRENT_A5_IMAGE_COUNT"),
+    "line_width": (float, 1.0, "LINE_WIDTH"),
+    "lr_padding": (int, 16, "lr_padding"),
+    "center_padding": (int, 16, "center_padding"),
+    "pre_none": (int, 0, "PRE_NONE"),
+    "start_index_offset": (int, 0, "start_index_offset"),
+    "print_page_index": (bool, True, "print_page_index"),
+    "fold_mode": (int, 2, "fold_mode"),
+    "landscape_page_mode": (bool, True, "landscape_page_mode"),
+    "image_margin": (int, 5, "image_margin"),
+    "split_horizontal_image": (bool, True, "split_horizontal_image"),
+    "max_output_mb": (float, 0.0, "max_output_mb"),
+}
+
+
+class LayoutConfig:
+    """
+    一份拼版配置，属性名与 ini 中的配置项相同
+    """
+
+    def __init__(self, name="default", **values):
+        """
+        :param name: 配置名称（一般为配置文件名，不含扩展名）
+        :param values: 配置项，未给出的使用默认值
+        """
+        unknown = set(values) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"错误：未知的配置项 {', '.join(sorted(unknown))}")
+        self.name = name
+        for key, (_, default, _) in FIELDS.items():
+            setattr(self, key, values.get(key, default))
+        self.validate()
+
+    @classmethod
+    def from_file(cls, config_file):
+        """
+        从配置文件加载配置
+        :param config_file: 配置文件路径
+        :return: LayoutConfig 对象
+        """
+        if not os.path.exists(config_file):
+            raise FileNotFoundError(f"配置文件 {config_file} 不存在")
+        parser = configparser.ConfigParser()
+        parser.read(config_file, encoding='utf-8')
+        values = {}
+        if parser.has_section('page'):
+            for key, (kind, _, _) in FIELDS.items():
+                if not parser.has_option('page', key):
+                    continue
+                try:
+                    if kind is bool:
+                        values[key] = parser.getboolean('page', key)
+                    elif kind is int:
+                        values[key] = parser.getint('page', key)
+                    elif kind is float:
+                        values[key] = parser.getfloat('page', key)
+                    else:
+                        values[key] = parser.get('page', key).strip().upper()
+                except ValueError:
+                    raise ValueError(f"错误：配置文件 {config_file} 中 {key} 的值 "
+                                     f"'{parser.get('page', key)}' 无效")
+        name = os.path.splitext(os.path.basename(config_file))[0]
+        return cls(name, **values)
+
+    def validate(self):
+        """
+        检查配置项的取值范围，无效时抛出 ValueError
+        """
+        if self.print_page_size not in PAGE_SIZES:
+            raise ValueError(f"错误：[{self.name}] 不支持的纸张尺寸 '{self.print_page_size}'，"
+                             f"可选：{', '.join(PAGE_SIZES)}")
+        if self.current_a5_image_count not in A5_IMAGE_COUNTS:
+            raise ValueError(f"错误：[{self.name}] current_a5_image_count 只能是 "
+                             f"{'/'.join(map(str, A5_IMAGE_COUNTS))}")
+        if self.fold_mode not in (1, 2):
+            raise ValueError(f"错误：[{self.name}] fold_mode 只能是 1（左翻页）或 2（右翻页）")
+        for key in ("line_width", "lr_padding", "center_padding", "pre_none",
+                    "image_margin", "max_output_mb"):
+            if getattr(self, key) < 0:
+                raise ValueError(f"错误：[{self.name}] {key} 不能为负数")
+
+    @property
+    def page_size(self):
+        """
+        纸张尺寸（点）
+        """
+        return PAGE_SIZES[self.print_page_size]
+
+    def apply(self, module):
+        """
+        把配置写入拼版脚本的模块变量（多配置运行时在各自的子进程中调用）
+        :param module: 拼版脚本模块，如 dankai
+        """
+        for key, (_, _, global_name) in FIELDS.items():
+            value = getattr(self, key)
+            if key == "print_page_size":
+                value = self.page_size
+            setattr(module, global_name, value)
+
+    def __repr__(self):
+        values = ", ".join(f"{key}={getattr(self, key)!r}" for key in FIELDS)
+        return f"LayoutConfig({self.name!r}, {values})"
@@ -0,0 +1,235 @@
+#  程序库接口：在一个进程里同时运行多个拼版任务
+#  dankai/shuangkai/epub2pdf 的设置都是模块变量（fold_mode、need_A4_pages、pages_c 等），两个任务共用一个模块会互相覆盖，
+#  所以每个任务加载一份独立的脚本模块（load_engine），拼版配置（bookconfig.LayoutConfig）和运行选项只写入这一份；
+#  字体注册、PIL/reportlab 和 imagecatalog 等辅助模块在进程内共用，常驻进程可以反复运行任务，不用每次重新启动
+#  图片册子任务运行期间这份模块以自己的名字登记在 sys.modules 中（位图输出的 fork 进程池要按名字找到绘制函数）；
+#  线程池中同时运行多个任务时，任务内部不再启动 fork 进程池（在有其他线程运行的进程中 fork 不安全），需要多进程时用 processes=True
+#  用法：
+#    config = bookconfig.LayoutConfig.from_file("configs/a52x2.ini")
+#    jobs = [booklet.BookletJob("./xfefm", "./out/xfefm.pdf", config, auto_color=True),
+#            booklet.TextBookJob("./book.txt", "./out/book.pdf", font_size=11)]
+#    results = booklet.run_jobs(jobs, workers=2)   # {序号: 输出路径或异常}
+
+import contextlib
+import importlib.util
+import itertools
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import util
+import bookconfig
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 可以作为任务运行的拼版脚本
+ENGINES = {"dankai": "dankai.py", "shuangkai": "shuangkai.py",
+           "epub2pdf": "epub2pdf.py"}
+# 图片册子任务可以设置的运行选项（对应拼版脚本的模块变量，命令行参数也是写入这些变量）
+IMAGE_OPTIONS = ("color_mode", "preview_mode", "raster_dpi", "raster_multipage",
+                 "prefetch_mb", "prefetch_decode", "analyze_pages",
+                 "drop_duplicates", "blank_mode", "select_codec", "auto_color",
+                 "resume", "signature_sheets", "hook_command")
+
+# 每份模块用不同的名字，报错信息里可以区分是哪个任务
+_engine_ids = itertools.count(1)
+
+
+def load_engine(engine):
+    """
+    加载一份独立的拼版脚本模块（不放进 sys.modules，不影响 import dankai 得到的模块；运行时用 registered 登记）
+    :param engine: 脚本名称（dankai / shuangkai / epub2pdf）
+    :return: 模块对象
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"错误：不支持的拼版脚本 '{engine}'，可选：{', '.join(ENGINES)}")
+    spec = importlib.util.spec_from_file_location(
+        f"{engine}_job{next(_engine_ids)}", os.path.join(SCRIPT_DIR, ENGINES[engine]))
+    module = importlib.util.module_from_spec(spec)
+    # 脚本开头会把脚本目录加到 sys.path（本模块已经加过），常驻进程反复加载时恢复原样，避免 sys.path 越来越长
+    saved_path = list(sys.path)
+    try:
+        spec.loader.exec_module(module)
+    finally:
+        sys.path[:] = saved_path
+    return module
+
+
+@contextlib.contextmanager
+def registered(module):
+    """
+    在 with 块中把 load_engine 得到的模块登记到 sys.modules，
+    pickle 才能按名字找到模块中的函数（提交到进程池的 functools.partial(draw_pdf_page, ...) 等）
+    """
+    sys.modules[module.__name__] = module
+    try:
+        yield module
+    finally:
+        sys.modules.pop(module.__name__, None)
+
+
+class BookletJob:
+    """
+    一个图片册子任务：图片文件夹、输出路径、拼版配置和运行选项都保存在对象里
+    """
+
+    def __init__(self, image_folder, output_path, config=None, engine="dankai",
+                 catalog=None, temp_root=None, **options):
+        """
+        :param image_folder: 图片文件夹
+        :param output_path: 输出路径（PDF，位图输出时为 PNG/TIFF）
+        :param config: LayoutConfig 对象，None 时使用默认配置
+        :param engine: 拼版脚本，dankai（单开图）或 shuangkai（双开图）
+        :param catalog: 同一图片文件夹的多个任务共用的 ImageCatalog 对象（只有 dankai 使用，
+                        线程池运行时有效；自动分色会改写目录的灰度图片集合，同时运行的分色任务不要共用）
+        :param temp_root: 临时图片目录，None 时每次运行新建一个，运行结束后删除
+        :param options: 运行选项，见 IMAGE_OPTIONS
+        """
+        if engine not in ("dankai", "shuangkai"):
+            raise ValueError(f"错误：图片册子任务只支持 dankai / shuangkai，不支持 '{engine}'")
+        unknown = set(options) - set(IMAGE_OPTIONS)
+        if unknown:
+            raise ValueError(f"错误：未知的运行选项 {', '.join(sorted(unknown))}")
+        self.image_folder = image_folder
+        self.output_path = output_path
+        self.config = config if config is not None else bookconfig.LayoutConfig()
+        self.engine = engine
+        self.catalog = catalog
+        self.temp_root = temp_root
+        self.options = options
+
+    def run(self, fork_workers=True):
+        """
+        在一份独立的拼版模块中运行任务
+        :param fork_workers: 是否允许启动 fork 进程池并行绘制位图（同一进程中有其他任务线程在运行时为 False）
+        :return: 输出路径
+        """
+        module = load_engine(self.engine)
+        self.config.apply(module)
+        for key, value in self.options.items():
+            if not hasattr(module, key):
+                raise ValueError(f"错误：{self.engine} 不支持运行选项 {key}")
+            setattr(module, key, value)
+        if self.catalog is not None and hasattr(module, "image_catalog"):
+            module.image_catalog = self.catalog
+        if not fork_workers:
+            module.render_workers = 1
+        # 没有指定临时目录时每次运行用一个独有的目录，图片写进输出文件后自动删除
+        scratch = (util.scratch_dir(f"{self.engine}-") if self.temp_root is None
+                   else contextlib.nullcontext(self.temp_root))
+        with registered(module), scratch as temp_root:
+            module.temp_root = temp_root
+            module.generate_pdf_from_images(self.image_folder, self.output_path,
+                                            self.config.page_size)
+        return self.output_path
+
+    def __repr__(self):
+        return (f"BookletJob({self.image_folder!r}, {self.output_path!r}, "
+                f"config={self.config.name!r}, engine={self.engine!r})")
+
+
+class TextBookJob:
+    """
+    一个文字书任务（EPUB/TXT → 拼版PDF），排版参数保存在对象里
+    """
+
+    def __init__(self, source_path, output_path, layout="a6x4", preview=False,
+                 chapter_range=None, encoding=None, fallback_fonts=(),
+                 font_size=None, line_space=None, margin=None, resume=False):
+        """
+        :param source_path: EPUB或TXT文件路径
+        :param output_path: 输出PDF路径，逻辑页面保存为 <输出路径>.a6.pdf
+        :param layout: 拼版方式（a6x4 / a5x2 / single）
+        :param preview: 打样预览
+        :param chapter_range: 只渲染的章节范围 (起始章节, 结束章节)
+        :param encoding: TXT文件编码，None 表示自动探测
+        :param fallback_fonts: 后备字体文件列表
+        :param font_size: 正文字号，None 表示使用 epub2pdf 的默认值
+        :param line_space: 行距
+        :param margin: A6区域边距
+        :param resume: 复用上次中断留下的逻辑页面批次（<输出路径>.a6.resume/）
+        """
+        if not source_path.endswith((".epub", ".txt")):
+            raise ValueError(f"错误：不支持的文件格式：{source_path}")
+        self.source_path = source_path
+        self.output_path = output_path
+        self.layout = layout
+        self.preview = preview
+        self.chapter_range = chapter_range
+        self.encoding = encoding
+        self.fallback_fonts = list(fallback_fonts)
+        self.resume = resume
+        self.fit_params = {name: value for name, value in (
+            ("font_size", font_size), ("line_space", line_space), ("margin", margin))
+            if value is not None}
+
+    def run(self, fork_workers=True):
+        """
+        在一份独立的 epub2pdf 模块中排版并拼版
+        :param fork_workers: 是否允许启动进程池并行排版章节（同一进程中有其他任务线程在运行时为 False）
+        :return: 输出路径
+        """
+        module = load_engine("epub2pdf")
+        if self.layout not in module.impose.LAYOUTS:
+            raise ValueError(f"错误：不支持的拼版方式 '{self.layout}'")
+        module.PAGE_LAYOUT = self.layout
+        module.PREVIEW = self.preview
+        module.TXT_ENCODING = self.encoding
+        module.resume = self.resume
+        module.FALLBACK_FONTS.extend(self.fallback_fonts)
+        for name, value in self.fit_params.items():
+            module.set_fit_param(name, value)
+        if not fork_workers:
+            module.layout_workers = 1
+        output_dir = os.path.dirname(self.output_path)
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        pages_pdf = os.path.splitext(self.output_path)[0] + ".a6.pdf"
+        if self.source_path.endswith(".epub"):
+            module.generate_custom_order_pdfs(self.source_path, pages_pdf,
+                                              self.chapter_range)
+        else:
+            module.process_txt_to_pdf(self.source_path, pages_pdf, self.chapter_range)
+        if self.preview:
+            module.impose.impose_images(module.pages_c.pages, self.output_path,
+                                        self.layout, module.pages_c.dpi)
+        else:
+            module.impose.impose_pdf(pages_pdf, self.output_path, self.layout)
+        module.close_pages()
+        return self.output_path
+
+    def __repr__(self):
+        return f"TextBookJob({self.source_path!r}, {self.output_path!r}, layout={self.layout!r})"
+
+
+def _run_job(job, fork_workers=True):
+    return job.run(fork_workers)
+
+
+def run_jobs(jobs, workers=None, processes=False):
+    """
+    并发运行多个任务
+    :param jobs: BookletJob / TextBookJob 列表
+    :param workers: 并发数，默认使用全部CPU核心
+    :param processes: True 时用进程池（图片解码等纯 Python 部分不受 GIL 限制，任务内部也可以再用进程池并行绘制），
+                      默认用线程池（多个任务同时运行时，任务内部在当前进程中顺序绘制位图、排版章节）
+    :return: {任务序号: 输出路径或异常}
+    """
+    workers = workers or os.cpu_count() or 1
+    fork_workers = True
+    if processes and workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers,
+                                       mp_context=multiprocessing.get_context("fork"))
+    else:
+        executor = ThreadPoolExecutor(max_workers=workers)
+        fork_workers = workers == 1 or len(jobs) == 1
+    results = {}
+    with executor:
+        futures = [executor.submit(_run_job, job, fork_workers) for job in jobs]
+        for index, future in enumerate(futures):
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                results[index] = e
+    return results
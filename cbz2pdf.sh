@@ -15,7 +15,7 @@ fi
 
 INPUT_DIR="$1"
 OUTPUT_PDF="${2:-$(basename "$INPUT_DIR")_a4_2x2.pdf}"  # 默认输出名
-TMP_DIR="./tmp/cbz2pdf_$(date +%s)"  # 临时目录，避免冲突
+TMP_DIR=$(mktemp -d "${TMPDIR:-/tmp}/cbz2pdf.XXXXXX")  # 临时目录，每次运行独有，避免冲突
 
 
 function combine2picToA5() {
@@ -35,10 +35,9 @@ cleanup() {
     rm -rf "$TMP_DIR"
     echo "临时文件已清理"
 }
-# trap cleanup EXIT  # 脚本退出时自动执行清理
+trap cleanup EXIT  # 脚本退出时（包括出错）自动执行清理
 
-# 1. 创建临时目录并复制图片文件
-mkdir -p "$TMP_DIR"
+# 1. 复制图片文件到临时目录
 echo "正在复制图片文件从目录: $INPUT_DIR"
 cp "$INPUT_DIR"/* "$TMP_DIR"/ 2>/dev/null || true
 
@@ -0,0 +1,87 @@
+#  章节索引：一次流式扫描TXT/EPUB，记录每章的位置、标题和层级
+#  索引保存在源文件旁边（<源文件>.chapters.json），用于生成PDF书签和只渲染部分章节
+
+import json
+import os
+
+import textlayout
+
+INDEX_VERSION = 1
+
+
+def index_path(source_path):
+    """
+    章节索引文件路径（与源文件放在一起）
+    """
+    return source_path + ".chapters.json"
+
+
+def _source_stamp(source_path):
+    """
+    源文件的大小和修改时间，用于判断索引是否过期
+    """
+    stat = os.stat(source_path)
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+def build_txt_index(source):
+    """
+    一次流式扫描TXT文件，记录所有标题段落的字节偏移
+    :param source: txtsource.TextSource 对象
+    :return: [{"offset": 字节偏移, "title": 标题, "level": 层级}, ...]
+    """
+    entries = []
+    for offset, paragraph in source.paragraphs():
+        level = textlayout.detect_title(paragraph)
+        if level is not None:
+            entries.append({"offset": offset, "title": paragraph, "level": level})
+    return entries
+
+
+def load_index(source_path, encoding=None):
+    """
+    读取源文件旁边的章节索引，索引不存在或已过期时返回 None
+    """
+    try:
+        with open(index_path(source_path), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (data.get("version") != INDEX_VERSION or
+            data.get("source") != _source_stamp(source_path) or
+            data.get("encoding") != encoding):
+        return None
+    return data["chapters"]
+
+
+def save_index(source_path, entries, encoding=None):
+    """
+    将章节索引保存到源文件旁边，目录不可写时只打印提示
+    """
+    data = {
+        "version": INDEX_VERSION,
+        "source": _source_stamp(source_path),
+        "encoding": encoding,
+        "chapters": entries,
+    }
+    try:
+        with open(index_path(source_path), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+    except OSError as e:
+        print(f"⚠️ 无法保存章节索引 {index_path(source_path)}: {e}")
+
+
+def parse_chapter_range(text):
+    """
+    解析章节范围参数，章节序号从1开始
+    "120-160" -> (120, 160)，"120" -> (120, 120)，"120-" -> (120, None)
+    """
+    start, sep, end = text.partition('-')
+    start = int(start) if start.strip() else 1
+    if not sep:
+        end = start
+    else:
+        end = int(end) if end.strip() else None
+    if start < 1 or (end is not None and end < start):
+        raise ValueError(f"错误：无效的章节范围 '{text}'")
+    return start, end
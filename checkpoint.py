@@ -0,0 +1,199 @@
+#  断点续做：reportlab 到 save() 时才写出PDF，几千页的合集中途出错或按 Ctrl-C 就要从头再来
+#  超过一批的长任务总是按批次（若干张纸）绘制，每批保存为工作目录 <输出文件名>.resume/ 中的一个小PDF，
+#  日志 journal.json 记录已完成的批次和拼版状态（图片列表、配置、每一面的输出文件），全部完成后合并为输出文件并删除工作目录；
+#  中断后用同样的参数加 --resume 重新运行时，拼版状态没有变化就跳过已完成的批次，不加 --resume 时丢弃旧的批次从头开始
+#  拼版状态变化（换了图片或配置）时同样丢弃旧的批次
+#  文字书（epub2pdf）的章节跨A6区域连续排版：续做时排好的章节从排版缓存回放，place_blocks 重新分配A6区域，
+#  只绘制没有完成的批次（每批若干个逻辑页面），见 epub2pdf.start_pages
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+# 尝试导入 PyPDF2 用于合并批次
+try:
+    from PyPDF2 import PdfReader, PdfWriter
+except ImportError:
+    try:
+        from pypdf import PdfReader, PdfWriter
+    except ImportError:
+        print("错误：需要安装 PyPDF2 或 pypdf 库来合并续做批次")
+        print("请运行: pip install PyPDF2 或 pip install pypdf")
+        sys.exit(1)
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import rastercanvas
+
+# 每批的纸张数（正反两面）
+BATCH_SHEETS = 8
+# 日志文件名
+JOURNAL_NAME = "journal.json"
+
+
+def work_dir_for(output_path):
+    """
+    输出文件对应的续做工作目录
+    """
+    return os.path.splitext(output_path)[0] + ".resume"
+
+
+def file_signature(paths):
+    """
+    文件列表的签名（路径、大小、修改时间），用于判断输入是否变化
+    :param paths: 文件路径列表（可以包含 None 占位）
+    """
+    signature = []
+    for path in paths:
+        if path is None:
+            signature.append(None)
+            continue
+        st = os.stat(path)
+        signature.append([path, st.st_size, st.st_mtime_ns])
+    return signature
+
+
+def scratch_relative(paths, scratch):
+    """
+    日志中记录的图片路径：临时目录（每次运行都不同）中的图片只记录相对路径
+    :param paths: 图片路径列表（可以包含 None 占位）
+    :param scratch: 临时目录，"" 表示没有
+    """
+    if not scratch:
+        return list(paths)
+    prefix = os.path.join(scratch, "")
+    return [os.path.relpath(path, scratch) if path and path.startswith(prefix) else path
+            for path in paths]
+
+
+class Journal:
+    """
+    续做日志：记录拼版状态的指纹和已完成的批次
+    """
+
+    def __init__(self, work_dir, state, reuse=True):
+        """
+        :param work_dir: 工作目录
+        :param state: 拼版状态（可以转成 JSON 的对象），变化时丢弃已完成的批次
+        :param reuse: 是否复用上次中断留下的批次（--resume），False 时丢弃工作目录中的旧批次
+        """
+        self.work_dir = work_dir
+        self.path = os.path.join(work_dir, JOURNAL_NAME)
+        self.fingerprint = hashlib.sha1(json.dumps(
+            state, sort_keys=True, ensure_ascii=False, default=repr).encode("utf-8")).hexdigest()
+        self.batches = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                journal = json.load(f)
+        except (OSError, ValueError):
+            journal = None
+        if not reuse:
+            if os.path.isdir(work_dir):
+                print(f"⚠️ 没有指定 --resume，丢弃 {work_dir} 中上次留下的批次")
+                shutil.rmtree(work_dir)
+        elif journal is not None and journal.get("fingerprint") == self.fingerprint:
+            self.batches = {int(batch): parts for batch, parts in journal["batches"].items()
+                            if all(os.path.exists(path) for path in parts.values())}
+        elif os.path.isdir(work_dir):
+            print(f"⚠️ 图片或配置已变化，丢弃 {work_dir} 中的旧批次")
+            shutil.rmtree(work_dir)
+        os.makedirs(work_dir, exist_ok=True)
+
+    def part_path(self, batch, output_path):
+        """
+        一个批次中属于 output_path 的部分的保存路径
+        """
+        return os.path.join(self.work_dir, f"{batch:05d}-{os.path.basename(output_path)}")
+
+    def mark_done(self, batch, parts):
+        """
+        记录完成的批次（先写临时文件再替换，中断时日志不会写坏）
+        :param parts: {输出路径: 批次PDF路径}
+        """
+        self.batches[batch] = parts
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "batches": self.batches}, f,
+                      ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def merge(self, output_paths, pagesize):
+        """
+        按批次顺序合并每个输出文件，末尾与一次生成时一样多一页空白页，完成后删除工作目录
+        """
+        for output_path in output_paths:
+            self.write_merged(output_path, pagesize)
+        self.close()
+
+    def write_merged(self, output_path, blank_pagesize=None, finish=None):
+        """
+        按批次顺序合并 output_path 的各个部分（先写临时文件再替换）
+        :param blank_pagesize: 不为 None 时在末尾加一页该尺寸的空白页
+        :param finish: finish(PdfWriter)，写出之前调用（例如添加书签）
+        """
+        writer = PdfWriter()
+        for batch in sorted(self.batches):
+            part = self.batches[batch].get(output_path)
+            if part is not None:
+                for page in PdfReader(part).pages:
+                    writer.add_page(page)
+        if blank_pagesize is not None:
+            writer.add_blank_page(*blank_pagesize)
+        if finish is not None:
+            finish(writer)
+        tmp_path = output_path + ".part"
+        with open(tmp_path, "wb") as f:
+            writer.write(f)
+        os.replace(tmp_path, output_path)
+
+    def close(self):
+        """
+        任务全部完成，删除工作目录
+        """
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+def is_long(side_count, batch_sheets=BATCH_SHEETS):
+    """
+    超过一批的任务按批次绘制并记录日志，一批以内的直接绘制
+    :param side_count: 总面数
+    """
+    return side_count > batch_sheets * 2
+
+
+def render_sides(draw_side, side_outputs, pagesize, state, work_dir,
+                 reuse=False, batch_sheets=BATCH_SHEETS):
+    """
+    按批次绘制所有面并记录，已完成的批次跳过，最后合并
+    :param draw_side: draw_side(画布, 面索引)，绘制一面（不调用 showPage）
+    :param side_outputs: 每一面的输出路径
+    :param pagesize: 页面尺寸
+    :param state: 拼版状态，见 Journal
+    :param work_dir: 工作目录（work_dir_for(输出路径)）
+    :param reuse: 是否复用上次中断留下的批次（--resume）
+    :param batch_sheets: 每批的纸张数
+    """
+    journal = Journal(work_dir, state, reuse)
+    batch_sides = batch_sheets * 2
+    batch_count = (len(side_outputs) + batch_sides - 1) // batch_sides
+    if journal.batches:
+        print(f"⏩ 续做：跳过已完成的 {len(journal.batches)}/{batch_count} 批")
+    for batch in range(batch_count):
+        if batch in journal.batches:
+            continue
+        canvases = {}
+        for side_index in range(batch * batch_sides,
+                                min(len(side_outputs), (batch + 1) * batch_sides)):
+            output_path = side_outputs[side_index]
+            if output_path not in canvases:
+                canvases[output_path] = rastercanvas.make_canvas(
+                    journal.part_path(batch, output_path), pagesize, False)
+            c = canvases[output_path]
+            draw_side(c, side_index)
+            c.showPage()
+        for c in canvases.values():
+            c.save()
+        journal.mark_done(batch, {output_path: journal.part_path(batch, output_path)
+                                  for output_path in canvases})
+    journal.merge(list(dict.fromkeys(side_outputs)), pagesize)
@@ -0,0 +1,209 @@
+#  按内容选择图片编码：PNG 等非 JPEG 图片（clippic.sh、xuanzhuan.sh 和横图分割的结果）
+#  原样嵌入时都是 Flate 压缩的 RGB 数据，照片类图片很大，黑白线稿也存了三个通道
+#  用缩略图的直方图和边缘统计给每张图片分类，选择最省空间又看不出损失的编码：
+#    照片 -> JPEG（灰度照片用单通道 JPEG）
+#    黑白线稿 -> 只有黑白两级的灰度图（Flate 压缩后接近 1 位图）
+#    灰度图 -> 单通道灰度（Flate）
+#    颜色很少的图片 -> 调色板量化（reportlab 按 RGB 嵌入，但重复的颜色 Flate 压缩率很高）
+#  reportlab 只能嵌入 L/RGB/CMYK 图片，所以 1 位图和索引色用上面两种方式近似
+#  JPEG 图片本来就原样嵌入，不重新编码；带透明通道的图片也保持原样
+
+import io
+import os
+import sys
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import util
+
+# 分类用缩略图的长边（像素，最近邻缩小，不产生新的颜色）
+STATS_SIZE = 512
+# 色度超过这个值的像素算彩色像素，比例低于 GRAY_RATIO 的图片按灰度处理
+CHROMA_LEVEL = 24
+GRAY_RATIO = 0.005
+# 接近纯黑/纯白的像素比例超过这个值算黑白线稿
+BILEVEL_RATIO = 0.97
+BLACK_LEVEL = 48
+WHITE_LEVEL = 208
+# 覆盖 99.5% 像素所需的颜色数不超过这个值时使用调色板
+PALETTE_COLORS = 64
+PALETTE_COVERAGE = 0.995
+# 相邻像素灰度差在 (0, SMOOTH_STEP] 之间的比例超过这个值算照片（连续色调）
+SMOOTH_STEP = 12
+PHOTO_SMOOTH = 0.35
+# 照片重新编码为 JPEG 的质量
+JPEG_QUALITY = 90
+# 重新编码的图片存放目录
+TEMP_DIR = "temp_codec_images"
+# 编码名称（报告中显示）
+CODEC_NAMES = {"keep": "保持原样", "jpeg": "JPEG", "gray": "灰度", "bilevel": "黑白",
+               "palette": "调色板"}
+
+
+def image_statistics(img):
+    """
+    缩略图的直方图和边缘统计
+    :param img: RGB 或 L 模式的PIL图片
+    :return: dict（彩色像素比例、黑白像素比例、所需颜色数、平滑过渡比例）
+    """
+    small = img.copy()
+    small.thumbnail((STATS_SIZE, STATS_SIZE), Image.NEAREST)
+    rgb = np.asarray(small.convert('RGB'), dtype=np.int16)
+    gray = np.asarray(small.convert('L'), dtype=np.int16)
+    chroma = rgb.max(axis=2) - rgb.min(axis=2)
+    color_ratio = float(np.count_nonzero(chroma > CHROMA_LEVEL)) / chroma.size
+    extreme = np.count_nonzero((gray <= BLACK_LEVEL) | (gray >= WHITE_LEVEL))
+    # 所需颜色数：按像素数从多到少累加，覆盖 PALETTE_COVERAGE 的像素需要几种颜色
+    packed = (rgb[..., 0].astype(np.int32) << 16) | (rgb[..., 1] << 8) | rgb[..., 2]
+    counts = np.sort(np.unique(packed, return_counts=True)[1])[::-1]
+    colors = int(np.searchsorted(np.cumsum(counts), PALETTE_COVERAGE * packed.size) + 1)
+    # 边缘统计：照片中相邻像素大多是小幅度的连续变化，线稿和色块是平坦区加锐利边缘
+    steps = np.abs(np.diff(gray, axis=1))
+    smooth = np.count_nonzero((steps > 0) & (steps <= SMOOTH_STEP))
+    return {
+        "color_ratio": color_ratio,
+        "bilevel_ratio": float(extreme) / gray.size,
+        "colors": colors,
+        "smooth_ratio": float(smooth) / max(1, steps.size),
+    }
+
+
+def choose_codec(stats):
+    """
+    按统计结果选择编码
+    :return: keep/jpeg/gray/bilevel/palette
+    """
+    is_gray = stats["color_ratio"] < GRAY_RATIO
+    if is_gray and stats["bilevel_ratio"] >= BILEVEL_RATIO:
+        return "bilevel"
+    if stats["colors"] <= PALETTE_COLORS:
+        return "gray" if is_gray else "palette"
+    if stats["smooth_ratio"] >= PHOTO_SMOOTH:
+        return "jpeg"
+    return "gray" if is_gray else "keep"
+
+
+def flate_size(img):
+    """
+    reportlab 嵌入非 JPEG 图片时的数据大小（转成 L/RGB/CMYK 后 Flate 压缩）
+    """
+    if img.mode not in ('L', 'RGB', 'CMYK'):
+        img = img.convert('RGB')
+    return len(zlib.compress(img.tobytes()))
+
+
+def encode_image(img, codec):
+    """
+    按编码转换图片
+    :return: (要保存的PIL图片或 JPEG 数据, 嵌入PDF后的大小)
+    """
+    if codec == "jpeg":
+        data = io.BytesIO()
+        img.save(data, 'JPEG', quality=JPEG_QUALITY)
+        return data.getvalue(), len(data.getvalue())
+    if codec == "bilevel":
+        # 只保留黑白两级（阈值取中间），Flate 压缩后与 1 位图相差不大
+        img = img.convert('L').point(lambda v: 255 if v >= 128 else 0)
+    elif codec == "gray":
+        img = img.convert('L')
+    elif codec == "palette":
+        img = img.quantize(PALETTE_COLORS, dither=Image.Dither.NONE)
+    return img, flate_size(img)
+
+
+def select_codec(image_path, temp_dir=TEMP_DIR):
+    """
+    为一张图片选择编码，编码后变小时保存到临时目录
+    :return: (使用的图片路径, 编码, 原来的大小, 编码后的大小)
+    """
+    with Image.open(image_path) as img:
+        if img.format == 'JPEG' or 'A' in img.getbands() or \
+                'transparency' in img.info:
+            return image_path, "keep", 0, 0
+        img.load()
+    original = flate_size(img)
+    if img.mode not in ('L', 'RGB'):
+        img = img.convert('RGB')
+    stats = image_statistics(img)
+    codec = choose_codec(stats)
+    if codec == "keep":
+        return image_path, codec, original, original
+    if codec == "jpeg" and stats["color_ratio"] < GRAY_RATIO:
+        img = img.convert('L')
+    encoded, size = encode_image(img, codec)
+    if size >= original:
+        return image_path, "keep", original, original
+    os.makedirs(temp_dir, exist_ok=True)
+    base_name = util.scratch_name(image_path, "", os.path.dirname(temp_dir))
+    if codec == "jpeg":
+        output_path = os.path.join(temp_dir, f"{base_name}_{codec}.jpg")
+        with open(output_path, 'wb') as f:
+            f.write(encoded)
+    else:
+        output_path = os.path.join(temp_dir, f"{base_name}_{codec}.png")
+        encoded.save(output_path, 'PNG')
+    return output_path, codec, original, size
+
+
+def _safe_select(image_path, temp_dir):
+    try:
+        return select_codec(image_path, temp_dir)
+    except Exception as e:
+        print(f"无法选择编码 {image_path}: {e}")
+        return image_path, "keep", 0, 0
+
+
+def select_codecs(image_files, catalog=None, workers=None, temp_dir=TEMP_DIR,
+                  report=True):
+    """
+    为所有非 JPEG 图片选择编码（线程池并行，结果缓存在图片目录中）
+    :param image_files: 图片路径列表（可以包含 None 占位）
+    :param catalog: ImageCatalog 对象，多配置运行时共用结果
+    :param workers: 线程数，默认使用全部CPU核心
+    :param report: 是否打印每张图片的编码和节省的大小
+    :return: 新的图片路径列表
+    """
+    paths = [path for path in dict.fromkeys(image_files) if path is not None
+             and not path.lower().endswith(('.jpg', '.jpeg'))]
+    results = {}
+    pending = []
+    for path in paths:
+        result = catalog.get_derived(("codec", path, temp_dir)) if catalog else None
+        if result is None:
+            pending.append(path)
+        else:
+            results[path] = result
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        for path, result in zip(pending, executor.map(
+                lambda path: _safe_select(path, temp_dir), pending)):
+            results[path] = result
+            if catalog is not None:
+                catalog.derived(("codec", path, temp_dir), lambda: result)
+
+    if report and results:
+        print_report(paths, results)
+    return [results[path][0] if path in results else path for path in image_files]
+
+
+def print_report(paths, results):
+    """
+    打印每张图片的编码选择和节省的大小
+    """
+    before = after = 0
+    print(f"🗜️ 编码选择：{len(paths)} 张非 JPEG 图片")
+    for path in paths:
+        _, codec, original, size = results[path]
+        before += original
+        after += size
+        if codec == "keep":
+            print(f"  {os.path.basename(path)}：{CODEC_NAMES[codec]}  {original / 1024:.0f}KB")
+            continue
+        print(f"  {os.path.basename(path)}：{CODEC_NAMES[codec]}  "
+              f"{original / 1024:.0f}KB → {size / 1024:.0f}KB（-{(1 - size / original) * 100:.0f}%）")
+    if before:
+        print(f"  合计：{before / 1024 / 1024:.1f}MB → {after / 1024 / 1024:.1f}MB"
+              f"（节省 {(before - after) / 1024 / 1024:.1f}MB）")
@@ -1,16 +1,36 @@
+#  封面生成：封底、书脊、封面排在一张横版纸上
+#  封面图片按原始数据嵌入（分辨率超过打印需要时才缩小到 COVER_DPI），书脊标题是PDF矢量文字，
+#  书脊宽度按页数计算；不再像 newcover.py 那样把整张封面合成为全分辨率位图
+
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A5, A4, A6, A3, landscape
 from reportlab.lib.units import mm
-from PIL import Image
+from reportlab.lib.utils import ImageReader
+from PIL import Image, ImageOps
 from reportlab.pdfbase import pdfmetrics
 
+import io
+import math
 import os
 import sys
 import re
 
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import util
+
 zhongxianspace = 14
 book_name = "名侦探柯南10"
 pagesize = A4
+# 封面图片的打印分辨率：原图超过这个分辨率时缩小，否则原样嵌入
+COVER_DPI = 300
+# 缩小后的封面图片的 JPEG 质量
+COVER_JPEG_QUALITY = 92
+# 封面高度（mm），默认与A6册子相同
+COVER_HEIGHT_MM = A6[1] / mm
+# 每张纸的厚度（mm，80g 胶版纸约 0.1mm），书脊宽度 = 纸张数 × 厚度
+PAPER_THICKNESS_MM = 0.1
+# 书脊最小宽度（mm），页数很少时也能放下标题
+SPINE_MIN_MM = 4
 def split_text_for_vertical_display(text):
     """
     将文本拆分为垂直显示的元素，但保持数字作为一个整体
@@ -217,25 +237,146 @@ def generate_pdf_from_images(input_path: str, output_pdf: str, pagesize=A4):
         raise ValueError(f"错误：输入路径 '{input_path}' 既不是文件夹也不是文件！")
 
 
+def spine_width_mm(page_count, thickness_mm=PAPER_THICKNESS_MM):
+    """
+    按页数计算书脊宽度（每张纸正反两页）
+    :param page_count: 内页页数
+    :return: 书脊宽度（mm）
+    """
+    return max(SPINE_MIN_MM, math.ceil(page_count / 2) * thickness_mm)
+
+
+def cover_image_source(image_path, width, height, dpi=COVER_DPI):
+    """
+    按打印尺寸准备封面图片：分辨率不超过 dpi 且不需要按 EXIF 旋转的图片（不论格式）直接用路径嵌入原图，
+    只有超过 dpi 需要缩小（JPEG 先按 1/2~1/8 比例解码）或需要旋转时才重新压缩成 JPEG
+    :param width: 打印宽度（点）
+    :param height: 打印高度（点）
+    :return: drawImage 可以使用的图片来源
+    """
+    need_w = math.ceil(width / 72 * dpi)
+    need_h = math.ceil(height / 72 * dpi)
+    with Image.open(image_path) as img:
+        rotated = img.getexif().get(0x0112, 1) != 1
+        if not rotated and img.width <= need_w * 1.1:
+            return image_path
+        img.draft('RGB', (need_w, need_h))
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('L' if img.mode == 'L' else 'RGB')
+    if img.width > need_w:
+        img = img.resize((need_w, need_h), Image.Resampling.LANCZOS)
+    data = io.BytesIO()
+    img.save(data, 'JPEG', quality=COVER_JPEG_QUALITY)
+    data.seek(0)
+    return ImageReader(data)
+
+
+def draw_spine_title(c, title, x, y, spine_width, spine_height,
+                     font_name=DEFAULT_FONT):
+    """
+    在书脊上竖排绘制标题（矢量文字，数字组合保持横排）
+    :param x: 书脊左边的X坐标
+    :param y: 书脊底边的Y坐标
+    """
+    elements = split_text_for_vertical_display(title)
+    if not elements:
+        return
+    # 字号：书脊宽度的60%，标题太长时缩小到能放下
+    font_size = min(spine_width * 0.6, spine_height * 0.8 / (len(elements) * 1.2))
+    line_height = font_size * 1.2
+    center_x = x + spine_width / 2
+    top = y + (spine_height + len(elements) * line_height) / 2
+    c.setFillColorRGB(0, 0, 0)
+    for index, element in enumerate(elements):
+        # 数字组合比书脊宽时缩小字号
+        size = font_size
+        width = pdfmetrics.stringWidth(element, font_name, size)
+        if width > spine_width * 0.85:
+            size *= spine_width * 0.85 / width
+            width = pdfmetrics.stringWidth(element, font_name, size)
+        c.setFont(font_name, size)
+        baseline = top - (index + 1) * line_height + (line_height - size) / 2
+        c.drawString(center_x - width / 2, baseline, element)
+
+
+def make_cover(left_image, right_image, output_pdf, title="", page_count=None,
+               spine_mm=None, height_mm=COVER_HEIGHT_MM, dpi=COVER_DPI,
+               sheet=landscape(A4)):
+    """
+    生成封面PDF：左图、书脊、右图从左到右排列，居中放在一张纸上
+    :param left_image: 左边的图片（右翻页的书为封面，左翻页的书为封底）
+    :param right_image: 右边的图片
+    :param output_pdf: 输出PDF路径
+    :param title: 书脊标题
+    :param page_count: 内页页数，用于计算书脊宽度
+    :param spine_mm: 直接指定书脊宽度（mm），优先于页数
+    :param height_mm: 封面高度（mm）
+    :param dpi: 封面图片的打印分辨率
+    :param sheet: 纸张尺寸，封面比纸大时纸张尺寸按封面大小
+    """
+    if spine_mm is None:
+        spine_mm = spine_width_mm(page_count or 0)
+    height = height_mm * mm
+    spine_width = spine_mm * mm
+    sizes = []
+    for image_path in (left_image, right_image):
+        with Image.open(image_path) as img:
+            img_w, img_h = img.size
+            if img.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+                img_w, img_h = img_h, img_w  # EXIF 旋转90度
+        sizes.append(img_w * height / img_h)
+    total_width = sizes[0] + spine_width + sizes[1]
+    page_width = max(sheet[0], total_width)
+    page_height = max(sheet[1], height)
+    x = (page_width - total_width) / 2
+    y = (page_height - height) / 2
+
+    output_dir = os.path.dirname(output_pdf)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+    c = canvas.Canvas(output_pdf, pagesize=(page_width, page_height))
+    c.drawImage(cover_image_source(left_image, sizes[0], height, dpi),
+                x, y, width=sizes[0], height=height)
+    spine_x = x + sizes[0]
+    c.drawImage(cover_image_source(right_image, sizes[1], height, dpi),
+                spine_x + spine_width, y, width=sizes[1], height=height)
+    if title:
+        draw_spine_title(c, title, spine_x, y, spine_width, height)
+    c.save()
+    print(f"✅ 封面生成完成！书脊宽度 {spine_mm:.1f}mm，封面 "
+          f"{total_width / mm:.0f}×{height_mm:.0f}mm")
+    print(f"📁 输出路径：{os.path.abspath(output_pdf)}")
+
+
 # --------------- 命令行调用入口 ---------------
 if __name__ == "__main__":
+    args = sys.argv[1:]
+    title = util.pop_option(args, "--title", "")
+    page_count = util.pop_option(args, "--pages")
+    spine_mm = util.pop_option(args, "--spine-mm")
+    height_mm = float(util.pop_option(args, "--height-mm", COVER_HEIGHT_MM))
+    dpi = int(util.pop_option(args, "--dpi", COVER_DPI))
     # 检查命令行参数数量
-    if len(sys.argv) != 3:
+    if len(args) not in (2, 3):
         print("❌ 参数错误！正确用法：")
         print(f"1. python {os.path.basename(__file__)} <图片文件夹路径> <输出PDF文件路径>")
         print(f"2. python {os.path.basename(__file__)} <单个图片文件路径> <输出PDF文件路径>")
+        print(f"3. python {os.path.basename(__file__)} <左图> <右图> <输出PDF文件路径> --title 书名 [--pages 页数 | --spine-mm 书脊宽度] [--height-mm 封面高度] [--dpi 300]")
         print("示例：")
         print(f"python {os.path.basename(__file__)} ./images ./output.pdf")
         print(f"python {os.path.basename(__file__)} ./image.jpg ./output.pdf")
+        print(f"python {os.path.basename(__file__)} back.jpg front.jpg ./cover.pdf --title 名侦探柯南10 --pages 192")
+        print("第3种用法：书脊宽度按页数计算，书脊标题为矢量文字，封面图片只在分辨率超过 --dpi 时缩小")
         sys.exit(1)
 
-    # 获取命令行参数
-    input_path = sys.argv[1]
-    output_file = sys.argv[2]
-
-    # 执行PDF生成
     try:
-        generate_pdf_from_images(input_path, output_file)
+        if len(args) == 3:
+            make_cover(args[0], args[1], args[2], title,
+                       int(page_count) if page_count else None,
+                       float(spine_mm) if spine_mm else None, height_mm, dpi)
+        else:
+            # 执行PDF生成
+            generate_pdf_from_images(args[0], args[1])
     except Exception as e:
         print(f"\n❌ 生成失败：{str(e)}")
         sys.exit(1)
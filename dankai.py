@@ -2,87 +2,40 @@
 #  输入：图片文件夹路径
 #  输出：生成的PDF文件（ booklet 模式）
 
-from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4, A5, B5
 from reportlab.lib.units import mm
 from PIL import Image
 import os
 import sys
 from PIL import Image, ImageDraw, ImageFont
-import configparser
+import functools
 from reportlab.lib.pagesizes import landscape
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import util
+import rastercanvas
+import bookconfig
+import imagecatalog
+import pageanalysis
+import sizebudget
+import codecselect
+import checkpoint
+import signatures
 
 fold_mode = 2  # 1 左翻页，2 右翻页
 
 
 def load_config(config_file):
     """
-    从配置文件加载配置
+    从配置文件加载配置，并写入本模块的配置变量
     :param config_file: 配置文件路径
-    :return: 配置对象
+    :return: LayoutConfig 配置对象
     """
-    config = configparser.ConfigParser()
-
-    # 设置默认值
-    config['page'] = {
-        'print_page_size': 'A5',
-        'current_a5_image_count': '1',
-        'line_width': '1',
-        'lr_padding': '16',
-        'center_padding': '16',
-        'pre_none': '0',
-        'start_index_offset': '0',
-        'print_page_index': 'true',
-        'image_margin': '5',
-    }
-
-    # 读取配置文件
-    if os.path.exists(config_file):
-        config.read(config_file, encoding='utf-8')
-    else:
-        raise FileNotFoundError(f"配置文件 {config_file} 不存在")
-
-    # 从配置中读取参数
-    global print_page_size, CURRENT_A5_IMAGE_COUNT, split_horizontal_image
-    global LINE_WIDTH, lr_padding, center_padding, PRE_NONE, start_index_offset
-    global print_page_index, fold_mode, A5_SEQ_MAP, landscape_page_mode, image_margin
-
-    # 读取配置参数
-    page_size_name = config.get('page', 'print_page_size', fallback='A5')
-    if page_size_name == 'A5':
-        print_page_size = A5
-    elif page_size_name == 'B5':
-        print_page_size = B5
-    else:
-        print_page_size = A4  # 默认为A4
-
-    CURRENT_A5_IMAGE_COUNT = config.getint('page',
-                                           'current_a5_image_count',
-                                           fallback=1)
-    LINE_WIDTH = config.getfloat('page', 'line_width', fallback=1.0)
-    lr_padding = config.getint('page', 'lr_padding', fallback=16)
-    center_padding = config.getint('page', 'center_padding', fallback=16)
-    PRE_NONE = config.getint('page', 'pre_none', fallback=0)
-    start_index_offset = config.getint('page',
-                                       'start_index_offset',
-                                       fallback=0)
-    print_page_index = config.getboolean('page',
-                                         'print_page_index',
-                                         fallback=True)
-    fold_mode = config.getint('page', 'fold_mode', fallback=2)
-    landscape_page_mode = config.getboolean('page',
-                                            'landscape_page_mode',
-                                            fallback=True)
-    image_margin = config.getint('page', 'image_margin', fallback=3)
-    split_horizontal_image = config.getboolean('page',
-                                               'split_horizontal_image',
-                                               fallback=True)
+    config = bookconfig.LayoutConfig.from_file(config_file)
+    config.apply(sys.modules[__name__])
 
     print(f"配置信息：")
-    print(f"  - 页面尺寸: {page_size_name}")
+    print(f"  - 页面尺寸: {config.print_page_size}")
     print(f"  - 每个A5页面图片数: {CURRENT_A5_IMAGE_COUNT}")
     print(f"  - 边距: 左右={lr_padding}, 中心={center_padding}")
     print(f"  - 打印页码: {print_page_index}")
@@ -113,9 +66,12 @@ def split_landscape_to_portrait(image_path, output_prefix="split"):
     """
     try:
         # 创建临时目录
-        temp_dir = "temp_split_images"
+        temp_dir = os.path.join(temp_root, "temp_split_images")
         os.makedirs(temp_dir, exist_ok=True)
         with Image.open(image_path) as img:
+            if preview_mode:
+                # 打样预览只需要缩略图，JPEG 直接按小尺寸解码
+                img.draft('RGB', (img.width // 8, img.height // 8))
             # 确保图片是RGB模式，以便可以保存为PNG
             if img.mode in ('P', 'PA'):
                 # P模式(调色板)和PA模式(带alpha通道的调色板)需要特殊处理
@@ -136,13 +92,14 @@ def split_landscape_to_portrait(image_path, output_prefix="split"):
             left_box = (0, 0, mid_point, height)
             left_img = img.crop(left_box)
             # 生成唯一的临时文件名
-            base_name = os.path.splitext(os.path.basename(image_path))[0]
-            left_path = os.path.join(temp_dir, f"{base_name}_left_temp.png")
+            left_path = os.path.join(temp_dir, util.scratch_name(
+                image_path, "_left_temp.png", temp_root, preview_mode))
             left_img.save(left_path, 'PNG')
             # 右半部分
             right_box = (mid_point, 0, width, height)
             right_img = img.crop(right_box)
-            right_path = os.path.join(temp_dir, f"{base_name}_right_temp.png")
+            right_path = os.path.join(temp_dir, util.scratch_name(
+                image_path, "_right_temp.png", temp_root, preview_mode))
             right_img.save(right_path, 'PNG')
             if fold_mode == 1:
                 return left_path, right_path
@@ -177,9 +134,31 @@ PRE_NONE = 0
 start_index_offset = 0
 print_page_index = True
 need_A4_pages = 0
+image_catalog = None  # 图片目录（imagecatalog.ImageCatalog），多配置运行时由 multibook 预先创建
 color_mode = 0  # 0 灰度模式，1 彩色模式
+preview_mode = False  # 打样预览：低分辨率位图，输出 .png 缩略图总览或 .pdf
+raster_dpi = 0  # 位图输出分辨率（300/600），0 表示输出PDF
+raster_multipage = False  # 位图输出是否写成一个多页TIFF
+render_workers = None  # 位图输出的绘制进程数，None 表示全部CPU核心，1 表示在当前进程中绘制（不 fork）
+prefetch_mb = 0  # 预读图片占用的内存上限（MB），0 表示不预读（默认；图片在NAS或USB硬盘上时打开）
+prefetch_decode = False  # 预读时是否同时解码（非JPEG图片较多时有用）
+analyze_pages = False  # 拼版前分析重复页和空白页（只输出报告）
+drop_duplicates = False  # 删除重复页
+blank_mode = "keep"  # 空白页处理：keep 保留，drop 删除，pad 换成空白占位
+select_codec = False  # 按内容为非 JPEG 图片选择编码（照片转 JPEG，线稿转黑白/灰度，少色图片用调色板）
+max_output_mb = 0  # 输出文件大小上限（MB），0 表示不限制；超出时自动降低大图片的 JPEG 质量
+temp_root = ""  # 临时图片（横图分割、重新编码）的存放目录，"" 表示当前目录；命令行运行时为本次运行独有的临时目录
+resume = False  # 断点续做：长任务总是按批次保存到 <输出文件名>.resume/，中断后加 --resume 重新运行时跳过已完成的批次
+signature_sheets = 0  # 分帖输出：每帖的纸张数，0 表示输出一个完整的PDF；每帖写成 <文件名>-0001.pdf 等编号文件
+hook_command = None  # 每个输出文件完成后执行的命令（如 lp），{file} 换成文件路径
+auto_color = False  # 自动分色：黑白页按灰度嵌入，彩色纸和黑白纸分别输出 <文件名>-color/-mono
 image_margin = 3
 split_horizontal_image = True
+# 续做时需要保持不变的配置（变化后丢弃已完成的批次）
+CHECKPOINT_SETTINGS = ("CURRENT_A5_IMAGE_COUNT", "LINE_WIDTH", "lr_padding",
+                       "center_padding", "PRE_NONE", "start_index_offset",
+                       "print_page_index", "fold_mode", "landscape_page_mode",
+                       "image_margin", "color_mode", "auto_color")
 
 
 # 在页面中央绘制一条黑色虚线，分隔两个A5区域
@@ -209,54 +188,32 @@ def draw_center_divider_line(canvas_obj, page_width, page_height):
     canvas_obj.setDash()
 
 
-# 在适当的位置调用这个函数
-def generate_pdf_from_images(image_folder: str, output_pdf: str, pagesize=A4):
+def collect_image_files(image_folder):
     """
-    基于reportlab生成适合打印成册的PDF文件（4合一漫画模式）
-    :param image_folder: 存放图片的文件夹路径（必填）
-    :param output_pdf: 输出PDF文件的完整路径（必填）
-    :param pagesize: PDF页面尺寸，默认A4横向（297mm×210mm）
+    列出文件夹中的图片，按配置把横图分割为两张竖图
+    图片列表、尺寸和横图分割结果保存在图片目录中，多配置运行时所有配置共用
+    :param image_folder: 图片文件夹路径
+    :return: 图片路径列表（按页面顺序）
     """
-    # --------------- 第一步：参数校验 ---------------
-    # 检查图片文件夹是否存在
-    if not os.path.isdir(image_folder):
-        raise ValueError(f"错误：图片文件夹 '{image_folder}' 不存在或不是有效目录！")
-
-    # 检查输出PDF路径的父目录是否存在（不存在则创建）
-    output_dir = os.path.dirname(output_pdf)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir, exist_ok=True)
-        print(f"提示：已自动创建输出目录 '{output_dir}'")
-
-    # --------------- 第二步：筛选有效图片 ---------------
-    # 支持的图片格式（可根据需要扩展）
-    valid_image_ext = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp',
-                       '.webp')
-    # 遍历文件夹，筛选图片文件并按文件名排序
-    image_files = []
-    for filename in os.listdir(image_folder):
-        file_path = os.path.join(image_folder, filename)
-        # 跳过目录，只处理文件
-        if os.path.isfile(file_path) and filename.lower().endswith(
-                valid_image_ext):
-            image_files.append(file_path)
-
-    # 检查是否有有效图片
-    if not image_files:
-        raise RuntimeError(f"错误：文件夹 '{image_folder}' 中未找到任何有效图片！")
-    # 按文件名自然排序（保证图片顺序可控）
-    image_files.sort(key=lambda x: os.path.basename(x))
+    global image_catalog
+    if image_catalog is None or image_catalog.image_folder != image_folder:
+        image_catalog = imagecatalog.ImageCatalog(image_folder)
+    image_files = list(image_catalog.files)
 
     # 重新组织图片：
     # 如果是 A5_IMAGES_1 或者 A5_IMAGES_4 ，如果原始图片里面有横图，则将图片分割为2张竖图
     if CURRENT_A5_IMAGE_COUNT in [A5_IMAGES_1, A5_IMAGES_4
                                   ] and split_horizontal_image:
         print("检查并处理横图...")
+        # 并发读取文件头（图片在网络存储上时逐个读取很慢）
+        image_catalog.load_sizes(image_files)
         new_image_files = []
         for img_path in image_files:
-            if is_landscape_image(img_path):
-                # 如果是横图，分割为两张竖图
-                left_path, right_path = split_landscape_to_portrait(img_path)
+            if image_catalog.is_landscape(img_path):
+                # 如果是横图，分割为两张竖图（同一张图片只分割一次）
+                left_path, right_path = image_catalog.derived(
+                    ("split", img_path, fold_mode, preview_mode, temp_root),
+                    lambda: split_landscape_to_portrait(img_path))
                 if left_path and right_path:
                     # 添加分割后的两张图片
                     new_image_files.extend([left_path, right_path])
@@ -271,6 +228,40 @@ def generate_pdf_from_images(image_folder: str, output_pdf: str, pagesize=A4):
         # 更新image_files列表
         image_files = new_image_files
 
+    if analyze_pages or drop_duplicates or blank_mode != "keep":
+        # 拼版前找出重复页和空白页，按需要删除或换成空白占位
+        image_files = pageanalysis.screen_pages(image_files, image_catalog,
+                                                drop_duplicates, blank_mode)
+    if select_codec and not preview_mode and not raster_dpi:
+        # 按内容选择编码，PNG 等图片不再一律按 RGB 嵌入
+        image_files = codecselect.select_codecs(
+            image_files, image_catalog,
+            temp_dir=os.path.join(temp_root, codecselect.TEMP_DIR))
+    if max_output_mb > 0 and not preview_mode and not raster_dpi:
+        # 按输出大小上限重新压缩过大的图片
+        image_files = sizebudget.fit_images(
+            image_files, max_output_mb, image_catalog,
+            temp_dir=os.path.join(temp_root, sizebudget.TEMP_DIR))
+    return image_files
+
+
+# 在适当的位置调用这个函数
+def generate_pdf_from_images(image_folder: str, output_pdf: str, pagesize=A4):
+    """
+    基于reportlab生成适合打印成册的PDF文件（4合一漫画模式）
+    :param image_folder: 存放图片的文件夹路径（必填）
+    :param output_pdf: 输出PDF文件的完整路径（必填）
+    :param pagesize: PDF页面尺寸，默认A4横向（297mm×210mm）
+    """
+    # --------------- 第一步：参数校验 ---------------
+    # 检查输出PDF路径的父目录是否存在（不存在则创建）
+    output_dir = os.path.dirname(output_pdf)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        print(f"提示：已自动创建输出目录 '{output_dir}'")
+
+    # --------------- 第二步：筛选有效图片 ---------------
+    image_files = collect_image_files(image_folder)
     print(f"提示：共找到 {len(image_files)} 张有效图片（包含分割后的图片）")
 
     # 前面补None，方便后续处理
@@ -302,74 +293,197 @@ def generate_pdf_from_images(image_folder: str, output_pdf: str, pagesize=A4):
     # --------------- 第四步：初始化PDF画布（横向A4） ---------------
     if landscape_page_mode:
         pagesize = landscape(pagesize)
-        c = canvas.Canvas(output_pdf, pagesize=pagesize)
-    else:
-        c = canvas.Canvas(output_pdf, pagesize=pagesize)
     page_width, page_height = pagesize  # 获取页面尺寸（单位：点，1点=1/72英寸）
-
-    # A5区域尺寸（每个A5区域是A4页面的一半）
-    a5_width = page_width / 2
-    a5_height = page_height
+    color_images = set()
+    image_catalog.gray_images = set()
+    if auto_color:
+        color_images = find_color_images(image_files)
+    if raster_dpi:
+        # 位图输出：每一面直接合成为PNG/TIFF，不生成PDF
+        rastercanvas.render_sides(
+            functools.partial(draw_pdf_page, image_files=image_files,
+                              page_width=page_width, page_height=page_height),
+            total_pdf_pages_needed, pagesize, output_pdf, raster_dpi,
+            raster_multipage, render_workers)
+        return
+    plan = None
+    if prefetch_mb > 0 or auto_color:
+        # 空跑一遍得到每一面用到的图片（预读顺序和分色都要用）
+        image_catalog.load_sizes(image_files)
+        plan = image_catalog.plan_sides(
+            functools.partial(draw_pdf_page, image_files=image_files,
+                              page_width=page_width, page_height=page_height),
+            total_pdf_pages_needed)
+    # 每一面画到哪个输出文件：不分色时全部画到 output_pdf
+    side_outputs = [output_pdf] * total_pdf_pages_needed
+    if auto_color:
+        side_outputs = split_color_sheets(plan, color_images, output_pdf)
+    prefetcher = None
+    if prefetch_mb > 0:
+        # 按拼版顺序预读后面几面的图片，读盘和编码同时进行
+        prefetcher = image_catalog.start_prefetch(
+            plan, prefetch_mb, decode=prefetch_decode and not preview_mode,
+            passthrough_jpeg=not preview_mode)
+
+    def draw_side(c, pdf_page_index):
+        if prefetcher is not None:
+            prefetcher.advance(pdf_page_index)
+        draw_pdf_page(c, pdf_page_index, image_files, page_width, page_height)
+        print(
+            f"进度：第 {pdf_page_index+1} 页PDF → 已处理PDF页面 {pdf_page_index + 1}/{total_pdf_pages_needed}"
+        )
 
     # --------------- 第五步：处理每页PDF并添加到PDF ---------------
     # 迭代PDF页面而不是图片
-    for pdf_page_index in range(total_pdf_pages_needed):
-
-        if landscape_page_mode:  #水平画左右
-            draw_center_divider_line(c, page_width, page_height)
-            # 确定当前页面的A5区域位置
-            front_a5_x, front_a5_y = 0, 0
-            back_a5_x, back_a5_y = a5_width, 0
-            # left_a5, right_a5 = 0, 1
-
-            # 根据配置绘制图片
-            draw_images_in_a5_region(
-                canvas_obj=c,
-                image_files=image_files,
-                is_left=True,  # 正面A5区域索引
-                x_offset=front_a5_x,
-                y_offset=front_a5_y,
-                a5_width=a5_width,
-                a5_height=a5_height,
-                pdf_page_index=pdf_page_index)
-
-            draw_images_in_a5_region(
-                canvas_obj=c,
-                image_files=image_files,
-                is_left=False,  # 背面A5区域索引
-                x_offset=back_a5_x,
-                y_offset=back_a5_y,
-                a5_width=a5_width,
-                a5_height=a5_height,
-                pdf_page_index=pdf_page_index)
-            print(
-                f"进度：第 {pdf_page_index+1} 页PDF → 已处理PDF页面 {pdf_page_index + 1}/{total_pdf_pages_needed}"
-            )
+    written = None
+    try:
+        if signature_sheets > 0 and not preview_mode:
+            # 分帖输出：每帖写成一个编号的PDF，写完就可以开始打印
+            written = signatures.render_signatures(
+                draw_side, side_outputs, pagesize, signature_sheets, hook_command)
+        elif checkpoint.is_long(total_pdf_pages_needed) and not preview_mode:
+            # 长任务：按批次保存到工作目录，续做时跳过上次已完成的批次，最后合并
+            checkpoint.render_sides(
+                draw_side, side_outputs, pagesize,
+                checkpoint_state(image_files, side_outputs, pagesize),
+                checkpoint.work_dir_for(output_pdf), resume)
         else:
-            draw_2x2_in_single_page(canvas_obj=c,
-                                    image_files=image_files,
-                                    x_offset=0,
-                                    y_offset=0,
-                                    a5_width=page_width,
-                                    a5_height=page_height,
-                                    pdf_page_index=pdf_page_index)
-            print(
-                f"进度：第 {pdf_page_index+1} 页PDF → 已处理PDF页面 {pdf_page_index + 1}/{total_pdf_pages_needed}"
-            )
-        c.showPage()
-
-    # --------------- 第六步：保存PDF文件 ---------------
-    c.showPage()
-    c.save()
+            canvases = {path: rastercanvas.make_canvas(path, pagesize, preview_mode)
+                        for path in dict.fromkeys(side_outputs)}
+            for pdf_page_index in range(total_pdf_pages_needed):
+                c = canvases[side_outputs[pdf_page_index]]
+                draw_side(c, pdf_page_index)
+                c.showPage()
+            # --------------- 第六步：保存PDF文件 ---------------
+            for c in canvases.values():
+                c.showPage()
+                c.save()
+    finally:
+        image_catalog.stop_prefetch()
+    if max_output_mb > 0 and not preview_mode:
+        # 按实际大小检查输出预算（超出时报错退出，不执行钩子命令）
+        sizebudget.check_outputs(written or list(dict.fromkeys(side_outputs)),
+                                 max_output_mb)
+
     print(f"\n✅ PDF生成完成！")
-    print(f"📁 输出路径：{os.path.abspath(output_pdf)}")
-    print(f"📄 PDF页数：{total_pdf_pages_needed}")
+    if written is not None:
+        print(f"📁 分帖输出：{len(written)} 个文件，每帖 {signature_sheets} 张纸，按编号顺序打印")
+    else:
+        for path in dict.fromkeys(side_outputs):
+            print(f"📁 输出路径：{os.path.abspath(path)}")
+            print(f"📄 PDF页数：{side_outputs.count(path)}")
+        if hook_command:
+            hooks = signatures.HookRunner(hook_command)
+            for path in dict.fromkeys(side_outputs):
+                hooks.submit(path)
+            hooks.wait()
     print(f"📘 打印说明：")
     print(f"   1. 横向打印A4纸张")
     print(f"   2. 每页PDF包含{images_per_pdf_page}张图片")
     print(f"   3. 打印完成后对折装订成A5册子")
 
 
+def checkpoint_state(image_files, side_outputs, pagesize):
+    """
+    续做用的拼版状态：原图、拼版用的图片列表、配置和每一面的输出文件，有变化时不能接着上次的批次做
+    """
+    return {
+        "sources": checkpoint.file_signature(image_catalog.files),
+        "images": checkpoint.scratch_relative(image_files, temp_root),
+        "sides": side_outputs,
+        "pagesize": pagesize,
+        "settings": {name: globals()[name] for name in CHECKPOINT_SETTINGS},
+    }
+
+
+def find_color_images(image_files):
+    """
+    自动分色：按色度统计找出彩色页，其余页面按灰度嵌入
+    :param image_files: 图片路径列表（可以包含 None 占位）
+    :return: 彩色图片路径集合
+    """
+    flags = pageanalysis.find_color_pages(image_files, image_catalog)
+    color_images = {path for path, is_color in zip(image_files, flags)
+                    if path is not None and is_color}
+    image_catalog.gray_images = {path for path in image_files
+                                 if path is not None and path not in color_images}
+    print(f"🎨 自动分色：彩色页 {len(color_images)} 页，黑白页 {len(image_catalog.gray_images)} 页")
+    return color_images
+
+
+def split_color_sheets(plan, color_images, output_pdf):
+    """
+    按纸张分色：一张纸（正反两面）上有彩色页就整张放进彩色文件，否则放进黑白文件，
+    两个文件中的纸张都保持原来的顺序，彩色文件只需要用彩色打印机打印
+    :param plan: 每一面用到的图片（ImageCatalog.plan_sides 的结果）
+    :param color_images: 彩色图片路径集合
+    :param output_pdf: 输出路径，分别输出 <文件名>-color 和 <文件名>-mono
+    :return: 每一面对应的输出路径列表
+    """
+    stem, ext = os.path.splitext(output_pdf)
+    color_output, mono_output = f"{stem}-color{ext}", f"{stem}-mono{ext}"
+    side_outputs = []
+    color_sheets = 0
+    for sheet_start in range(0, len(plan), 2):
+        sides = plan[sheet_start:sheet_start + 2]
+        is_color = any(path in color_images for side in sides for path in side)
+        color_sheets += is_color
+        side_outputs.extend([color_output if is_color else mono_output] * len(sides))
+    print(f"🎨 彩色纸 {color_sheets} 张，黑白纸 {(len(plan) + 1) // 2 - color_sheets} 张")
+    return side_outputs
+
+
+def draw_pdf_page(canvas_obj, pdf_page_index, image_files, page_width,
+                  page_height):
+    """
+    绘制一页PDF（打印纸的一面），PDF输出和位图输出共用
+    :param canvas_obj: 画布对象（reportlab 画布或位图画布）
+    :param pdf_page_index: 当前PDF页面索引
+    :param image_files: 所有图片文件列表
+    :param page_width: 页面宽度
+    :param page_height: 页面高度
+    """
+    # A5区域尺寸（每个A5区域是A4页面的一半）
+    a5_width = page_width / 2
+    a5_height = page_height
+
+    if landscape_page_mode:  #水平画左右
+        draw_center_divider_line(canvas_obj, page_width, page_height)
+        # 确定当前页面的A5区域位置
+        front_a5_x, front_a5_y = 0, 0
+        back_a5_x, back_a5_y = a5_width, 0
+        # left_a5, right_a5 = 0, 1
+
+        # 根据配置绘制图片
+        draw_images_in_a5_region(
+            canvas_obj=canvas_obj,
+            image_files=image_files,
+            is_left=True,  # 正面A5区域索引
+            x_offset=front_a5_x,
+            y_offset=front_a5_y,
+            a5_width=a5_width,
+            a5_height=a5_height,
+            pdf_page_index=pdf_page_index)
+
+        draw_images_in_a5_region(
+            canvas_obj=canvas_obj,
+            image_files=image_files,
+            is_left=False,  # 背面A5区域索引
+            x_offset=back_a5_x,
+            y_offset=back_a5_y,
+            a5_width=a5_width,
+            a5_height=a5_height,
+            pdf_page_index=pdf_page_index)
+    else:
+        draw_2x2_in_single_page(canvas_obj=canvas_obj,
+                                image_files=image_files,
+                                x_offset=0,
+                                y_offset=0,
+                                a5_width=page_width,
+                                a5_height=page_height,
+                                pdf_page_index=pdf_page_index)
+
+
 def draw_2x2_in_single_page(canvas_obj, image_files, x_offset, y_offset,
                             a5_width, a5_height, pdf_page_index):
     """
@@ -422,8 +536,7 @@ def draw_2x2_in_single_page(canvas_obj, image_files, x_offset, y_offset,
     for i, (img_path, pos,
             page_num) in enumerate(zip(img_paths, positions, page_numbers)):
         if img_path and os.path.exists(img_path):
-            with Image.open(img_path) as img:
-                img_w, img_h = img.size
+            img_w, img_h = image_catalog.image_size(img_path)
 
             # 计算缩放比例（填满小区域）
             scale_w = small_width / img_w
@@ -435,7 +548,7 @@ def draw_2x2_in_single_page(canvas_obj, image_files, x_offset, y_offset,
 
             x = x_offset + pos[0] + (small_width - scaled_w) / 2
             y = y_offset + pos[1] + (small_height - scaled_h) / 2
-            canvas_obj.drawImage(img_path,
+            canvas_obj.drawImage(image_catalog.image_source(img_path, canvas_obj),
                                  x=x,
                                  y=y,
                                  width=scaled_w,
@@ -551,8 +664,7 @@ def draw_images_in_a5_region(canvas_obj, image_files, is_left, x_offset,
             image_files) else None
         page_number = img_index + 1
         if img_path and os.path.exists(img_path):
-            with Image.open(img_path) as img:
-                img_w, img_h = img.size
+            img_w, img_h = image_catalog.image_size(img_path)
             # 计算缩放比例（填满A5区域）
             scale_w = (a5_width - lr_padding - center_padding) / img_w
             scale_h = a5_height / img_h
@@ -569,7 +681,7 @@ def draw_images_in_a5_region(canvas_obj, image_files, is_left, x_offset,
 
             y = y_offset + (a5_height - scaled_h) / 2
 
-            canvas_obj.drawImage(img_path,
+            canvas_obj.drawImage(image_catalog.image_source(img_path, canvas_obj),
                                  x=x,
                                  y=y,
                                  width=scaled_w,
@@ -643,8 +755,7 @@ def draw_images_in_a5_region(canvas_obj, image_files, is_left, x_offset,
                 page_num) in enumerate(zip(img_paths, positions,
                                            page_numbers)):
             if img_path and os.path.exists(img_path):
-                with Image.open(img_path) as img:
-                    img_w, img_h = img.size
+                img_w, img_h = image_catalog.image_size(img_path)
 
                 # 计算缩放比例（填满小区域）
                 scale_w = small_width / img_w
@@ -658,7 +769,7 @@ def draw_images_in_a5_region(canvas_obj, image_files, is_left, x_offset,
                 x = x_offset + pos[0] + (small_width - scaled_w) / 2
                 y = y_offset + pos[1] + (small_height - scaled_h) / 2
 
-                canvas_obj.drawImage(img_path,
+                canvas_obj.drawImage(image_catalog.image_source(img_path, canvas_obj),
                                      x=x,
                                      y=y,
                                      width=scaled_w,
@@ -750,8 +861,7 @@ def draw_images_in_a5_region(canvas_obj, image_files, is_left, x_offset,
                 page_num) in enumerate(zip(img_paths, positions,
                                            page_numbers)):
             if img_path and os.path.exists(img_path):
-                with Image.open(img_path) as img:
-                    img_w, img_h = img.size
+                img_w, img_h = image_catalog.image_size(img_path)
 
                 # 计算缩放比例（填满小区域）
                 scale_w = small_width / img_w
@@ -762,7 +872,7 @@ def draw_images_in_a5_region(canvas_obj, image_files, is_left, x_offset,
                 x = x_offset + pos[0] + (small_width - scaled_w) / 2
                 y = y_offset + pos[1] + (small_height - scaled_h) / 2
 
-                canvas_obj.drawImage(img_path,
+                canvas_obj.drawImage(image_catalog.image_source(img_path, canvas_obj),
                                      x=x,
                                      y=y,
                                      width=scaled_w,
@@ -813,28 +923,67 @@ def draw_images_in_a5_region(canvas_obj, image_files, is_left, x_offset,
 # --------------- 命令行调用入口 ---------------
 if __name__ == "__main__":
     # 检查命令行参数数量
-    if len(sys.argv) < 4:
+    args = sys.argv[1:]
+    preview_mode = util.pop_flag(args, "--preview")
+    raster_dpi = int(util.pop_option(args, "--raster", 0))
+    raster_multipage = util.pop_flag(args, "--multipage")
+    prefetch_mb = int(util.pop_option(args, "--prefetch-mb", prefetch_mb))
+    prefetch_decode = util.pop_flag(args, "--prefetch-decode")
+    analyze_pages = util.pop_flag(args, "--analyze")
+    drop_duplicates = util.pop_flag(args, "--drop-duplicates")
+    blank_mode = util.pop_option(args, "--blanks", blank_mode)
+    auto_color = util.pop_flag(args, "--auto-color")
+    max_mb = util.pop_option(args, "--max-mb")
+    select_codec = util.pop_flag(args, "--select-codec")
+    resume = util.pop_flag(args, "--resume")
+    signature_sheets = int(util.pop_option(args, "--signatures", signature_sheets))
+    hook_command = util.pop_option(args, "--hook")
+    if len(args) < 3:
         print(
-            f"python {os.path.basename(__file__)} <图片文件夹路径> <输出PDF文件路径> <配置文件路径>"
+            f"python {os.path.basename(__file__)} <图片文件夹路径> <输出PDF文件路径> <配置文件路径> [颜色模式] [--preview] [--raster 300|600 [--multipage]] [--prefetch-mb 256] [--prefetch-decode] [--analyze] [--drop-duplicates] [--blanks keep|drop|pad] [--auto-color] [--max-mb 200] [--select-codec] [--resume] [--signatures 5] [--hook 命令]"
         )
         print("示例：")
         print(
             f"python {os.path.basename(__file__)} ./images ./output.pdf config.ini"
         )
+        print(
+            f"python {os.path.basename(__file__)} ./images ./proof.png config.ini --preview"
+        )
+        print(
+            f"python {os.path.basename(__file__)} ./images ./sheets.tif config.ini --raster 600 --multipage"
+        )
+        print("--preview 打样预览：低分辨率快速检查拼版和页序，输出 .png 缩略图总览或 .pdf 小文件")
+        print("--raster 位图输出：每一面纸直接合成为指定分辨率的 .png/.tif 文件（<文件名>-0001.png）")
+        print("--multipage 与 --raster 一起使用，所有面写进同一个多页TIFF")
+        print("--prefetch-mb 按拼版顺序预读图片的内存上限（MB，默认0 不预读；图片在NAS或USB硬盘上时可用 256）")
+        print("--prefetch-decode 预读时在线程池中同时解码图片")
+        print("--analyze 拼版前检查重复页和空白页，只输出报告")
+        print("--drop-duplicates 删除重复页（包括重新扫描的近似页）")
+        print("--blanks 空白页处理：keep 保留（默认），drop 删除，pad 留空位（不画图片和页码）")
+        print("--max-mb 输出文件大小上限（MB），超出时自动降低大图片的 JPEG 质量（也可在配置文件中设置 max_output_mb）")
+        print("--select-codec 按内容为 PNG 等图片选择编码：照片转 JPEG，线稿转黑白，灰度图转单通道，少色图片用调色板")
+        print("--auto-color 自动分色：黑白页按灰度嵌入，有彩色页的纸输出到 <文件名>-color.pdf，其余输出到 <文件名>-mono.pdf")
+        print(f"--resume 断点续做：超过 {checkpoint.BATCH_SHEETS} 张纸的任务每 {checkpoint.BATCH_SHEETS} 张纸保存一次到 <输出文件名>.resume/，中断后用同样的命令加 --resume 重新运行，从最后完成的批次继续")
+        print("--signatures 分帖输出：每N张纸写成一个编号的PDF（<文件名>-0001.pdf），写完一帖就可以开始打印")
+        print("--hook 每个输出文件完成后执行的命令，如 --hook \"lp -d office\"（文件路径加在末尾，或用 {file} 指定位置）")
         sys.exit(1)
 
     # 获取命令行参数
-    input_folder = sys.argv[1]
-    output_file = sys.argv[2]
-    config_file = sys.argv[3]
+    input_folder = args[0]
+    output_file = args[1]
+    config_file = args[2]
     # 加载配置
     config = load_config(config_file)
-    if len(sys.argv) == 5:
-        color_mode = int(sys.argv[4])
+    if max_mb is not None:
+        max_output_mb = float(max_mb)
+    if len(args) == 4:
+        color_mode = int(args[3])
     else:
         color_mode = 0
     try:
-        generate_pdf_from_images(input_folder, output_file, print_page_size)
+        # 中间文件放在本次运行独有的临时目录中，结束后自动删除
+        with util.scratch_dir("dankai-") as temp_root:
+            generate_pdf_from_images(input_folder, output_file, print_page_size)
     except Exception as e:
         print(f"\n❌ 生成失败：{str(e)}")
         sys.exit(1)
@@ -10,6 +10,15 @@ import os
 import sys
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import util
+import rastercanvas
+import signatures
+
+# 打样预览：低分辨率位图，输出 .png 缩略图总览或 .pdf
+preview_mode = False
+# 分帖输出：每一册（5张A4纸）写成一个编号的PDF（<文件名>-0001.pdf），写完一册就可以开始打印
+signature_mode = False
+# 每个输出文件完成后执行的命令（如 lp），{file} 换成文件路径
+hook_command = None
 
 def generate_pdf_from_images(image_folder: str, output_pdf: str, pagesize=A4):
     """
@@ -62,7 +71,10 @@ def generate_pdf_from_images(image_folder: str, output_pdf: str, pagesize=A4):
     # --------------- 第四步：初始化PDF画布（横向A4） ---------------
     from reportlab.lib.pagesizes import landscape
     landscape_pagesize = landscape(pagesize)  # 横向A4: 297mm x 210mm
-    c = canvas.Canvas(output_pdf, pagesize=landscape_pagesize)
+    hooks = signatures.HookRunner(hook_command)
+    written = []
+    if not signature_mode:
+        c = rastercanvas.make_canvas(output_pdf, landscape_pagesize, preview_mode)
     page_width, page_height = landscape_pagesize  # 获取页面尺寸（单位：点，1点=1/72英寸）
     
     # A5区域尺寸（每个A5区域是A4页面的一半）
@@ -80,7 +92,12 @@ def generate_pdf_from_images(image_folder: str, output_pdf: str, pagesize=A4):
         
         if a4_sheets_needed == 0:
             continue
-            
+        if signature_mode:
+            # 每一册单独一个文件
+            group_pdf = signatures.signature_path(output_pdf, group_index + 1)
+            c = rastercanvas.make_canvas(group_pdf, landscape_pagesize, preview_mode)
+            first_page = True
+
         # 获取A4纸的页面排列顺序
         page_sequence = util.genNumberSeqByA4Page(a4_sheets_needed)
         
@@ -145,10 +162,23 @@ def generate_pdf_from_images(image_folder: str, output_pdf: str, pagesize=A4):
                 
                 print(f"进度：第 {total_sheet_count} 页PDF → 已处理第 {group_index + 1} 组，A4纸 {sheet_index + 1}/{a4_sheets_needed}，页面 {page_in_sheet + 1}/2")
 
+        if signature_mode:
+            c.save()
+            print(f"📤 第 {group_index + 1} 册完成：{os.path.abspath(group_pdf)}")
+            written.append(group_pdf)
+            hooks.submit(group_pdf)
+
     # --------------- 第六步：保存PDF文件 ---------------
-    c.save()
+    if not signature_mode:
+        c.save()
+        written.append(output_pdf)
+        hooks.submit(output_pdf)
+    failed = hooks.wait()
     print(f"\n✅ PDF生成完成！")
-    print(f"📁 输出路径：{os.path.abspath(output_pdf)}")
+    for path in written:
+        print(f"📁 输出路径：{os.path.abspath(path)}")
+    if failed:
+        print(f"⚠️ {failed} 个文件的钩子命令失败")
     print(f"📄 PDF页数：{total_sheet_count}")
     print(f"📘 打印说明：")
     print(f"   1. 横向打印A4纸张")
@@ -197,16 +227,24 @@ def draw_single_image_on_a5(canvas_obj, img_path, x_offset, y_offset, a5_width,
 # --------------- 命令行调用入口 ---------------
 if __name__ == "__main__":
     # 检查命令行参数数量
-    if len(sys.argv) != 3:
+    args = sys.argv[1:]
+    preview_mode = util.pop_flag(args, "--preview")
+    signature_mode = util.pop_flag(args, "--signatures")
+    hook_command = util.pop_option(args, "--hook")
+    if len(args) != 2:
         print("❌ 参数错误！正确用法：")
-        print(f"python {os.path.basename(__file__)} <图片文件夹路径> <输出PDF文件路径>")
+        print(f"python {os.path.basename(__file__)} <图片文件夹路径> <输出PDF文件路径> [--preview] [--signatures] [--hook 命令]")
         print("示例：")
         print(f"python {os.path.basename(__file__)} ./images ./output.pdf")
+        print(f"python {os.path.basename(__file__)} ./images ./proof.png --preview")
+        print("--preview 打样预览：低分辨率快速检查拼版和页序，输出 .png 缩略图总览或 .pdf 小文件")
+        print("--signatures 分帖输出：每一册（5张A4纸）写成一个编号的PDF（<文件名>-0001.pdf），写完一册就可以开始打印")
+        print("--hook 每个输出文件完成后执行的命令，如 --hook \"lp -d office\"（文件路径加在末尾，或用 {file} 指定位置）")
         sys.exit(1)
     
     # 获取命令行参数
-    input_folder = sys.argv[1]
-    output_file = sys.argv[2]
+    input_folder = args[0]
+    output_file = args[1]
     
     # 执行PDF生成
     try:
@@ -5,117 +5,178 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 import os
 import zipfile
+import posixpath
 import sys
 import re
+from collections import OrderedDict, deque
+from itertools import takewhile
+from io import BytesIO
+from urllib.parse import unquote
+import xml.etree.ElementTree as ET
 
-import ebooklib
-from ebooklib import epub
 from bs4 import BeautifulSoup
 
 
-def check_is_title(str):
-    """
-    中文检测是否为标题
-    """
-    if not str or len(str.strip()) == 0:
-        return False
-    # 去除首尾空白
-    text = str.strip()
-    
-    # 检查是否只包含中文数字
-    chinese_numbers = set('零一二三四五六七八九十百千万亿○')
-    if all(c in chinese_numbers for c in text if c.strip()):
-        return True
-    
-    # 1. 检查字符串中是否含有空格（可能是标题）
-    has_space = ' ' in text or '　' in text  # 包括全角空格
-    
-    # 2. 检查是否以"第x章"、"第x节"、"第x卷"等开头
-    chapter_patterns = [
-        r'^第[一二三四五六七八九十零\d]+[章节卷篇回].*',  # 第x章、第x节、第x卷、第x篇、第x回
-        r'^[章节卷篇回][一二三四五六七八九十零\d]+.*',   # 章x、节x、卷x、篇x、回x
-    ]
-    
-    # 3. 检查是否以"卷x"等开头
-    volume_patterns = [
-        r'^卷[一二三四五六七八九十零\d].*',      # 卷x
-        r'^第[一二三四五六七八九十零\d]+部.*',   # 第x部
-        r'^[上下]卷.*',                         # 上卷、下卷
-        r'^[前后]篇.*',                         # 前篇、后篇
-    ]
-    
-    import re
-    
-    # 检查章节模式
-    for pattern in chapter_patterns:
-        if re.match(pattern, text):
-            return True
-    
-    # 检查卷数模式
-    for pattern in volume_patterns:
-        if re.match(pattern, text):
-            return True
-    
-    # 如果包含空格且长度适中（不太长也不太短），可能是标题
-    # if has_space and 3 <= len(text) <= 50:
-    #     return True
-    
-    # 检查是否全是标点符号
-    import string
-    # 中文标点符号
-    chinese_punctuation = '，。！？；：""''（）【】《》〈〉「」『』〈〉〔〕…—–'
-    all_punctuation = set(string.punctuation + chinese_punctuation)
-    
-    if all(c in all_punctuation or c.isspace() for c in text):
-        return False  # 全是标点符号不是标题
-    
-    # 如果文本较短（如少于10个字符）且看起来像标题（如只有一行），可能是标题
-    if len(text) <= 15 and '\n' not in text and '\r' not in text:
-        # 检查是否包含一些标题关键词
-        title_keywords = ['序', '引言', '前言', '后记', '目录', '简介', '概要', '总结', '结论']
-        if any(keyword in text for keyword in title_keywords):
-            return True
-    
-    return False
-
-def epub_html_iter(epub_path):
-    """
-    按文档顺序返回 HTML 迭代器
-    """
-    book = epub.read_epub(epub_path)
-    for item_id, _ in book.spine:
-        item = book.get_item_with_id(item_id)
-        if item.get_type() == ebooklib.ITEM_DOCUMENT:
-            content = item.get_content()
-            soup = BeautifulSoup(content, "html.parser")
-            yield soup.prettify()  # 返回格式化的 HTML 字符串
-
-
-# 尝试导入 PyPDF2 用于合并 PDF
-try:
-    from PyPDF2 import PdfReader, PdfWriter
-except ImportError:
-    try:
-        from pypdf import PdfReader, PdfWriter
-    except ImportError:
-        print("错误：需要安装 PyPDF2 或 pypdf 库来合并PDF文件")
-        print("请运行: pip install PyPDF2 或 pip install pypdf")
-        sys.exit(1)
+class EpubArchive:
+    """
+    直接从EPUB压缩包中按需读取内容，不解压到磁盘
+    图片按OPF清单解析路径，读取时返回内存中的ImageReader；
+    最近读取的图片数据（压缩的原始数据）按大小上限缓存，重复出现的图片（分隔线、花饰等）不用每次重新解压
+    """
+
+    DOCUMENT_TYPES = ('application/xhtml+xml', 'text/html')
+    # 图片数据缓存的上限（字节），超过时淘汰最久未用的图片
+    IMAGE_CACHE_BYTES = 16 * 1024 * 1024
+
+    def __init__(self, epub_path):
+        self.epub_path = epub_path
+        self.zip = zipfile.ZipFile(epub_path, 'r')
+        self.opf_path = self._find_opf_path()
+        self.manifest = {}  # id -> 压缩包内路径
+        self.media_types = {}  # 压缩包内路径 -> media-type
+        self.spine = []  # 按阅读顺序排列的压缩包内路径
+        self._parse_opf()
+        self._image_cache = OrderedDict()  # 压缩包内路径 -> 图片数据
+        self._image_cache_bytes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.zip.close()
+
+    def _find_opf_path(self):
+        """
+        从 META-INF/container.xml 中找到 OPF 文件路径
+        """
+        try:
+            root = ET.fromstring(self.zip.read('META-INF/container.xml'))
+            for element in root.iter():
+                if element.tag.endswith('rootfile') and element.get('full-path'):
+                    return element.get('full-path')
+        except KeyError:
+            pass
+        # 没有 container.xml 时，退回到查找压缩包中的第一个 .opf 文件
+        for name in self.zip.namelist():
+            if name.lower().endswith('.opf'):
+                return name
+        raise ValueError(f"错误：EPUB文件 '{self.epub_path}' 中未找到OPF清单！")
+
+    def _parse_opf(self):
+        """
+        解析OPF清单（manifest）和阅读顺序（spine）
+        """
+        opf_dir = posixpath.dirname(self.opf_path)
+        root = ET.fromstring(self.zip.read(self.opf_path))
+        for element in root.iter():
+            if element.tag.endswith('}item') or element.tag == 'item':
+                href = element.get('href')
+                if not href:
+                    continue
+                path = posixpath.normpath(posixpath.join(opf_dir, unquote(href)))
+                self.manifest[element.get('id')] = path
+                self.media_types[path] = element.get('media-type', '')
+        for element in root.iter():
+            if element.tag.endswith('}itemref') or element.tag == 'itemref':
+                path = self.manifest.get(element.get('idref'))
+                if path and self.media_types.get(path) in self.DOCUMENT_TYPES:
+                    self.spine.append(path)
+
+    def resolve(self, href, base_path):
+        """
+        将文档中的相对引用解析为压缩包内路径
+        :param href: 文档中的引用（src 或 xlink:href）
+        :param base_path: 引用所在文档的压缩包内路径
+        :return: 压缩包内路径，找不到时返回 None
+        """
+        if not href:
+            return None
+        href = unquote(href.split('#')[0])
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(base_path), href))
+        if path in self.media_types:
+            return path
+        # 清单中未登记的文件，只要压缩包里有也可以使用
+        try:
+            self.zip.getinfo(path)
+            return path
+        except KeyError:
+            return None
+
+    def spine_documents(self, start=0, end=None):
+        """
+        按阅读顺序返回 (文档路径, 文档内容) 迭代器
+        """
+        for path in self.spine[start:end]:
+            yield path, self.zip.read(path)
+
+    def open_image(self, path):
+        """
+        按需从压缩包中读取图片
+        :param path: 图片的压缩包内路径（由 resolve 得到）
+        :return: ImageReader 对象，找不到时返回 None
+        """
+        from reportlab.lib.utils import ImageReader
+
+        if not path:
+            return None
+        data = self._image_cache.get(path)
+        if data is not None:
+            self._image_cache.move_to_end(path)
+        else:
+            # 解析不到的图片保留原始 href，压缩包里没有时由调用方绘制占位文字
+            try:
+                data = self.zip.read(path)
+            except KeyError:
+                return None
+            if len(data) <= self.IMAGE_CACHE_BYTES:
+                while self._image_cache_bytes + len(data) > self.IMAGE_CACHE_BYTES:
+                    _, old = self._image_cache.popitem(last=False)
+                    self._image_cache_bytes -= len(old)
+                self._image_cache[path] = data
+                self._image_cache_bytes += len(data)
+        # 每次返回新的 ImageReader（解码后的像素不随缓存常驻内存），reportlab 按内容合并重复的图片
+        return ImageReader(BytesIO(data))
+
+
+def epub_html_iter(archive, start=0, end=None):
+    """
+    按文档顺序返回 (文档路径, HTML) 迭代器
+    :param start: 起始文档序号（从0开始），之前的文档不会被读取
+    :param end: 结束文档序号（不包含），None 表示到最后
+    """
+    for doc_path, content in archive.spine_documents(start, end):
+        soup = BeautifulSoup(content, "html.parser")
+        yield doc_path, soup.prettify()  # 返回格式化的 HTML 字符串
+
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import util
+import textlayout
+import txtsource
+import chapterindex
+import impose
+import fontchain
+import rastercanvas
+import checkpoint
 
 # ==================== 配置常量 ====================
-# 页面配置
-PAGE_LAYOUT = "A4_VERTICAL_4_A6"  # A4竖版，每页4个A6区域
-A6_REGIONS_PER_PAGE = 4  # 每页4个A6区域（2x2布局）
+# 页面配置：先把每个A6页面单独排好（逻辑页面），再拼版到打印纸上
+# a6x4：A4竖版每面4个A6；a5x2：A4横版每面2个A5骑马钉；single：每个A6单独一页
+PAGE_LAYOUT = "a6x4"
+# 打样预览：逻辑页面画成低分辨率位图（文字画成灰条，图片按缩略图尺寸解码）
+PREVIEW = False
 
 # 注册字体
 FONT_NAME = "FangSong"
 FONT_PATH = os.path.dirname(os.path.abspath(__file__)) + "/FZXSS-Lusitana-Hybrid.ttf"
 
-# 检查字体文件是否存在
-if os.path.exists(FONT_PATH):
+# 检查字体文件是否存在（字体注册在进程内共用，booklet 为每个任务重新加载本模块时不再重复解析字体）
+if FONT_NAME in pdfmetrics.getRegisteredFontNames():
+    DEFAULT_FONT = FONT_NAME
+elif os.path.exists(FONT_PATH):
     pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
     DEFAULT_FONT = FONT_NAME
 else:
@@ -134,34 +195,126 @@ title_size = TEXT_FONT_SIZE + 3
 PAGE_NUMBER_FONT_SIZE = 8
 TEXT_LINE_SPACE = 4
 MARGIN = 10  # 区域内边距
-render_order = [(0, 0), (1, 1), (1, 0), (0, 1), (0, 2), (1, 3), (1, 2), (0, 3)]
-# 初始化两个PDF画布（A4竖版）
-front_c = canvas.Canvas("front.pdf", pagesize=A4)
-back_c = canvas.Canvas("back.pdf", pagesize=A4)
+# 逻辑页面画布（每页一个A6页面），由 start_pages 创建；分批保存时已完成的批次为 None
+pages_c = None
+pages_index = 0
+region_text = util.RegionText()
+# 逻辑页面分批保存到 <逻辑页面PDF>.resume/，每批的逻辑页面数
+# （每批单独嵌入字体子集，批次太小时合并后的文件会变大）
+RESUME_BATCH_PAGES = 128
+# 续做：复用上次中断留下的批次（--resume），不复用时从头绘制
+resume = False
+pages_pdf_path = None
+pages_journal = None
+
+
+def start_pages(pages_pdf, state=None):
+    """
+    创建逻辑页面画布
+    :param pages_pdf: 逻辑页面PDF路径
+    :param state: 排版状态（见 checkpoint.Journal），不为 None 时逻辑页面分批保存，
+                  续做时排好的章节照常回放，已完成批次中的页面不再绘制
+    """
+    global pages_c, pages_index, pages_pdf_path, pages_journal
+    pages_index = 0
+    pages_pdf_path = pages_pdf
+    pages_journal = None
+    if PREVIEW:
+        # 预览时逻辑页面只保留在内存中，由 impose.impose_images 拼版
+        pages_c = rastercanvas.RasterCanvas(None, pagesize=(A6_WIDTH, A6_HEIGHT))
+    elif state is None:
+        pages_c = canvas.Canvas(pages_pdf, pagesize=(A6_WIDTH, A6_HEIGHT))
+    else:
+        pages_journal = checkpoint.Journal(checkpoint.work_dir_for(pages_pdf),
+                                           state, resume)
+        if pages_journal.batches:
+            print(f"⏩ 续做：跳过已完成的 {len(pages_journal.batches)} 批逻辑页面"
+                  f"（每批 {RESUME_BATCH_PAGES} 页）")
+        pages_c = batch_canvas(0)
+
+
+def batch_canvas(batch):
+    """
+    分批保存时一批逻辑页面的画布，已完成的批次返回 None
+    """
+    if batch in pages_journal.batches:
+        return None
+    return canvas.Canvas(pages_journal.part_path(batch, pages_pdf_path),
+                         pagesize=(A6_WIDTH, A6_HEIGHT))
+
+
+def end_batch(batch):
+    """
+    保存一批逻辑页面并记入日志
+    """
+    if pages_c is not None:
+        pages_c.save()
+        pages_journal.mark_done(batch, {
+            pages_pdf_path: pages_journal.part_path(batch, pages_pdf_path)})
+
+
+def page_done(a6_index):
+    """
+    A6区域所在的批次是否已经在上次运行中完成（续做时不再绘制）
+    """
+    return (pages_journal is not None and
+            a6_index // RESUME_BATCH_PAGES in pages_journal.batches)
+
+
+def a6_page(a6_index):
+    """
+    切换到指定A6区域对应的逻辑页面（逻辑页面只会向后翻，分批保存时跨过批次边界就保存上一批）
+    :return: 逻辑页面画布
+    """
+    global pages_c, pages_index
+    while pages_index < a6_index:
+        region_text.flush()
+        if pages_c is not None:
+            pages_c.showPage()
+        pages_index += 1
+        if pages_journal is not None and pages_index % RESUME_BATCH_PAGES == 0:
+            end_batch(pages_index // RESUME_BATCH_PAGES - 1)
+            pages_c = batch_canvas(pages_index // RESUME_BATCH_PAGES)
+    return pages_c
+
+
+def finish_pages(a6_index, outlines=()):
+    """
+    绘制最后一个A6区域的页码并保存逻辑页面PDF；分批保存时合并各批并添加书签（工作目录由 close_pages 删除）
+    :param outlines: 书签列表，见 render_chapters
+    """
+    if print_page_number and not page_done(a6_index):
+        draw_page_number(a6_index)
+    region_text.flush()
+    if pages_journal is None:
+        pages_c.save()
+        return
+    a6_page(a6_index)
+    end_batch(pages_index // RESUME_BATCH_PAGES)
+    pages_journal.write_merged(
+        pages_pdf_path, finish=lambda writer: impose.add_outlines(
+            writer, outlines, range(len(writer.pages))))
 
 
-def new_page():
+def close_pages():
     """
-    新建一页A4，返回新的游标位置
+    拼版完成后删除逻辑页面的续做工作目录
     """
-    front_c.showPage()
-    back_c.showPage()
-    #  绘制虚线 将a4分割成2x2 的 a6 区域
-    front_c.setDash(5, 3)
-    front_c.setStrokeColorRGB(0, 0, 0)
-    front_c.setLineWidth(1)
-    front_c.line(PAGE_WIDTH / 2, 0, PAGE_WIDTH / 2, PAGE_HEIGHT)
-    front_c.line(0, PAGE_HEIGHT / 2, PAGE_WIDTH, PAGE_HEIGHT / 2)
+    if pages_journal is not None:
+        pages_journal.close()
+
 
-    # 重置线条样式为实线
-    front_c.setDash()
-    back_c.setDash(5, 3)
-    back_c.setStrokeColorRGB(0, 0, 0)
-    back_c.setLineWidth(1)
-    back_c.line(PAGE_WIDTH / 2, 0, PAGE_WIDTH / 2, PAGE_HEIGHT)
-    back_c.line(0, PAGE_HEIGHT / 2, PAGE_WIDTH, PAGE_HEIGHT / 2)
-    # 重置线条样式为实线
-    back_c.setDash()
+def pages_state(source_path, chapter_range, typography):
+    """
+    逻辑页面分批保存用的排版状态：源文件、章节范围和排版参数，有变化时不能接着上次的批次做
+    """
+    return {
+        "source": checkpoint.file_signature([source_path]),
+        "chapters": chapter_range,
+        "typography": typography,
+        "print_page_number": print_page_number,
+        "batch_pages": RESUME_BATCH_PAGES,
+    }
 
 
 page_lr_margin = 16  # A4页面左右边距
@@ -170,208 +323,78 @@ a6_lr_margin = 10
 a6_tb_margin = 22
 print_page_number = True
 skip_cover = True
-
-# A6区域位置定义
-page_positions = [
-    [  # 第1页
-        (0, A6_HEIGHT),  # 物理位置：左上 (索引0)
-        (A6_WIDTH, A6_HEIGHT),  # 物理位置：右上 (索引1)
-        (0, 0),  # 物理位置：左下 (索引2)
-        (A6_WIDTH, 0)  # 物理位置：右下 (索引3)
-    ],
-    [  # 第2页
-        (0, A6_HEIGHT),  # 物理位置：左上 (索引0)
-        (A6_WIDTH, A6_HEIGHT),  # 物理位置：右上 (索引1)
-        (0, 0),  # 物理位置：左下 (索引2)
-        (A6_WIDTH, 0)  # 物理位置：右下 (索引3)
-    ]
-]
-
+# 章节排版缓存目录：调整字号、行距、边距或修改个别章节后重新生成时，未变化的章节直接回放
+use_layout_cache = True
+LAYOUT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "pdfbook",
+                                "layout")
+# TXT文件编码，None 表示自动探测（支持 UTF-8 / GBK / GB18030 / Big5）
+TXT_ENCODING = None
+# 章节排版进程数，None 表示使用全部CPU核心，1 表示不使用进程池
+layout_workers = None
+# 后备字体文件列表：主字体缺字（生僻字、emoji、全角符号）时按顺序使用
+FALLBACK_FONTS = []
 
 def draw_page_number(a6_index):
     """
-    在指定的PDF画布上绘制页码
-    :param page_index: 页码（从1开始）
-    :param canvas_obj: ReportLab PDF画布对象（front_c 或 back_c）
+    在A6区域对应的逻辑页面上绘制页码
+    :param a6_index: A6区域索引（从0开始）
     """
-    page_idx, pos_idx = render_order[a6_index % 8]
-
-    # 选择当前应该渲染的画布（正面或背面）
-    if page_idx == 0:  # 正面页
-        canvas_obj = front_c
-        print("  绘制正面页")
-    else:  # 背面页
-        canvas_obj = back_c
-        print("  绘制背面页")
-
-    # 获取当前A6区域的物理位置
-    x_offset, y_offset = page_positions[page_idx][pos_idx]
+    canvas_obj = a6_page(a6_index)
+    x_offset, y_offset = 0, 0
 
     tt_x = x_offset + A6_WIDTH - page_center_margin - a6_lr_margin - 10 if a6_index % 2 == 0 else x_offset + a6_lr_margin + page_center_margin
     tt_y = y_offset + 18
-    # 设置字体
-    canvas_obj.setFont(DEFAULT_FONT, PAGE_NUMBER_FONT_SIZE)
-    canvas_obj.drawString(
-        tt_x,  # 页码位置（A4页面右上角）
-        tt_y,  # 页码位置（A4页面顶部20mm）
-        f"{a6_index + 1}")
-
-
-def draw_text_in_a6_region_with_cursor(
-    a6_index,
-    text,
-    start_cursor,
-    cursor_x,
-    cursor_y,
-    font_size=TEXT_FONT_SIZE,
-    font_name=DEFAULT_FONT,
-    align="left",
-):
-    """
-    在指定的A6区域内绘制文本，使用游标模式
+    # 页码和正文写在同一个文本对象中
+    region_text.line(canvas_obj, a6_index,
+                     tt_x,  # 页码位置（A4页面右上角）
+                     tt_y,  # 页码位置（A4页面顶部20mm）
+                     f"{a6_index + 1}", DEFAULT_FONT, PAGE_NUMBER_FONT_SIZE)
+
+
+def draw_line_in_a6_region(a6_index, text_y, text, text_width, font_size,
+                           font_name=DEFAULT_FONT, align="left", runs=None):
+    """
+    在指定的A6区域内绘制一行已经排好的文本
     :param a6_index: A6区域索引
-    :param text: 完整文本内容
-    :param start_cursor: 开始位置游标
-    :param cursor_x: 当前绘制的x坐标
-    :param cursor_y: 当前绘制的y坐标
+    :param text_y: 文本基线的y坐标（相对A6区域底部）
+    :param text: 行文本
+    :param text_width: 行宽度
     :param font_size: 字体大小
     :param font_name: 字体名称
     :param align: 对齐方式 ("left", "center", "right")
-    :return: (finished, text_cursor, next_x, next_y) - 是否完成、文本游标位置、下次绘制的x和y坐标
-    """
-    # 获取当前要渲染的A6区域位置
-    print(f"处理A6区域 {a6_index}")
-    page_idx, pos_idx = render_order[a6_index % 8]
-
-    # 选择当前应该渲染的画布（正面或背面）
-    if page_idx == 0:  # 正面页
-        canvas_obj = front_c
-        print("  绘制正面页")
-    else:  # 背面页
-        canvas_obj = back_c
-        print("  绘制背面页")
-
-    # 获取当前A6区域的物理位置
-    x_offset, y_offset = page_positions[page_idx][pos_idx]
-
-    # 设置字体
-    canvas_obj.setFont(font_name, font_size)
-    # 文本边距
-    margin = MARGIN
+    :param runs: 字体片段 [(字体名称, 片段文本), ...]，行内用到后备字体时才有
+    """
+    canvas_obj = a6_page(a6_index)
+    x_offset, y_offset = 0, 0
     available_width = A6_WIDTH - 2 * a6_lr_margin - page_lr_margin - page_center_margin
 
-    # 绘制文本行的高度
-    line_height = font_size + TEXT_LINE_SPACE
-    current_cursor = start_cursor
-    print(f"从位置 {start_cursor} 开始绘制")
-    # 从指定的光标位置开始绘制
-    text_y = cursor_y + y_offset if cursor_y is not None else y_offset + A6_HEIGHT - a6_tb_margin - TEXT_LINE_SPACE
-
-    if a6_index % 2 == 0:
-        text_x = cursor_x + x_offset if cursor_x is not None else x_offset + page_lr_margin + a6_lr_margin
+    # 根据对齐方式计算x坐标
+    if align == "center":
+        line_x = x_offset + (available_width - text_width) / 2
+    elif align == "right":
+        line_x = x_offset + A6_WIDTH - text_width - MARGIN
+    elif a6_index % 2 == 0:  # left
+        line_x = x_offset + page_lr_margin + a6_lr_margin
     else:
-        text_x = cursor_x + x_offset if cursor_x is not None else x_offset + page_center_margin + a6_lr_margin
-    print(f"当前绘制位置：{text_x}, {text_y}")
-    print(f"当前光标位置：{current_cursor}")
-    print("  开始绘制文本:", text)
-    print(f"a6_index: {a6_index}     available_width: {available_width}")
-    # 逐行处理文本直到区域用完或文本处理完毕
-    while current_cursor < len(text):
-        # 检查当前行是否还有足够的垂直空间
-        if (text_y - line_height) < (y_offset + a6_tb_margin):
-            # 没有足够空间绘制下一行，返回未完成状态
-            return False, current_cursor, text_x, text_y
-        # 找到当前行的文本
-        line_start = current_cursor
-        line_end = line_start
-        # 计算当前行的可用宽度
-        current_line_available_width = available_width + 8
-
-        # 寻找合适的换行点
-        while line_end < len(text):
-            # 检查是否遇到换行符
-            if text[line_end] == '\n':
-                line_end += 1  # 包含换行符
-                break
-            # 检查当前行的宽度
-            test_line = text[line_start:line_end + 1]
-            line_width = canvas_obj.stringWidth(test_line, font_name,
-                                                font_size)
-            # 如果当前行宽度超过可用宽度，回退到上一个合适的断点
-            if line_width > current_line_available_width:
-                if line_end == line_start:
-                    break
-                else:
-                    line_end -= 1
-                    break
-            else:
-                line_end += 1
-
-        # 获取当前行文本
-        current_line = text[line_start:line_end].rstrip('\n')
-        # 检查是否遇到段落分隔符
-        if '\n' in current_line and current_line.endswith('\n'):
-            # 如果当前行以换行符结尾，处理段落分隔
-            paragraph_pos = current_line.rindex('\n')
-            current_line = current_line[:paragraph_pos]
-            # 修正游标位置
-            actual_end = line_start + paragraph_pos + 1  # 加上换行符
-        else:
-            actual_end = line_end
-
-        if current_line:
-            text_width = canvas_obj.stringWidth(current_line, font_name,
-                                                font_size)
-
-            # 根据对齐方式计算x坐标
-            if align == "center":
-                line_x = x_offset + (available_width - text_width) / 2
-            elif align == "right":
-                line_x = x_offset + A6_WIDTH - text_width - margin
-            else:  # left
-                line_x = text_x
-
-            canvas_obj.drawString(line_x, text_y - font_size, current_line)
-            print(f"绘制行：{current_line}")
-
-        # 更新y坐标
-        if font_size > TEXT_FONT_SIZE:
-            text_y -= line_height + 3
-        else:
-            text_y -= line_height
-        # 更新游标
-        current_cursor = actual_end
-        # 检查是否已经处理完整个文本
-        if current_cursor >= len(text):
-            return True, 0, None, text_y - y_offset
-    # 如果循环结束但文本未处理完，说明A6区域已满
-    return False, current_cursor, None, None
+        line_x = x_offset + page_center_margin + a6_lr_margin
 
+    region_text.line(canvas_obj, a6_index, line_x, y_offset + text_y, text,
+                     font_name, font_size, runs)
 
-def draw_image_in_a6_region(a6_index, image_file):
+
+def draw_image_in_a6_region(a6_index, image, image_name):
     """
     绘制图片到A6区域
     :param a6_index: A6区域索引
-    :param image_file: 图片文件路径或URL
+    :param image: ImageReader 对象（从EPUB压缩包中按需读取），为 None 时绘制占位符
+    :param image_name: 图片名称，用于日志和占位符
     :return: None
     """
-    import os
-    from reportlab.lib.utils import ImageReader
-    from PIL import Image as PILImage
-
-    print(f"处理A6区域 {a6_index}，图片文件: {image_file}")
-    page_idx, pos_idx = render_order[a6_index % 8]
-
-    # 选择当前应该渲染的画布（正面或背面）
-    if page_idx == 0:  # 正面页
-        canvas_obj = front_c
-        print("  绘制正面页")
-    else:  # 背面页
-        canvas_obj = back_c
-        print("  绘制背面页")
-
-    # 获取当前A6区域的物理位置
-    x_offset, y_offset = page_positions[page_idx][pos_idx]
+    print(f"处理A6区域 {a6_index}，图片文件: {image_name}")
+    # 先输出已经排好的文字，保持原有的绘制顺序
+    region_text.flush()
+    canvas_obj = a6_page(a6_index)
+    x_offset, y_offset = 0, 0
 
     # 图片边距
     img_margin = MARGIN
@@ -380,31 +403,19 @@ def draw_image_in_a6_region(a6_index, image_file):
     available_width = A6_WIDTH - 2 * img_margin
     available_height = A6_HEIGHT - 2 * img_margin
 
-    # 获取图片路径（相对于EPUB的images目录）
-    epub_dir = os.path.dirname(sys.argv[1]) if len(sys.argv) > 1 else "."
-    full_image_path = os.path.join(
-        epub_dir, "images",
-        image_file) if "images/" in image_file else os.path.join(
-            epub_dir, image_file)
-
-    # 如果图片文件不存在，尝试从EPUB内容中查找
-    if not os.path.exists(full_image_path):
-        # 尝试在当前工作目录下查找
-        full_image_path = os.path.join(os.getcwd(), image_file)
-
-    if not os.path.exists(full_image_path):
-        # 如果仍然找不到，跳过绘制
-        print(f"  警告：图片文件不存在: {full_image_path}")
+    if image is None:
+        # 如果找不到图片，跳过绘制
+        print(f"  警告：EPUB中不存在图片: {image_name}")
         # 绘制一个占位符
-        placeholder_text = "[图片: " + image_file + "]"
+        placeholder_text = "[图片: " + image_name + "]"
+        canvas_obj.setFont(DEFAULT_FONT, TEXT_FONT_SIZE)
         canvas_obj.drawString(x_offset + img_margin, y_offset + A6_HEIGHT / 2,
                               placeholder_text)
         return
 
     try:
-        # 使用PIL获取图片尺寸
-        with PILImage.open(full_image_path) as img:
-            img_width, img_height = img.size
+        # 获取图片尺寸（只读取图片头信息）
+        img_width, img_height = image.getSize()
 
         # 计算缩放比例以适应A6区域
         scale_w = available_width / img_width
@@ -417,7 +428,7 @@ def draw_image_in_a6_region(a6_index, image_file):
         centered_x = x_offset + img_margin + (available_width - scaled_w) / 2
         centered_y = y_offset + img_margin + (available_height - scaled_h) / 2
         # 绘制图片
-        canvas_obj.drawImage(full_image_path,
+        canvas_obj.drawImage(image,
                              x=centered_x,
                              y=centered_y,
                              width=scaled_w,
@@ -426,39 +437,27 @@ def draw_image_in_a6_region(a6_index, image_file):
                              mask='auto')  # auto表示使用图片的透明度信息
 
         print(
-            f"  成功绘制图片: {image_file} (原始尺寸: {img_width}x{img_height}, 绘制尺寸: {scaled_w}x{scaled_h})"
+            f"  成功绘制图片: {image_name} (原始尺寸: {img_width}x{img_height}, 绘制尺寸: {scaled_w}x{scaled_h})"
         )
 
     except Exception as e:
-        print(f"  错误：无法绘制图片 {image_file}: {str(e)}")
+        print(f"  错误：无法绘制图片 {image_name}: {str(e)}")
         # 绘制一个占位符
-        placeholder_text = "[图片: " + image_file + " - 加载失败]"
+        placeholder_text = "[图片: " + image_name + " - 加载失败]"
         canvas_obj.drawString(x_offset + img_margin, y_offset + A6_HEIGHT / 2,
                               placeholder_text)
 
 
-def draw_html_in_a6_region(a6_index,
-                           html_content,
-                           cursor_x=None,
-                           cursor_y=None,
-                           font_size=TEXT_FONT_SIZE,
-                           font_name=DEFAULT_FONT):
+def html_to_paragraphs(html_content, archive=None, doc_path=""):
     """
-    draw_html_in_a6_region 的 Docstring
-    
-    :param a6_index: A6区域索引
+    将HTML内容按文档顺序拆分为段落列表
     :param html_content: HTML内容
-    :param cursor_x: 当前绘制的x坐标
-    :param cursor_y: 当前绘制的y坐标
-    :param font_size: 字体大小
-    :param font_name: 字体名称
-    :return: (a6_index, next_x, next_y) - 返回A6索引和下次绘制的位置
+    :param archive: EpubArchive 对象，用于解析图片路径
+    :param doc_path: 当前HTML文档在EPUB压缩包内的路径，用于解析图片相对路径
+    :return: [(类型, 内容), ...]，类型为 "p"、"h" 或 "img"
     """
     # 解析HTML内容
     soup = BeautifulSoup(html_content, 'html.parser')
-    margin = MARGIN
-
-    # 获取当前要渲染的A6区域位置
 
     # 使用深度优先遍历，按顺序提取所有元素
     def extract_elements_in_order(tag):
@@ -487,280 +486,422 @@ def draw_html_in_a6_region(a6_index,
         elif hasattr(child, 'strip') and child.strip():  # 是文本节点
             all_elements.append(str(child).strip())
     # 处理提取出的元素，保持文档顺序
+    paragraphs = []
     for element in all_elements:
-        print(element)
         if isinstance(element, str):
             pass
         elif element.name == "p":
             if len(element.text.strip()) == 0:
                 continue
-            if check_is_title(element.text.strip()):
-                text_content = element.text.strip()
-            else:
-                text_content = "      " + element.text.strip()
-            is_complete = False
-            text_cursor = 0
-            print(f"准备处理处理 text_content {text_content}")
-            print(f"页面:{a6_index} 绘制位置:{cursor_x}, {cursor_y}")
-            while not is_complete:
-                if check_is_title(text_content):
-                    is_complete, text_cursor, cursor_x, cursor_y = draw_text_in_a6_region_with_cursor(
-                        a6_index, text_content, text_cursor, cursor_x,
-                        cursor_y, title_size, font_name, "center")
-                else:
-                    is_complete, text_cursor, cursor_x, cursor_y = draw_text_in_a6_region_with_cursor(
-                        a6_index, text_content, text_cursor, cursor_x,
-                        cursor_y, font_size, font_name)
-
-                if not is_complete:
-                    cursor_x = None
-                    cursor_y = None
-                    if print_page_number:
-                        draw_page_number(a6_index)
-                    if a6_index % 8 == 7:
-                        new_page()
-                    a6_index += 1
-                else:
-                    text_cursor = 0
-                    pass
+            paragraphs.append(("p", element.text.strip()))
         elif element.name == "img" or element.name == "image":
-            # global skip_cover
-            # if skip_cover:
-            #     skip_cover = False
-            #     continue
-            cover_filename = ""
             if element.has_attr("xlink:href"):
-                cover_filename = element["xlink:href"]
-                print(f"图片:{cover_filename}")
+                image_href = element["xlink:href"]
             else:
-                cover_filename = element.get("src")
-            if a6_index >= 1 and cursor_y is not None:  # 处理没绘制完的页面
-                if print_page_number:
-                    draw_page_number(a6_index)
-                if a6_index % 8 == 7:
-                    new_page()
-                a6_index += 1
-            cover_filename = "./tmpdir/" + cover_filename
-            print(f"图片:{cover_filename}")
-            draw_image_in_a6_region(a6_index, cover_filename)
-            if print_page_number:
-                draw_page_number(a6_index)
-            if a6_index % 8 == 7:
-                new_page()
-            a6_index += 1
-            cursor_y = None
-            text_cursor = 0
+                image_href = element.get("src")
+            image_path = archive.resolve(image_href,
+                                         doc_path) if archive else None
+            print(f"图片:{image_href} -> {image_path}")
+            paragraphs.append(("img", image_path or image_href or ""))
         elif element.name in ["h1", "h2", "h3", "h4", "h5", "h6"]:
-            text_content = element.text.strip()
-            is_complete = False
-            text_cursor = 0
-            print(f"准备处理处理 标题 {text_content}")
-            print(f"页面:{a6_index} 绘制位置:{cursor_x}, {cursor_y}")
-            while not is_complete:
-                is_complete, text_cursor, cursor_x, cursor_y = draw_text_in_a6_region_with_cursor(
-                    a6_index, text_content, text_cursor, cursor_x, cursor_y,
-                    font_size + 3, font_name, "center")
-                if not is_complete:
-                    cursor_x = None
-                    cursor_y = None
-                    if print_page_number:
-                        draw_page_number(a6_index)
-                    if a6_index % 8 == 7:
-                        new_page()
-                    a6_index += 1
-                else:
-                    text_cursor = 0
-                    pass
-
-    return a6_index, cursor_x, cursor_y
-
-
-
-def process_txt_to_pdf(txt_path):
-    """
-    从文本文件生成PDF
-    :param txt_path: 文本文件路径
-    :param pdf_path: 输出PDF文件路径
-    :param font_name: 字体名称
-    :param font_size: 字体大小
-    :param title_size: 标题字体大小
-    :param print_page_number: 是否打印页码
-    """
-    # 读取文本文件内容
-    with open(txt_path, 'r', encoding='utf-8') as file:
-        lines = file.readlines()
-    is_complete = False
-    text_cursor = 0
+            if len(element.text.strip()) == 0:
+                continue
+            paragraphs.append(("h", element.text.strip()))
+    return paragraphs
+
+
+def current_typography(indent):
+    """
+    汇总当前的排版参数（字体、字号、行距、区域尺寸和边距）
+    章节排版缓存以这些参数作为键的一部分，任何一项改动都会重新排版
+    :param indent: 正文段落首行缩进
+    :return: 排版参数字典
+    """
+    available_width = A6_WIDTH - 2 * a6_lr_margin - page_lr_margin - page_center_margin
+    return {
+        "font_name": DEFAULT_FONT,
+        "font_path": FONT_PATH if DEFAULT_FONT == FONT_NAME else "",
+        "font_size": TEXT_FONT_SIZE,
+        "title_size": title_size,
+        "line_space": TEXT_LINE_SPACE,
+        "indent": indent,
+        "max_width": available_width + 8,
+        "region_width": A6_WIDTH,
+        "region_height": A6_HEIGHT,
+        "region_top": A6_HEIGHT - a6_tb_margin - TEXT_LINE_SPACE,
+        "region_bottom": a6_tb_margin,
+        "page_lr_margin": page_lr_margin,
+        "page_center_margin": page_center_margin,
+        "a6_lr_margin": a6_lr_margin,
+        "fallback_fonts": fontchain.register_fallback_fonts(FALLBACK_FONTS),
+    }
+
+
+def end_a6_region(a6_index):
+    """
+    结束一个A6区域：绘制页码，下一个区域从新的逻辑页面开始
+    """
+    if print_page_number:
+        draw_page_number(a6_index)
+
+
+def render_chapters(chapters, typography, archive=None):
+    """
+    逐章排版并绘制：章节在进程池中并行排版，未改动的章节直接使用缓存中的排版结果
+    :param chapters: 章节迭代器，每项为 (章节标题, 段落列表)，章节标题可以为 None
+    :param typography: 排版参数字典
+    :param archive: EpubArchive 对象，用于读取图片
+    :return: (最后使用的A6区域索引, 书签列表)
+             书签列表每项为 (标题, 层级, 章节开始的A6区域索引)，书签同时写入逻辑页面PDF
+    """
+    # 分批保存时总是使用排版缓存，续做时已完成的批次只回放排版结果
+    cache = textlayout.LayoutCache(LAYOUT_CACHE_DIR) if (
+        use_layout_cache or pages_journal is not None) else None
+    headings = deque()
+
+    def chapter_paragraphs():
+        for heading, paragraphs in chapters:
+            headings.append(heading)
+            yield paragraphs
+
     a6_index = 0
     cursor_y = None
-    cursor_x = None
-    # 处理每一行文本
-    for line in lines:
+    outlines = []
+    outline_depth = 0
+    font_names = [typography["font_name"]] + [
+        name for name, _ in typography["fallback_fonts"]]
+    # 第一阶段在进程池中并行拆分行，第二阶段在这里顺序分配A6区域并绘制
+    for blocks in textlayout.layout_chapters(chapter_paragraphs(), typography,
+                                             cache, layout_workers):
+        heading = headings.popleft()
+        ops, a6_index, cursor_y = textlayout.place_blocks(
+            blocks, a6_index, cursor_y, typography)
+        for op in ops:
+            if heading is not None and op[0] != "end":
+                # 章节的第一行（或第一张图片）所在的A6区域作为书签位置，
+                # 没有卷标题时章节书签放在第一层
+                level = min(heading["level"], outline_depth)
+                if pages_journal is None:
+                    # 分批保存时书签在合并各批时添加
+                    key = f"chapter{len(outlines)}"
+                    a6_page(op[1]).bookmarkPage(key)
+                    pages_c.addOutlineEntry(heading["title"], key, level)
+                if heading["level"] == textlayout.LEVEL_VOLUME:
+                    outline_depth = textlayout.LEVEL_CHAPTER
+                outlines.append((heading["title"], level, op[1]))
+                heading = None
+            if page_done(op[1]):
+                continue
+            if op[0] == "line":
+                _, index, text_y, text, text_width, size, align, runs = op
+                if runs is not None:
+                    runs = [(font_names[font_index], run_text)
+                            for font_index, run_text in runs]
+                draw_line_in_a6_region(index, text_y, text, text_width, size,
+                                       typography["font_name"], align, runs)
+            elif op[0] == "image":
+                _, index, image_path = op
+                image = archive.open_image(image_path) if archive else None
+                draw_image_in_a6_region(index, image, image_path)
+            else:
+                print(f"完成A6区域 {op[1]}")
+                end_a6_region(op[1])
+    if cache is not None:
+        print(f"📦 排版缓存：命中 {cache.hits} 章，重新排版 {cache.misses} 章")
+    return a6_index, outlines
+
+
+def txt_book_chapters(txt_path, chapter_range=None):
+    """
+    TXT的章节迭代器（内存映射，自动探测编码，不把整本书读入内存）
+    渲染整本书时顺便记录章节索引并保存到源文件旁边；
+    指定章节范围时直接从索引中的字节偏移开始读取，不处理前面的章节
+    :param txt_path: 文本文件路径
+    :param chapter_range: (起始章节, 结束章节)，章节序号从1开始，结束章节为 None 表示到末尾
+    :return: (章节标题, 段落列表) 迭代器
+    """
+    source = txtsource.TextSource(txt_path, TXT_ENCODING)
+    print(f"文本编码：{source.encoding}")
+    if chapter_range is None:
+        index_entries = []
+        yield from txt_chapters(source.paragraphs(), index_entries)
+        if source.encoding.startswith('utf-16'):
+            return  # UTF-16 文本没有字节偏移，不保存索引
+        chapterindex.save_index(txt_path, index_entries, source.encoding)
+        return
+
+    if source.encoding.startswith('utf-16'):
+        raise ValueError("错误：UTF-16 编码的文本不支持按章节范围渲染")
+    entries = chapterindex.load_index(txt_path, source.encoding)
+    if entries is None:
+        print("正在建立章节索引...")
+        entries = chapterindex.build_txt_index(source)
+        chapterindex.save_index(txt_path, entries, source.encoding)
+    start, end = chapter_range
+    if start > len(entries):
+        raise ValueError(f"错误：共有 {len(entries)} 章，起始章节 {start} 超出范围")
+    start_offset = entries[start - 1]["offset"]
+    end_offset = entries[end]["offset"] if end is not None and end < len(
+        entries) else None
+    print(f"渲染第 {start} 章（{entries[start - 1]['title']}）到第 {end or len(entries)} 章")
+    paragraphs = takewhile(
+        lambda item: end_offset is None or item[0] < end_offset,
+        source.paragraphs(start_offset))
+    yield from txt_chapters(paragraphs)
+
+
+def epub_chapters(archive, chapter_range=None, epub_path=None):
+    """
+    EPUB的章节迭代器，每个HTML文档作为一个章节
+    渲染整本书时顺便把章节索引保存到源文件旁边
+    :param archive: EpubArchive 对象
+    :param chapter_range: (起始章节, 结束章节)，章节序号从1开始，即spine中的文档序号
+    :param epub_path: EPUB文件路径，用于保存章节索引
+    :return: (章节标题, 段落列表) 迭代器
+    """
+    start, end = chapter_range if chapter_range else (1, None)
+    index_entries = []
+    for spine_index, (doc_path, html_content) in enumerate(
+            epub_html_iter(archive, start - 1, end), start - 1):
+        paragraphs = html_to_paragraphs(html_content, archive, doc_path)
+        heading = textlayout.chapter_heading(paragraphs)
+        index_entries.append({
+            "spine": spine_index,
+            "doc": doc_path,
+            **(heading or {
+                "title": os.path.splitext(os.path.basename(doc_path))[0],
+                "level": textlayout.LEVEL_CHAPTER
+            })
+        })
+        yield heading, paragraphs
+    if chapter_range is None and epub_path:
+        chapterindex.save_index(epub_path, index_entries)
+
+
+def txt_chapters(paragraphs, index_entries=None):
+    """
+    将文本段落按标题切分成章节，标题段落作为新章节的第一段
+    :param paragraphs: (字节偏移, 段落文本) 迭代器
+    :param index_entries: 不为 None 时，把检测到的标题追加到该列表作为章节索引
+    :return: (章节标题, 段落列表) 迭代器
+    """
+    chapter = []
+    for offset, line in paragraphs:
         if len(line.strip()) == 0:
             continue
-        if check_is_title(line.strip()):
-            text_content = line.strip()
-        else:
-            text_content = "    " + line.strip()
-        if text_content:
-            is_complete = False
-            text_cursor = 0
-            while not is_complete:
-                if check_is_title(text_content):
-                    is_complete, text_cursor, cursor_x, cursor_y = draw_text_in_a6_region_with_cursor(
-                        a6_index, text_content, text_cursor, cursor_x,
-                        cursor_y, title_size, DEFAULT_FONT, "center")
-                else:
-                    is_complete, text_cursor, cursor_x, cursor_y = draw_text_in_a6_region_with_cursor(
-                        a6_index, text_content, text_cursor, cursor_x,
-                        cursor_y, TEXT_FONT_SIZE, DEFAULT_FONT)
-                if not is_complete:
-                    cursor_x = None
-                    cursor_y = None
-                    if print_page_number:
-                        draw_page_number(a6_index)
-                    if a6_index % 8 == 7:
-                        new_page()
-                    a6_index += 1
-                else:
-                    text_cursor = 0
-                    pass
-                
-    if print_page_number:
-        draw_page_number(a6_index)
-    new_page()
-    front_c.save()
-    back_c.save()
+        level = textlayout.detect_title(line)
+        if level is not None:
+            if chapter:
+                yield textlayout.chapter_heading(chapter), chapter
+                chapter = []
+            if index_entries is not None:
+                index_entries.append({"offset": offset, "title": line.strip(), "level": level})
+        chapter.append(("p", line))
+    if chapter:
+        yield textlayout.chapter_heading(chapter), chapter
+
+
+def process_txt_to_pdf(txt_path, pages_pdf, chapter_range=None):
+    """
+    从文本文件生成逻辑页面PDF（每页一个A6页面）
+    :param txt_path: 文本文件路径
+    :param pages_pdf: 逻辑页面PDF路径
+    :param chapter_range: 只渲染的章节范围 (起始章节, 结束章节)，None 表示整本书
+    :return: (A6区域数, 书签列表)
+    """
+    typography = current_typography("    ")
+    start_pages(pages_pdf, None if PREVIEW else pages_state(txt_path, chapter_range, typography))
+    # 逐段读取文本文件内容，按章节排版并绘制
+    a6_index, outlines = render_chapters(
+        txt_book_chapters(txt_path, chapter_range), typography)
+    finish_pages(a6_index, outlines)
+    print(f"✅ 逻辑页面PDF生成完成！路径：{os.path.abspath(pages_pdf)}")
     print(f"📄 总共渲染了 {a6_index} 个A6区域")
-    return
-    
+    return a6_index, outlines
 
-def generate_custom_order_pdfs(epub_path, front_pdf, back_pdf):
+
+def generate_custom_order_pdfs(epub_path, pages_pdf, chapter_range=None):
     """
-    从EPUB文件生成两个PDF（正面和背面），按照自定义顺序交替渲染内容
+    从EPUB文件生成逻辑页面PDF（每页一个A6页面），拼版由 impose 模块完成
     :param epub_path: EPUB文件路径
-    :param front_pdf: 正面PDF文件路径
-    :param back_pdf: 背面PDF文件路径
-    :param render_order: 渲染顺序列表，包含8个元素，每个元素是(页码, 位置索引)的元组
+    :param pages_pdf: 逻辑页面PDF路径
+    :param chapter_range: 只渲染的章节范围 (起始章节, 结束章节)，None 表示整本书
+    :return: (A6区域数, 书签列表)
     """
-
-    a6_index = 0
-    cursor_x = None  # 初始化游标
-    cursor_y = None  # 初始化游标
-    # 遍历EPUB的HTML内容
-    for html_content in epub_html_iter(epub_path):
-        # 合并剩余内容和当前内容
-        a6_index, cursor_x, cursor_y = draw_html_in_a6_region(
-            a6_index=a6_index,
-            html_content=html_content,
-            cursor_x=cursor_x,
-            cursor_y=cursor_y,
-            font_name=DEFAULT_FONT,
-            font_size=TEXT_FONT_SIZE)
-
-    # 保存两个PDF
-    if print_page_number:
-        draw_page_number(a6_index)
-    new_page()
-    front_c.save()
-    back_c.save()
-    print(f"✅ 正面PDF生成完成！路径：{os.path.abspath(front_pdf)}")
-    print(f"✅ 背面PDF生成完成！路径：{os.path.abspath(back_pdf)}")
+    typography = current_typography("      ")
+    start_pages(pages_pdf, None if PREVIEW else pages_state(epub_path, chapter_range, typography))
+    # 遍历EPUB的HTML内容（直接从压缩包中读取，不解压），每个HTML文档作为一个章节
+    with EpubArchive(epub_path) as archive:
+        a6_index, outlines = render_chapters(
+            epub_chapters(archive, chapter_range, epub_path), typography, archive)
+    finish_pages(a6_index, outlines)
+    print(f"✅ 逻辑页面PDF生成完成！路径：{os.path.abspath(pages_pdf)}")
     print(f"📄 总共渲染了 {a6_index} 个A6区域")
-    return front_pdf, back_pdf, a6_index
-
-
-def merge_front_back_pdfs(front_pdf, back_pdf, output_pdf):
-    """
-    将正面PDF和背面PDF合并成一个PDF，按照一页front，一页back的顺序
-    :param front_pdf: 正面PDF路径
-    :param back_pdf: 背面PDF路径
-    :param output_pdf: 输出合并后的PDF路径
-    """
-    # 读取两个PDF文件
-    front_reader = PdfReader(front_pdf)
-    back_reader = PdfReader(back_pdf)
-
-    writer = PdfWriter()
-
-    # 获取两个PDF的页数
-    front_pages = len(front_reader.pages)
-    back_pages = len(back_reader.pages)
-    # 取较小的页数进行合并
-    min_pages = min(front_pages, back_pages)
-    print(f"开始合并PDF，正面{front_pages}页，背面{back_pages}页")
-    # 按照一页front，一页back的顺序合并
-    for i in range(min_pages):
-        # 添加正面页
-        writer.add_page(front_reader.pages[i])
-        # 添加背面页
-        writer.add_page(back_reader.pages[i])
-        print(f"已添加第{i+1}对页面")
-
-    # 如果正面或背面PDF页数更多，将剩余页面添加到合并后的PDF
-    if front_pages > back_pages:
-        for i in range(back_pages, front_pages):
-            writer.add_page(front_reader.pages[i])
-            print(f"已添加正面PDF的额外页面 {i+1}")
-    elif back_pages > front_pages:
-        for i in range(front_pages, back_pages):
-            writer.add_page(back_reader.pages[i])
-            print(f"已添加背面PDF的额外页面 {i+1}")
-
-    # 保存合并后的PDF
-    with open(output_pdf, 'wb') as out_file:
-        writer.write(out_file)
-
-    print(f"✅ PDF合并完成！路径：{os.path.abspath(output_pdf)}")
-    print(f"📄 合并后的PDF共有 {len(writer.pages)} 页")
+    return a6_index, outlines
+
+
+def measure_book(source_path, chapter_range=None):
+    """
+    只排版不绘制，统计需要的A6区域和A4纸张数量
+    :param source_path: EPUB或TXT文件路径
+    :param chapter_range: 只统计的章节范围，None 表示整本书
+    :return: (A6区域数, A4纸张数)
+    """
+    cache = textlayout.LayoutCache(LAYOUT_CACHE_DIR) if use_layout_cache else None
+    if source_path.endswith(".epub"):
+        with EpubArchive(source_path) as archive:
+            regions = textlayout.measure_regions(
+                (paragraphs for _, paragraphs in epub_chapters(
+                    archive, chapter_range, source_path)),
+                current_typography("      "), cache, layout_workers)
+    else:
+        regions = textlayout.measure_regions(
+            (paragraphs for _, paragraphs in txt_book_chapters(
+                source_path, chapter_range)),
+            current_typography("    "), cache, layout_workers)
+    # 按当前版式计算纸张数（a6x4 每张纸正反两面共8个A6区域）
+    sheets = impose.sheet_count(regions, PAGE_LAYOUT)
+    return regions, sheets
+
+
+# 可用于凑纸张数的排版参数：(最小值, 最大值, 步长)
+# 取值按步长对齐，反复求解时可以命中章节排版缓存
+FIT_PARAMS = {
+    "font_size": (6, 16, 0.5),
+    "line_space": (0, 12, 0.5),
+    "margin": (0, 40, 1),
+}
+
+
+def set_fit_param(name, value):
+    """
+    设置求解用的排版参数
+    :param name: 参数名（font_size / line_space / margin）
+    :param value: 参数值
+    """
+    global TEXT_FONT_SIZE, title_size, TEXT_LINE_SPACE, a6_lr_margin, a6_tb_margin
+    if name == "font_size":
+        TEXT_FONT_SIZE = value
+        title_size = TEXT_FONT_SIZE + 3
+    elif name == "line_space":
+        TEXT_LINE_SPACE = value
+    elif name == "margin":
+        a6_lr_margin = value
+        a6_tb_margin = value
+    else:
+        raise ValueError(f"错误：不支持的参数 {name}，可选：{', '.join(FIT_PARAMS)}")
+
+
+def fit_sheet_count(source_path, target_sheets, param="font_size",
+                    chapter_range=None):
+    """
+    二分查找排版参数，使总纸张数不超过目标值，并尽量用大字号/大行距/大边距
+    三个参数的纸张数都随参数值单调不减
+    :param source_path: EPUB或TXT文件路径
+    :param target_sheets: 目标A4纸张数
+    :param param: 要调整的参数名
+    :param chapter_range: 只统计的章节范围，None 表示整本书
+    :return: (参数值, A6区域数, A4纸张数)，无法满足时返回 None
+    """
+    if param not in FIT_PARAMS:
+        raise ValueError(f"错误：不支持的参数 {param}，可选：{', '.join(FIT_PARAMS)}")
+    low, high, step = FIT_PARAMS[param]
+    candidates = [low + i * step for i in range(int(round((high - low) / step)) + 1)]
+    best = None
+    left, right = 0, len(candidates) - 1
+    while left <= right:
+        mid = (left + right) // 2
+        set_fit_param(param, candidates[mid])
+        regions, sheets = measure_book(source_path, chapter_range)
+        print(f"  {param}={candidates[mid]} → {regions} 个A6区域，{sheets} 张A4纸")
+        if sheets <= target_sheets:
+            best = (candidates[mid], regions, sheets)
+            left = mid + 1
+        else:
+            right = mid - 1
+    if best is not None:
+        set_fit_param(param, best[0])
+    return best
 
 
 def main():
-    if len(sys.argv) < 2:
+    args = sys.argv[1:]
+    measure_only = util.pop_flag(args, "--measure")
+    fit_sheets = util.pop_option(args, "--fit-sheets")
+    fit_param = util.pop_option(args, "--fit-param", "font_size")
+    global TXT_ENCODING
+    TXT_ENCODING = util.pop_option(args, "--encoding", TXT_ENCODING)
+    fallback_fonts = util.pop_option(args, "--fallback-fonts")
+    if fallback_fonts:
+        FALLBACK_FONTS.extend(fallback_fonts.split(","))
+    chapter_range = util.pop_option(args, "--chapters")
+    if chapter_range is not None:
+        chapter_range = chapterindex.parse_chapter_range(chapter_range)
+    global PAGE_LAYOUT, PREVIEW, resume
+    PAGE_LAYOUT = util.pop_option(args, "--layout", PAGE_LAYOUT)
+    PREVIEW = util.pop_flag(args, "--preview")
+    resume = util.pop_flag(args, "--resume")
+    if len(args) < 1 or PAGE_LAYOUT not in impose.LAYOUTS:
         print("❌ 参数错误！正确用法：")
-        print(f"python {os.path.basename(__file__)} <epub文件路径> [PDF路径]")
+        print(f"python {os.path.basename(__file__)} <epub文件路径> [PDF路径] [--measure] [--fit-sheets 纸张数 [--fit-param font_size|line_space|margin]] [--encoding 编码] [--chapters 起始章-结束章] [--layout a6x4|a5x2|single] [--fallback-fonts 字体1.ttf,字体2.ttf] [--preview] [--resume]")
         print("示例：")
         print(f"python {os.path.basename(__file__)} ./book.epub ./output.pdf")
+        print(f"python {os.path.basename(__file__)} ./book.txt --measure")
+        print(f"python {os.path.basename(__file__)} ./book.txt ./output.pdf --fit-sheets 40")
+        print(f"python {os.path.basename(__file__)} ./book.txt ./part.pdf --chapters 120-160")
+        print(f"python {os.path.basename(__file__)} ./book.txt ./proof.png --preview")
+        print("--measure 只排版不渲染，输出A6区域数和A4纸张数")
+        print("--fit-sheets 自动调整字号（或行距、边距），使总纸张数不超过指定值")
+        print("--encoding 指定TXT文件编码（默认自动探测）")
+        print("--chapters 只渲染指定范围的章节（按章节索引直接定位，EPUB按文档计章）")
+        print("--layout 拼版方式：a6x4 A4每面4个A6（默认），a5x2 A4横版每面2个A5骑马钉，single 每个A6单独一页")
+        print("         逻辑页面保存为 <PDF路径>.a6.pdf，换版式可直接用 impose.py 重新拼版")
+        print("--fallback-fonts 后备字体，主字体缺少的字符（生僻字、emoji等）按顺序使用后备字体")
+        print("--preview 打样预览：低分辨率拼版，输出 .png 为缩略图总览，其他扩展名为小PDF")
+        print(f"--resume 断点续做：逻辑页面每 {RESUME_BATCH_PAGES} 页保存一次到 <PDF路径>.a6.resume/，"
+              "中断后用同样的命令加 --resume 重新运行，排好的章节从排版缓存回放，只绘制没有完成的批次")
         sys.exit(1)
 
     # 获取命令行参数
-    epub_path = sys.argv[1]
-    front_pdf_file = "front.pdf"
-    back_pdf_file = "back.pdf"
+    epub_path = args[0]
+    merge_pdf_path = args[1] if len(args) >= 2 else "all.pdf"
+    pages_pdf_file = os.path.splitext(merge_pdf_path)[0] + ".a6.pdf"
 
     # 检查输入文件是否存在
     if not os.path.exists(epub_path):
         print(f"❌ 输入文件不存在：{epub_path}")
         sys.exit(1)
-    # 默认渲染顺序
-    
+
+    if fit_sheets:
+        print(f"🔍 调整 {fit_param}，目标 {fit_sheets} 张A4纸...")
+        best = fit_sheet_count(epub_path, int(fit_sheets), fit_param,
+                               chapter_range)
+        if best is None:
+            print(f"❌ 参数取最小值也无法排进 {fit_sheets} 张A4纸")
+            sys.exit(1)
+        print(f"✅ {fit_param}={best[0]}：{best[1]} 个A6区域，{best[2]} 张A4纸")
+    if measure_only:
+        regions, sheets = measure_book(epub_path, chapter_range)
+        print(f"📏 字号 {TEXT_FONT_SIZE}，行距 {TEXT_LINE_SPACE}，边距 {a6_lr_margin}/{a6_tb_margin}")
+        print(f"📄 共需 {regions} 个A6区域，{sheets} 张A4纸（双面）")
+        return
+
+    # 第一步：排版并绘制逻辑页面（每页一个A6页面）
     if epub_path.endswith(".epub"):
-        output_dir = "./tmpdir"
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        with zipfile.ZipFile(epub_path, 'r') as zip_ref:
-            zip_ref.extractall(output_dir)
-            print(f"解压完成，文件已保存到: {output_dir}")
-            
-        _, _, total_a6_regions = generate_custom_order_pdfs(
-        epub_path, front_pdf_file, back_pdf_file)
+        generate_custom_order_pdfs(epub_path, pages_pdf_file, chapter_range)
     elif epub_path.endswith(".txt"):
-        process_txt_to_pdf(epub_path)
+        process_txt_to_pdf(epub_path, pages_pdf_file, chapter_range)
     else:
         print(f"❌ 不支持的文件格式：{epub_path}")
         sys.exit(1)
-        
-    
-    # 检查是否提供了合并PDF路径
-    merge_pdf_path = "all.pdf"
-    if len(sys.argv) >= 3:
-        merge_pdf_path = sys.argv[2]
-    print(f"渲染顺序：{render_order}")
-
-    # 如果提供了合并PDF路径，则合并PDF
-    if merge_pdf_path:
-        merge_front_back_pdfs(front_pdf_file, back_pdf_file, merge_pdf_path)
+
+    # 第二步：把逻辑页面拼版到打印纸上
+    if PREVIEW:
+        impose.impose_images(pages_c.pages, merge_pdf_path, PAGE_LAYOUT,
+                             pages_c.dpi)
+    else:
+        impose.impose_pdf(pages_pdf_file, merge_pdf_path, PAGE_LAYOUT)
+    close_pages()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,106 @@
+#  字体回退链：主字体缺字（生僻字、emoji、全角符号）时依次使用后备字体
+#  每种字体的 cmap 在加载时转换成覆盖位图（每个码位1位，整个Unicode范围136KB），
+#  排版时逐字查询只需要一次位运算，不再逐字询问字体是否有这个字形
+
+import os
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+# Unicode 码位上限
+MAX_CODEPOINT = 0x110000
+
+# 每种字体的覆盖位图，按字体名称缓存（每个进程只构建一次）
+_coverage = {}
+# 字体链缓存，键为字体名称元组
+_chains = {}
+
+
+def font_coverage(font_name):
+    """
+    把字体的 cmap 转换成覆盖位图
+    :param font_name: 已注册的字体名称
+    :return: bytearray，第 n 位为 1 表示字体包含码位 n 的字形
+    """
+    bits = _coverage.get(font_name)
+    if bits is not None:
+        return bits
+    bits = bytearray(MAX_CODEPOINT >> 3)
+    font = pdfmetrics.getFont(font_name)
+    face = getattr(font, "face", None)
+    if face is not None and hasattr(face, "charToGlyph"):
+        codes = face.charToGlyph.keys()
+    else:
+        # 标准 Type1 字体（如 Helvetica）只能显示 Latin-1 字符
+        codes = range(256)
+    for code in codes:
+        if code < MAX_CODEPOINT:
+            bits[code >> 3] |= 1 << (code & 7)
+    _coverage[font_name] = bits
+    return bits
+
+
+def register_fallback_fonts(font_paths):
+    """
+    注册后备字体，字体名称取文件名
+    :param font_paths: 字体文件路径列表
+    :return: [[字体名称, 字体路径], ...]（可以直接放进排版参数并序列化）
+    """
+    fonts = []
+    for font_path in font_paths:
+        if not os.path.exists(font_path):
+            print(f"⚠️ 后备字体文件 {font_path} 不存在，跳过")
+            continue
+        font_name = "Fallback-" + os.path.splitext(os.path.basename(font_path))[0]
+        if font_name not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(font_name, font_path))
+        fonts.append([font_name, font_path])
+    return fonts
+
+
+class FontChain:
+    """
+    字体回退链，第一个字体是主字体
+    """
+
+    def __init__(self, font_names):
+        self.font_names = list(font_names)
+        self._bitsets = [font_coverage(name) for name in self.font_names]
+
+    def font_index(self, ch):
+        """
+        取能显示该字符的第一个字体，所有字体都没有时使用主字体
+        :return: 字体在链中的序号
+        """
+        code = ord(ch)
+        byte = code >> 3
+        bit = 1 << (code & 7)
+        for index, bits in enumerate(self._bitsets):
+            if bits[byte] & bit:
+                return index
+        return 0
+
+    def runs(self, text):
+        """
+        把文本切分成使用同一字体的连续片段
+        :return: [[字体序号, 片段文本], ...]
+        """
+        runs = []
+        for ch in text:
+            index = self.font_index(ch)
+            if runs and runs[-1][0] == index:
+                runs[-1][1] += ch
+            else:
+                runs.append([index, ch])
+        return runs
+
+
+def get_chain(font_names):
+    """
+    按字体名称取字体链（同一进程中复用已经构建好的位图）
+    """
+    font_names = tuple(font_names)
+    chain = _chains.get(font_names)
+    if chain is None:
+        chain = _chains[font_names] = FontChain(font_names)
+    return chain
@@ -0,0 +1,286 @@
+#  图片目录和解码缓存：同一本书按多个配置拼版时，图片列表、尺寸、横图分割结果
+#  和解码后的图片只处理一次，所有配置共用（多进程渲染时子进程以 fork 方式继承）
+
+import contextlib
+import io
+import os
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+from reportlab.lib.utils import ImageReader
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import rastercanvas
+import prefetch
+
+# 支持的图片格式
+VALID_IMAGE_EXT = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.webp')
+# 解码缓存的默认上限（MB）：单个配置运行时每张图片只画一次，缓存不会命中，默认不缓存
+DECODE_CACHE_MB = 0
+# 多个配置共用一个图片目录（multibook）时解码缓存的默认上限（MB）
+SHARED_CACHE_MB = 1024
+# 彩色 JPEG 转成灰度 JPEG 时的压缩质量
+GRAY_JPEG_QUALITY = 90
+
+
+def list_images(image_folder):
+    """
+    列出文件夹中的图片文件，按文件名排序
+    :param image_folder: 图片文件夹路径
+    :return: 图片路径列表
+    """
+    if not os.path.isdir(image_folder):
+        raise ValueError(f"错误：图片文件夹 '{image_folder}' 不存在或不是有效目录！")
+    image_files = []
+    for filename in os.listdir(image_folder):
+        file_path = os.path.join(image_folder, filename)
+        # 跳过目录，只处理文件
+        if os.path.isfile(file_path) and filename.lower().endswith(
+                VALID_IMAGE_EXT):
+            image_files.append(file_path)
+    if not image_files:
+        raise RuntimeError(f"错误：文件夹 '{image_folder}' 中未找到任何有效图片！")
+    image_files.sort(key=lambda x: os.path.basename(x))
+    return image_files
+
+
+class ImageCatalog:
+    """
+    一个图片文件夹的目录：图片列表、图片尺寸（只读文件头）、派生图片（如横图分割结果），
+    以及按 MB 限制的解码缓存（最近最少使用的图片先淘汰）
+    """
+
+    def __init__(self, image_folder, cache_mb=DECODE_CACHE_MB):
+        self.image_folder = image_folder
+        self.files = list_images(image_folder)
+        self.cache_bytes = cache_mb * 1024 * 1024
+        self._sizes = {}
+        self._derived = {}
+        self._decoded = OrderedDict()
+        self._decoded_bytes = 0
+        self.prefetcher = None
+        # 按灰度嵌入的图片（自动分色时的黑白页）
+        self.gray_images = set()
+        # 按输出预算重新压缩过的 JPEG -> 压缩质量（按灰度嵌入时沿用，不按固定质量重新放大）
+        self.jpeg_quality = {}
+
+    def image_size(self, image_path):
+        """
+        图片尺寸（只读取文件头，结果缓存）
+        :return: (宽, 高)
+        """
+        size = self._sizes.get(image_path)
+        if size is None:
+            with Image.open(image_path) as img:
+                size = self._sizes[image_path] = img.size
+        return size
+
+    def is_landscape(self, image_path):
+        width, height = self.image_size(image_path)
+        return width > height
+
+    def derived(self, key, func):
+        """
+        派生结果只计算一次，如横图分割后的两张竖图
+        :param key: 缓存键，需要包含影响结果的所有参数
+        :param func: 计算函数（无参数）
+        """
+        if key not in self._derived:
+            self._derived[key] = func()
+        return self._derived[key]
+
+    def get_derived(self, key):
+        """
+        取已经计算过的派生结果，没有时返回 None
+        """
+        return self._derived.get(key)
+
+    def decoded(self, image_path):
+        """
+        取解码后的图片，不在缓存中时解码并放入缓存（超过上限时淘汰最久未用的图片）
+        :return: 已加载像素数据的PIL图片
+        """
+        img = self._decoded.get(image_path)
+        if img is not None:
+            self._decoded.move_to_end(image_path)
+            return img
+        img = self._prefetched(image_path)
+        if not isinstance(img, Image.Image):
+            with Image.open(img or image_path) as img:
+                img.load()
+        size = image_bytes(img)
+        if size <= self.cache_bytes:
+            while self._decoded_bytes + size > self.cache_bytes:
+                _, old = self._decoded.popitem(last=False)
+                self._decoded_bytes -= image_bytes(old)
+            self._decoded[image_path] = img
+            self._decoded_bytes += size
+        return img
+
+    def preload(self, image_paths):
+        """
+        在启动渲染进程之前解码图片，子进程共享解码结果；缓存装满后停止，不淘汰已解码的图片
+        :param image_paths: 图片路径列表（按使用顺序，None 会被跳过）
+        :return: 已缓存的图片数
+        """
+        for image_path in image_paths:
+            if image_path is None or image_path in self._decoded:
+                continue
+            width, height = self.image_size(image_path)
+            # 按RGB估算解码后的大小
+            if self._decoded_bytes + width * height * 3 > self.cache_bytes:
+                break
+            self.decoded(image_path)
+        return len(self._decoded)
+
+    def image_source(self, image_path, canvas_obj=None):
+        """
+        drawImage 使用的图片来源：
+        reportlab 画布上 JPEG 返回路径（直接嵌入原始数据，不需要解码），其他格式返回缓存的解码结果
+        （不缓存时返回路径或预读的数据，由 reportlab 解码，内存中只有正在绘制的图片）；
+        全分辨率位图画布直接使用解码结果；打样预览返回路径，由位图画布按缩略图尺寸解码；
+        gray_images 中的图片按灰度嵌入
+        :param image_path: 图片路径
+        :param canvas_obj: 要绘制到的画布
+        """
+        if isinstance(canvas_obj, rastercanvas.PlanCanvas):
+            return image_path
+        gray = image_path in self.gray_images
+        if isinstance(canvas_obj, rastercanvas.RasterCanvas):
+            if canvas_obj.draft:
+                return self._prefetched(image_path) or image_path
+            img = self.decoded(image_path)
+            return img.convert('L') if gray and img.mode != 'L' else img
+        if image_path.lower().endswith(('.jpg', '.jpeg')):
+            if gray:
+                return self.gray_jpeg(image_path)
+            return image_path
+        if not self.cache_bytes and not gray:
+            source = self._prefetched(image_path)
+            return image_path if source is None else ImageReader(source)
+        img = self.decoded(image_path)
+        if gray and img.mode != 'L':
+            img = img.convert('L')
+        return ImageReader(img)
+
+    def gray_jpeg(self, image_path):
+        """
+        JPEG 按灰度嵌入：本来就是灰度的直接返回路径，彩色的重新压缩成单通道 JPEG
+        （reportlab 直接嵌入 JPEG 数据，PDF中为 DeviceGray，文件比 RGB 小）；
+        按输出预算压缩过的图片沿用预算的质量，灰度版本不比原图小时直接嵌入原图（不破坏输出预算）
+        """
+        source = self._prefetched(image_path) or image_path
+        with Image.open(source) as img:
+            if img.mode == 'L':
+                return image_path
+            img = img.convert('L')
+        data = io.BytesIO()
+        img.save(data, 'JPEG', quality=self.jpeg_quality.get(image_path, GRAY_JPEG_QUALITY))
+        if data.tell() >= os.path.getsize(image_path):
+            return image_path
+        data.seek(0)
+        return ImageReader(data)
+
+
+    # ---------- 预读 ----------
+    def load_sizes(self, image_paths, workers=prefetch.PREFETCH_WORKERS):
+        """
+        用线程池并发读取图片文件头（网络存储上逐个读取的延迟会叠加）
+        """
+        image_paths = [path for path in image_paths
+                       if path is not None and path not in self._sizes]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for image_path, size in zip(image_paths,
+                                        executor.map(_header_size, image_paths)):
+                if size is not None:
+                    self._sizes[image_path] = size
+
+    def plan_sides(self, draw_side, side_count):
+        """
+        把绘制函数空跑一遍，得到每一面按顺序用到的图片（拼版顺序）
+        :param draw_side: 绘制函数 draw_side(画布, 面序号)
+        :param side_count: 总面数
+        :return: [[图片路径, ...], ...]
+        """
+        plan = []
+        # 空跑时绘制函数的调试输出不需要显示
+        with contextlib.redirect_stdout(io.StringIO()):
+            for side_index in range(side_count):
+                canvas_obj = rastercanvas.PlanCanvas()
+                draw_side(canvas_obj, side_index)
+                plan.append(canvas_obj.images)
+        return plan
+
+    def start_prefetch(self, plan, budget_mb=prefetch.PREFETCH_MB, decode=False,
+                       passthrough_jpeg=True):
+        """
+        按拼版顺序开始预读
+        :param plan: plan_sides 的结果
+        :param budget_mb: 预读内存上限（MB）
+        :param decode: 是否在线程池中直接解码（否则只读入文件内容）
+        :param passthrough_jpeg: JPEG 由 reportlab 按路径直接嵌入时为 True，
+                                 这时只把文件读进系统缓存，不在内存中保留
+        """
+        self.stop_prefetch()
+
+        def load(image_path):
+            if image_path in self._decoded:
+                return None, 0  # 已经在解码缓存中（如多配置运行时预先解码的图片）
+            with open(image_path, 'rb') as f:
+                data = f.read()
+            if passthrough_jpeg and image_path.lower().endswith(('.jpg', '.jpeg')):
+                return None, 0
+            if not decode:
+                return data, len(data)
+            with Image.open(io.BytesIO(data)) as img:
+                img.load()
+            return img, image_bytes(img)
+
+        def estimate(image_path):
+            # 与 load 占用的内存一致：解码时按 RGB 估计像素数据，否则为文件大小
+            if image_path in self._decoded or \
+                    (passthrough_jpeg and image_path.lower().endswith(('.jpg', '.jpeg'))):
+                return 0
+            try:
+                if decode:
+                    width, height = self.image_size(image_path)
+                    return width * height * 3
+                return os.path.getsize(image_path)
+            except Exception:
+                return 0  # 读取失败的图片留给绘制时报错
+
+        self.prefetcher = prefetch.Prefetcher(plan, load, budget_mb, estimate=estimate)
+        return self.prefetcher
+
+    def stop_prefetch(self):
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+            self.prefetcher = None
+
+    def _prefetched(self, image_path):
+        """
+        预读的结果：PIL图片、内存中的文件对象，或 None
+        """
+        if self.prefetcher is None:
+            return None
+        data = self.prefetcher.get(image_path)
+        if isinstance(data, bytes):
+            return io.BytesIO(data)
+        return data
+
+
+def _header_size(image_path):
+    try:
+        with Image.open(image_path) as img:
+            return img.size
+    except Exception:
+        return None  # 读取失败的图片留给绘制时报错
+
+
+def image_bytes(img):
+    """
+    解码后的图片占用的内存（字节）
+    """
+    return len(img.getbands()) * img.width * img.height
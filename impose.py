@@ -0,0 +1,295 @@
+#  拼版：把排好的逻辑页面（每个A6页面是PDF中的一页）放到打印纸上
+#  逻辑页面只转换一次成 Form XObject，纸张上只放置引用和变换矩阵，
+#  因此同一份逻辑页面可以直接拼成不同版式，不需要重新排版：
+#    a6x4   A4竖版，每面4个A6，一张纸正反面8个A6（裁开后按页码叠放）
+#    a5x2   A4横版，每面2个A5（A6等比放大），每5张纸一帖，骑马钉
+#    single 每个逻辑页面单独一页
+#  用法：python impose.py <逻辑页面PDF> <输出PDF> [--layout a6x4|a5x2|single]
+
+import os
+import sys
+
+from reportlab.lib.pagesizes import A4, landscape
+
+# 尝试导入 PyPDF2 用于拼版
+try:
+    from PyPDF2 import PdfReader, PdfWriter
+    from PyPDF2.generic import (ArrayObject, DecodedStreamObject,
+                                DictionaryObject, FloatObject, NameObject)
+except ImportError:
+    try:
+        from pypdf import PdfReader, PdfWriter
+        from pypdf.generic import (ArrayObject, DecodedStreamObject,
+                                   DictionaryObject, FloatObject, NameObject)
+    except ImportError:
+        print("错误：需要安装 PyPDF2 或 pypdf 库来拼版")
+        print("请运行: pip install PyPDF2 或 pip install pypdf")
+        sys.exit(1)
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import util
+import rastercanvas
+
+LAYOUTS = ("a6x4", "a5x2", "single")
+
+# a6x4：一张A4纸正反面8个A6区域的顺序，每个元素是 (面, 位置)
+# 面 0 为正面，1 为背面；位置 0 左上，1 右上，2 左下，3 右下
+A6X4_ORDER = [(0, 0), (1, 1), (1, 0), (0, 1), (0, 2), (1, 3), (1, 2), (0, 3)]
+# a5x2：每帖的A4纸张数（与 dankai2a4 相同）
+SIGNATURE_SHEETS = 5
+
+
+def sheet_count(page_count, layout="a6x4"):
+    """
+    计算拼版需要的纸张数（双面算一张）
+    :param page_count: 逻辑页面数
+    :param layout: 版式
+    :return: 纸张数
+    """
+    if layout == "a6x4":
+        return (page_count + len(A6X4_ORDER) - 1) // len(A6X4_ORDER)
+    if layout == "a5x2":
+        return (page_count + 3) // 4
+    return (page_count + 1) // 2
+
+
+def plan_sides(page_count, layout="a6x4"):
+    """
+    计算每一面纸上放哪些逻辑页面
+    :param page_count: 逻辑页面数
+    :param layout: 版式
+    :return: [[(逻辑页面索引或 None, 槽位索引), ...], ...]，每项是一面
+    """
+    sides = []
+    if layout == "a6x4":
+        for sheet in range(sheet_count(page_count, layout)):
+            front = [None] * 4
+            back = [None] * 4
+            for k, (side, pos) in enumerate(A6X4_ORDER):
+                index = sheet * len(A6X4_ORDER) + k
+                if index < page_count:
+                    (front if side == 0 else back)[pos] = index
+            sides.append([(index, pos) for pos, index in enumerate(front)])
+            sides.append([(index, pos) for pos, index in enumerate(back)])
+    elif layout == "a5x2":
+        group_size = SIGNATURE_SHEETS * 4
+        for group_start in range(0, page_count, group_size):
+            group_pages = min(group_size, page_count - group_start)
+            for sheet_pages in util.genNumberSeqByA4Page((group_pages + 3) // 4):
+                # 每张纸的4个页面：正面左、正面右、背面左、背面右
+                slots = [group_start + page_num - 1
+                         if page_num <= group_pages else None
+                         for page_num in sheet_pages]
+                for side in range(2):
+                    pair = slots[side * 2:side * 2 + 2]
+                    # 两个位置都没有页面时跳过这一面（避免空白页）
+                    if pair[0] is None and pair[1] is None:
+                        continue
+                    sides.append([(pair[0], 0), (pair[1], 1)])
+    elif layout == "single":
+        sides = [[(index, 0)] for index in range(page_count)]
+    else:
+        raise ValueError(f"错误：不支持的版式 '{layout}'，可选：{', '.join(LAYOUTS)}")
+    return sides
+
+
+def sheet_geometry(layout, page_size):
+    """
+    纸张尺寸和每个槽位的矩形
+    :param layout: 版式
+    :param page_size: 逻辑页面尺寸 (宽, 高)
+    :return: ((纸张宽, 纸张高), [(x, y, 宽, 高), ...])
+    """
+    if layout == "a6x4":
+        width, height = A4
+        half_w, half_h = width / 2, height / 2
+        return (width, height), [(0, half_h, half_w, half_h),
+                                 (half_w, half_h, half_w, half_h),
+                                 (0, 0, half_w, half_h),
+                                 (half_w, 0, half_w, half_h)]
+    if layout == "a5x2":
+        width, height = landscape(A4)
+        return (width, height), [(0, 0, width / 2, height),
+                                 (width / 2, 0, width / 2, height)]
+    return page_size, [(0, 0, page_size[0], page_size[1])]
+
+
+def page_to_form(writer, page, resources_cache):
+    """
+    把一页PDF转换成 Form XObject（相同的资源字典只复制一次，多个页面共享字体）
+    :param resources_cache: 资源字典缓存，同一次拼版的所有页面共用
+    :return: XObject 的间接引用
+    """
+    form = DecodedStreamObject()
+    contents = page.get_contents()
+    form.set_data(contents.get_data() if contents is not None else b"")
+    form[NameObject("/Type")] = NameObject("/XObject")
+    form[NameObject("/Subtype")] = NameObject("/Form")
+    form[NameObject("/BBox")] = ArrayObject(
+        [FloatObject(float(v)) for v in page.mediabox])
+    if "/Resources" in page:
+        resources = page["/Resources"].get_object()
+        key = repr(resources)
+        if key not in resources_cache:
+            resources_cache[key] = writer._add_object(resources.clone(writer))
+        form[NameObject("/Resources")] = resources_cache[key]
+    return writer._add_object(form.flate_encode())
+
+
+def outline_items(reader, outline=None, depth=0):
+    """
+    按顺序展开PDF中的书签
+    :return: [(标题, 层级, 页面索引), ...]
+    """
+    if outline is None:
+        outline = reader.outline
+    items = []
+    for item in outline:
+        if isinstance(item, list):
+            items.extend(outline_items(reader, item, depth + 1))
+        else:
+            items.append((item.title, depth,
+                          reader.get_destination_page_number(item)))
+    return items
+
+
+def impose_pdf(pages_pdf, output_pdf, layout="a6x4", cut_lines=True):
+    """
+    把逻辑页面PDF拼版到打印纸上，书签跟随逻辑页面移到对应的纸张
+    :param pages_pdf: 逻辑页面PDF路径（每页一个逻辑页面）
+    :param output_pdf: 输出PDF路径
+    :param layout: 版式，a6x4 / a5x2 / single
+    :param cut_lines: a6x4 版式是否绘制裁切虚线
+    :return: 输出PDF的页数
+    """
+    reader = PdfReader(pages_pdf)
+    writer = PdfWriter()
+    page_count = len(reader.pages)
+    if page_count == 0:
+        raise RuntimeError(f"错误：'{pages_pdf}' 中没有页面！")
+    first_box = reader.pages[0].mediabox
+    page_size = (float(first_box.width), float(first_box.height))
+    sheet_size, slots = sheet_geometry(layout, page_size)
+    sides = plan_sides(page_count, layout)
+    print(f"拼版 {layout}：{page_count} 个逻辑页面 -> {len(sides)} 面")
+
+    forms = {}
+    resources_cache = {}
+    output_page = {}
+    for side_index, side in enumerate(sides):
+        sheet = writer.add_blank_page(*sheet_size)
+        xobjects = DictionaryObject()
+        ops = []
+        for index, slot in side:
+            if index is None:
+                continue
+            if index not in forms:
+                forms[index] = page_to_form(writer, reader.pages[index],
+                                            resources_cache)
+            name = f"/P{index}"
+            xobjects[NameObject(name)] = forms[index]
+            # 等比缩放并居中放进槽位
+            box = reader.pages[index].mediabox
+            width, height = float(box.width), float(box.height)
+            x, y, slot_w, slot_h = slots[slot]
+            scale = min(slot_w / width, slot_h / height)
+            dx = x + (slot_w - width * scale) / 2 - float(box.left) * scale
+            dy = y + (slot_h - height * scale) / 2 - float(box.bottom) * scale
+            ops.append(f"q {scale:.6g} 0 0 {scale:.6g} {dx:.4f} {dy:.4f} cm "
+                       f"{name} Do Q")
+            output_page.setdefault(index, side_index)
+        if layout == "a6x4" and cut_lines:
+            # 绘制虚线，将A4分割成2x2的A6区域
+            width, height = sheet_size
+            ops.append(f"q [5 3] 0 d 0 0 0 RG 1 w {width / 2:.4f} 0 m "
+                       f"{width / 2:.4f} {height:.4f} l 0 {height / 2:.4f} m "
+                       f"{width:.4f} {height / 2:.4f} l S Q")
+        content = DecodedStreamObject()
+        content.set_data("\n".join(ops).encode("latin-1"))
+        sheet[NameObject("/Contents")] = writer._add_object(
+            content.flate_encode())
+        sheet[NameObject("/Resources")] = DictionaryObject(
+            {NameObject("/XObject"): xobjects})
+
+    add_outlines(writer, outline_items(reader), output_page)
+
+    with open(output_pdf, 'wb') as out_file:
+        writer.write(out_file)
+    print(f"✅ 拼版完成！路径：{os.path.abspath(output_pdf)}")
+    print(f"📄 共 {len(sides)} 页，{sheet_count(page_count, layout)} 张纸")
+    return len(sides)
+
+
+def impose_images(pages, output_path, layout="a6x4",
+                  dpi=rastercanvas.PREVIEW_DPI, cut_lines=True):
+    """
+    打样预览：把逻辑页面位图按与 impose_pdf 相同的页序拼到低分辨率纸张上
+    :param pages: 逻辑页面的PIL图片列表
+    :param output_path: 输出路径，.png 为缩略图总览，其他扩展名为图片PDF
+    :param layout: 版式，a6x4 / a5x2 / single
+    :param dpi: 逻辑页面位图的分辨率
+    :param cut_lines: a6x4 版式是否绘制裁切虚线
+    :return: 输出的面数
+    """
+    if not pages:
+        raise RuntimeError("错误：没有可以拼版的页面！")
+    page_size = (pages[0].width * 72.0 / dpi, pages[0].height * 72.0 / dpi)
+    sheet_size, slots = sheet_geometry(layout, page_size)
+    sides = plan_sides(len(pages), layout)
+    print(f"预览拼版 {layout}：{len(pages)} 个逻辑页面 -> {len(sides)} 面")
+    sheet_c = rastercanvas.RasterCanvas(output_path, pagesize=sheet_size, dpi=dpi)
+    for side in sides:
+        for index, slot in side:
+            if index is not None:
+                sheet_c.drawImage(pages[index], *slots[slot],
+                                  preserveAspectRatio=True)
+        if layout == "a6x4" and cut_lines:
+            width, height = sheet_size
+            sheet_c.setDash(5, 3)
+            sheet_c.line(width / 2, 0, width / 2, height)
+            sheet_c.line(0, height / 2, width, height / 2)
+        sheet_c.showPage()
+    sheet_c.save()
+    return len(sides)
+
+
+def add_outlines(writer, outlines, output_page):
+    """
+    把逻辑页面的书签添加到拼版后的PDF，章节书签嵌套在前一个卷书签下面
+    :param writer: PdfWriter 对象
+    :param outlines: (标题, 层级, 逻辑页面索引) 列表
+    :param output_page: 逻辑页面索引 -> 输出页码
+    """
+    parents = []
+    for title, level, index in outlines:
+        if index is None or index not in output_page:
+            continue
+        del parents[level:]
+        parent = parents[-1] if parents else None
+        if hasattr(writer, "add_outline_item"):
+            item = writer.add_outline_item(title, output_page[index],
+                                           parent=parent)
+        else:
+            item = writer.addBookmark(title, output_page[index], parent=parent)
+        parents.append(item)
+    if outlines:
+        print(f"🔖 添加了 {len(outlines)} 个书签")
+
+
+def main():
+    args = sys.argv[1:]
+    layout = util.pop_option(args, "--layout", "a6x4")
+    if len(args) < 2 or layout not in LAYOUTS:
+        print("❌ 参数错误！正确用法：")
+        print(f"python {os.path.basename(__file__)} <逻辑页面PDF> <输出PDF> [--layout {'|'.join(LAYOUTS)}]")
+        print("示例：")
+        print(f"python {os.path.basename(__file__)} ./all.a6.pdf ./book_a5.pdf --layout a5x2")
+        sys.exit(1)
+    if not os.path.exists(args[0]):
+        print(f"❌ 输入文件不存在：{args[0]}")
+        sys.exit(1)
+    impose_pdf(args[0], args[1], layout)
+
+
+if __name__ == "__main__":
+    main()
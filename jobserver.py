@@ -0,0 +1,442 @@
+#  本机任务服务：多人提交拼版任务时不用每次启动新的 Python 进程，也不会争用 front.pdf、temp_split_images 等同名文件
+#  只监听 127.0.0.1，只用标准库；任务排队后交给预先 fork 好的常驻工作进程运行：fork 之前先导入一次拼版脚本，
+#  reportlab/PIL/numpy/pypdf 等依赖模块和字体注册由工作进程继承；每个任务仍在工作进程中加载一份独立的拼版脚本
+#  （booklet.load_engine，只重新执行脚本本身，设置不会留给下一个任务），
+#  每个任务有自己的工作目录（上传的文件、日志、输出都在里面），临时图片放在运行结束后自动删除的临时目录中
+#  接口：
+#    POST /jobs                  JSON {"path": 图片文件夹或EPUB/TXT, "config": 配置名或ini路径, "engine": "dankai",
+#                                      "options": {...}, "output": "output.pdf"}
+#    POST /jobs?name=xx.zip      上传图片压缩包（或 ?name=xx.epub / xx.txt），config/engine/options/output 放在查询参数里
+#    GET  /jobs                  所有任务的状态
+#    GET  /jobs/<id>             任务状态、排队位置和进度
+#    GET  /jobs/<id>/result      下载输出文件（自动分色或分帖输出时用 ?file=文件名 选择）
+#    DELETE /jobs/<id>           删除已结束的任务和它的工作目录
+#  用法：python jobserver.py [--port 8765] [--workers 2] [--spool 任务目录] [--configs 配置目录]
+
+import contextlib
+import glob
+import importlib
+import itertools
+import json
+import mimetypes
+import multiprocessing
+import os
+import queue
+import re
+import shutil
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import util
+import bookconfig
+import booklet
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 监听地址（只接受本机连接）和默认端口
+HOST = "127.0.0.1"
+PORT = 8765
+# 同时运行的任务数（工作进程数）
+JOB_WORKERS = 2
+# 任务工作目录
+SPOOL_DIR = ".jobserver"
+# 上传文件大小上限（MB）
+MAX_UPLOAD_MB = 2048
+# 上传和下载时每次读写的字节数
+CHUNK_SIZE = 1024 * 1024
+# 拼版脚本打印的进度行：“已处理PDF页面 3/40”
+PROGRESS_PATTERN = re.compile(r"(\d+)/(\d+)")
+
+
+class ServerJob:
+    """
+    服务中的一个任务：保存状态，真正的拼版由 booklet 的任务对象在工作进程中完成
+    """
+
+    def __init__(self, job_id, work_dir, job, source):
+        self.id = job_id
+        self.work_dir = work_dir
+        self.job = job
+        self.source = source
+        self.status = "queued"
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    @property
+    def log_path(self):
+        return os.path.join(self.work_dir, "job.log")
+
+    def outputs(self):
+        """
+        已生成的输出文件（自动分色时是 -color/-mono 两个文件，分帖输出时是 -0001 等编号文件）
+        """
+        stem, ext = os.path.splitext(self.job.output_path)
+        paths = [self.job.output_path, f"{stem}-color{ext}", f"{stem}-mono{ext}"]
+        paths += sorted(glob.glob(f"{glob.escape(stem)}*-[0-9][0-9][0-9][0-9]{ext}"))
+        return [path for path in paths if os.path.exists(path)]
+
+    def progress(self):
+        """
+        从日志的最后几行取进度
+        :return: (已完成, 总数, 最后一行日志)
+        """
+        try:
+            with open(self.log_path, "rb") as f:
+                f.seek(max(0, os.path.getsize(self.log_path) - 4096))
+                lines = f.read().decode("utf-8", "replace").splitlines()
+        except OSError:
+            return None, None, ""
+        for line in reversed(lines):
+            match = PROGRESS_PATTERN.search(line)
+            if match and "进度" in line:
+                return int(match.group(1)), int(match.group(2)), lines[-1]
+        return None, None, lines[-1] if lines else ""
+
+    def describe(self, position=None):
+        done, total, message = self.progress()
+        info = {
+            "id": self.id,
+            "status": self.status,
+            "source": self.source,
+            "job": repr(self.job),
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "progress": {"done": done, "total": total} if total else None,
+            "message": message,
+            "outputs": [os.path.basename(path) for path in self.outputs()]
+            if self.status == "done" else [],
+            "error": self.error,
+        }
+        if position is not None:
+            info["position"] = position
+        return info
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _run_in_worker(job, log_path):
+    """
+    在工作进程中运行任务，输出写入任务日志（服务据此显示进度）
+    """
+    with open(log_path, "a", encoding="utf-8", buffering=1) as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        return job.run()
+
+
+class JobServer:
+    """
+    任务队列和工作进程池，HTTP 请求处理器通过它提交和查询任务
+    """
+
+    def __init__(self, spool_dir=SPOOL_DIR, config_dir=None, workers=JOB_WORKERS):
+        self.spool_dir = os.path.abspath(spool_dir)
+        self.config_dir = config_dir or os.path.join(SCRIPT_DIR, "configs")
+        self.workers = workers
+        self.jobs = {}
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        os.makedirs(self.spool_dir, exist_ok=True)
+        # 导入拼版脚本（只为加载它们的依赖模块、注册字体，任务不使用这些模块对象），
+        # 然后在启动任何线程之前 fork 工作进程（fork 有线程的进程不安全）
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            for engine in booklet.ENGINES:
+                importlib.import_module(engine)
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+        for future in [self.executor.submit(_warm_up) for _ in range(workers)]:
+            future.result()
+        self.dispatchers = [threading.Thread(target=self._dispatch, daemon=True)
+                            for _ in range(workers)]
+        for thread in self.dispatchers:
+            thread.start()
+
+    def load_config(self, config):
+        """
+        配置名（configs 目录中的 ini 文件名，不含扩展名）或 ini 文件路径
+        :return: LayoutConfig 对象
+        """
+        if not config:
+            return bookconfig.LayoutConfig()
+        if os.sep not in config and not config.endswith(".ini"):
+            config = os.path.join(self.config_dir, config + ".ini")
+        return bookconfig.LayoutConfig.from_file(config)
+
+    def new_work_dir(self):
+        """
+        新建任务的工作目录；服务当天重启过时任务目录里可能还有上次的同名目录（旧的输出和日志），跳过这些编号
+        :return: (任务编号, 工作目录)
+        """
+        while True:
+            job_id = f"{time.strftime('%Y%m%d')}-{next(self.ids):04d}"
+            work_dir = os.path.join(self.spool_dir, job_id)
+            try:
+                os.makedirs(work_dir)
+            except FileExistsError:
+                continue
+            return job_id, work_dir
+
+    def make_job(self, source, work_dir, config=None, engine="dankai", options=None,
+                 output_name="output.pdf"):
+        """
+        按输入类型建立 booklet 任务：图片文件夹 -> BookletJob，EPUB/TXT -> TextBookJob
+        所有输出和临时文件都放在任务的工作目录中
+        :param output_name: 输出文件名，位图输出或预览时用 .png/.tif
+        """
+        options = options or {}
+        output_path = os.path.join(work_dir, os.path.basename(output_name))
+        if os.path.isdir(source):
+            # 临时图片由 BookletJob 放在每次运行独有的临时目录中，运行结束后删除
+            return booklet.BookletJob(source, output_path, self.load_config(config),
+                                      engine, **options)
+        if not os.path.isfile(source):
+            raise FileNotFoundError(f"输入不存在：{source}")
+        return booklet.TextBookJob(source, output_path, **options)
+
+    def submit(self, source, work_dir, job_id, config=None, engine="dankai", options=None,
+               output_name="output.pdf"):
+        """
+        建立任务并排队
+        :return: ServerJob 对象
+        """
+        try:
+            job = self.make_job(source, work_dir, config, engine, options, output_name)
+        except Exception:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            raise
+        server_job = ServerJob(job_id, work_dir, job, source)
+        with self.lock:
+            self.jobs[job_id] = server_job
+        self.pending.put(server_job)
+        return server_job
+
+    def _dispatch(self):
+        # 每个分发线程同时只占用一个工作进程，排队中的任务在这里等待
+        while True:
+            server_job = self.pending.get()
+            if server_job.status != "queued":
+                continue
+            server_job.status = "running"
+            server_job.started = time.time()
+            try:
+                self.executor.submit(_run_in_worker, server_job.job,
+                                     server_job.log_path).result()
+                server_job.status = "done" if server_job.outputs() else "failed"
+                if server_job.status == "failed":
+                    server_job.error = "没有生成输出文件，详见日志"
+            except Exception as e:
+                server_job.status = "failed"
+                server_job.error = f"{type(e).__name__}: {e}"
+            server_job.finished = time.time()
+
+    def position(self, server_job):
+        """
+        排队位置（前面还有几个排队中的任务），不在排队时返回 None
+        """
+        if server_job.status != "queued":
+            return None
+        with self.lock:
+            queued = [job for job in self.jobs.values() if job.status == "queued"]
+        return sum(1 for job in queued if job.created < server_job.created)
+
+    def delete(self, job_id):
+        with self.lock:
+            server_job = self.jobs.get(job_id)
+            if server_job is None or server_job.status == "running":
+                return False
+            # 还在排队的任务标记为取消，分发线程取到时跳过
+            server_job.status = "cancelled"
+            del self.jobs[job_id]
+        shutil.rmtree(server_job.work_dir, ignore_errors=True)
+        return True
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class JobRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP 接口（server.jobs 是 JobServer 对象）
+    """
+
+    def send_json(self, data, status=200):
+        body = json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        self.send_json({"error": message}, status)
+
+    def route(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        return parts, query
+
+    def find_job(self, parts):
+        server_job = self.server.jobs.jobs.get(parts[1]) if len(parts) >= 2 else None
+        if server_job is None:
+            self.send_error_json(404, "任务不存在")
+        return server_job
+
+    def do_GET(self):
+        parts, query = self.route()
+        if parts == ["jobs"]:
+            jobs = self.server.jobs
+            self.send_json([job.describe(jobs.position(job))
+                            for job in list(jobs.jobs.values())])
+            return
+        if not parts or parts[0] != "jobs" or len(parts) > 3:
+            self.send_error_json(404, "没有这个接口")
+            return
+        server_job = self.find_job(parts)
+        if server_job is None:
+            return
+        if len(parts) == 2:
+            self.send_json(server_job.describe(self.server.jobs.position(server_job)))
+        elif parts[2] == "result":
+            self.send_result(server_job, query.get("file"))
+        else:
+            self.send_error_json(404, "没有这个接口")
+
+    def send_result(self, server_job, name=None):
+        """
+        分块发送输出文件，不把整个PDF读进内存
+        """
+        if server_job.status != "done":
+            self.send_error_json(409, f"任务状态为 {server_job.status}，还没有输出文件")
+            return
+        outputs = server_job.outputs()
+        if name is not None:
+            outputs = [path for path in outputs if os.path.basename(path) == name]
+        if not outputs:
+            self.send_error_json(404, f"没有输出文件 {name}")
+            return
+        path = outputs[0]
+        self.send_response(200)
+        self.send_header("Content-Type",
+                         mimetypes.guess_type(path)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.send_header("Content-Disposition",
+                         f'attachment; filename="{os.path.basename(path)}"')
+        self.end_headers()
+        with open(path, "rb") as f:
+            shutil.copyfileobj(f, self.wfile, CHUNK_SIZE)
+
+    def do_POST(self):
+        parts, query = self.route()
+        if parts != ["jobs"]:
+            self.send_error_json(404, "没有这个接口")
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_UPLOAD_MB * 1024 * 1024:
+            self.send_error_json(413, f"上传文件超过 {MAX_UPLOAD_MB}MB")
+            return
+        jobs = self.server.jobs
+        job_id, work_dir = jobs.new_work_dir()
+        try:
+            if "name" in query:
+                source = self.receive_upload(query["name"], length, work_dir)
+                request = dict(query, options=json.loads(query.get("options", "{}")))
+            else:
+                request = json.loads(self.rfile.read(length) or b"{}")
+                source = request["path"]
+            server_job = jobs.submit(source, work_dir, job_id, request.get("config"),
+                                     request.get("engine", "dankai"),
+                                     request.get("options"),
+                                     request.get("output", "output.pdf"))
+        except (KeyError, ValueError, TypeError, OSError, zipfile.BadZipFile) as e:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            self.send_error_json(400, f"{type(e).__name__}: {e}")
+            return
+        self.send_json(server_job.describe(jobs.position(server_job)), 201)
+
+    def receive_upload(self, name, length, work_dir):
+        """
+        把上传的文件分块写入工作目录：.zip 解压为图片文件夹，.epub/.txt 直接使用
+        :return: 任务输入路径
+        """
+        name = os.path.basename(name)
+        if not name.lower().endswith((".zip", ".epub", ".txt")):
+            raise ValueError(f"不支持的上传文件：{name}（可以上传 .zip 图片包、.epub 或 .txt）")
+        upload_path = os.path.join(work_dir, name)
+        remaining = length
+        with open(upload_path, "wb") as f:
+            while remaining > 0:
+                chunk = self.rfile.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    raise ValueError("上传数据不完整")
+                f.write(chunk)
+                remaining -= len(chunk)
+        if not name.lower().endswith(".zip"):
+            return upload_path
+        image_folder = os.path.join(work_dir, "input")
+        with zipfile.ZipFile(upload_path) as archive:
+            # extractall 会去掉成员名中的绝对路径和 ..，不会写到工作目录之外
+            archive.extractall(image_folder)
+        os.remove(upload_path)
+        # 压缩包里只有一个文件夹时，使用这个文件夹
+        entries = [entry for entry in os.listdir(image_folder) if not entry.startswith(("__MACOSX", "."))]
+        if len(entries) == 1 and os.path.isdir(os.path.join(image_folder, entries[0])):
+            image_folder = os.path.join(image_folder, entries[0])
+        return image_folder
+
+    def do_DELETE(self):
+        parts, _ = self.route()
+        if len(parts) != 2 or parts[0] != "jobs":
+            self.send_error_json(404, "没有这个接口")
+            return
+        if self.server.jobs.delete(parts[1]):
+            self.send_json({"id": parts[1], "status": "deleted"})
+        else:
+            self.send_error_json(409, "任务不存在或正在运行")
+
+    def log_message(self, format, *args):
+        print(f"🌐 {self.address_string()} {format % args}")
+
+
+def main():
+    args = sys.argv[1:]
+    port = int(util.pop_option(args, "--port", PORT))
+    workers = int(util.pop_option(args, "--workers", JOB_WORKERS))
+    spool_dir = util.pop_option(args, "--spool", SPOOL_DIR)
+    config_dir = util.pop_option(args, "--configs")
+    if args:
+        print("❌ 参数错误！正确用法：")
+        print(f"python {os.path.basename(__file__)} [--port {PORT}] [--workers 同时运行的任务数] [--spool 任务目录] [--configs 配置目录]")
+        print("示例：")
+        print(f"python {os.path.basename(__file__)} --workers 2")
+        print(f"curl -X POST localhost:{PORT}/jobs -d '{{\"path\": \"/data/xfefm\", \"config\": \"a52x2\"}}'")
+        print(f"curl -X POST 'localhost:{PORT}/jobs?name=xfefm.zip&config=a52x2' --data-binary @xfefm.zip")
+        print(f"curl localhost:{PORT}/jobs/<任务ID>")
+        print(f"curl -o out.pdf localhost:{PORT}/jobs/<任务ID>/result")
+        sys.exit(1)
+
+    jobs = JobServer(spool_dir, config_dir, workers)
+    httpd = ThreadingHTTPServer((HOST, port), JobRequestHandler)
+    httpd.jobs = jobs
+    print(f"🚀 任务服务已启动：http://{HOST}:{port}/jobs（{workers} 个工作进程，任务目录 {jobs.spool_dir}）")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\n停止服务")
+    finally:
+        httpd.server_close()
+        jobs.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,14 @@
 #!/bin/bash
 
 # 检查是否提供了参数
-if [ $# -ne 1 ]; then
-    echo "用法: $0 <input_directory>"
+if [ $# -lt 1 ] || [ $# -gt 2 ]; then
+    echo "用法: $0 <input_directory> [output_directory]"
     exit 1
 fi
 
 input_dir="$1"
+# 输出目录，默认 output（同时处理多个目录时分别指定，避免写到同一个目录）
+output_dir="${2:-output}"
 
 # 检查输入目录是否存在
 if [ ! -d "$input_dir" ]; then
@@ -15,7 +17,7 @@ if [ ! -d "$input_dir" ]; then
 fi
 
 # 创建输出目录
-mkdir -p output
+mkdir -p "$output_dir"
 
 # 处理输入目录中的所有图片文件
 for img in "$input_dir"/*; do
@@ -28,10 +30,10 @@ for img in "$input_dir"/*; do
             -modulate 100,80,120 \
             -level 5%,95%,1.2 \
             -colorspace Gray \
-            "output/$filename.png"
+            "$output_dir/$filename.png"
         
         echo "已处理: $filename -> clean_$filename"
     fi
 done
 
-echo "批量处理完成！结果保存在 'output' 文件夹中。"
\ No newline at end of file
+echo "批量处理完成！结果保存在 '$output_dir' 文件夹中。"
\ No newline at end of file
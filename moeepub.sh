@@ -1,21 +1,24 @@
 
-rm -r tmpdata
-rm -r dst
-mkdir tmpdata
 fn=$1
-mkdir dst
-unzip $fn -d tmpdata
+# 输出目录，默认 dst（第二个参数可以为每一卷指定不同的目录，同时处理多卷不会互相覆盖）
+dst=${2:-dst}
+# 解压用的临时目录，每次运行独有，退出时自动删除
+tmpdata=$(mktemp -d "${TMPDIR:-/tmp}/moeepub.XXXXXX")
+trap 'rm -rf "$tmpdata"' EXIT
+rm -rf "$dst"
+mkdir -p "$dst"
+unzip "$fn" -d "$tmpdata"
 dst_index=0
-cat tmpdata/vol.opf | grep 'html' | while read line
+cat "$tmpdata"/vol.opf | grep 'html' | while read line
 do
     echo $line
     # 补齐4位数字 
     dst_index=$((dst_index+1))
     name_index=$(printf "%04d" $dst_index)
     src_html=$(echo $line | awk -F '"' '{print $4}')
-    src_pic=$(cat tmpdata/$src_html | grep 'img' | awk -F '"' '{print $2}' | sed 's/\.\.//g')
-    echo "tmpdata"$src_pic $name_index
+    src_pic=$(cat "$tmpdata"/$src_html | grep 'img' | awk -F '"' '{print $2}' | sed 's/\.\.//g')
+    echo "$tmpdata"$src_pic $name_index
     suffix=$(echo $src_pic | awk -F '.' '{print $2}')
-    cp tmpdata/$src_pic dst/$name_index.$suffix
+    cp "$tmpdata"/$src_pic "$dst"/$name_index.$suffix
 done
-open dst
+open "$dst"
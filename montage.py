@@ -0,0 +1,248 @@
+#  封面拼图：从一卷图片中挑几页，按模板拼成一张封面（取代 test.sh 里手写的 magick 命令）
+#  模板："品"字（pin）、倒"品"字（inverted）、网格（grid），坐标按 300DPI 下 2100×2960 像素给出
+#  每个格子只按需要的尺寸解码（JPEG draft），裁剪缩放后的结果缓存在磁盘上，重复生成时不再读原图；
+#  输出位图（.jpg/.png/.tif，按 DPI 缩放）或PDF（每个格子是一个图片 XObject）
+#  用法：python montage.py <图片文件夹> <输出文件> [--template pin|inverted|grid] [--pages 1,150,501]
+#        python montage.py <系列目录> <输出目录> --series [--format pdf]   （每个子文件夹是一卷）
+
+import hashlib
+import io
+import math
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import util
+import imagecatalog
+import pageanalysis
+
+# 模板画布尺寸（像素）和对应的分辨率
+MONTAGE_SIZE = (2100, 2960)
+MONTAGE_DPI = 300
+# 模板：每个格子为 (x, y, 宽, 高)，原点在左上角
+TEMPLATES = {
+    "pin": [(600, 50, 900, 1400), (50, 1500, 900, 1400), (1050, 1500, 900, 1400)],
+    "inverted": [(20, 100, 900, 1400), (1050, 100, 900, 1400), (550, 1550, 900, 1400)],
+}
+# 网格模板的格子数和间距（像素）
+GRID_COUNT = 4
+GRID_GAP = 40
+# 缓存和输出的 JPEG 质量
+JPEG_QUALITY = 92
+# 裁剪缩放结果的缓存目录
+CACHE_DIR = ".montage_cache"
+
+
+def template_slots(template, count=GRID_COUNT):
+    """
+    取模板的格子
+    :param template: 模板名称
+    :param count: 网格模板的格子数
+    :return: [(x, y, 宽, 高), ...]
+    """
+    if template in TEMPLATES:
+        return TEMPLATES[template]
+    if template != "grid":
+        raise ValueError(f"错误：不支持的模板 '{template}'，可选：{', '.join(TEMPLATES)}, grid")
+    cols = math.ceil(math.sqrt(count))
+    rows = math.ceil(count / cols)
+    width, height = MONTAGE_SIZE
+    cell_w = (width - GRID_GAP * (cols + 1)) // cols
+    cell_h = (height - GRID_GAP * (rows + 1)) // rows
+    return [(GRID_GAP + col * (cell_w + GRID_GAP), GRID_GAP + row * (cell_h + GRID_GAP),
+             cell_w, cell_h)
+            for row in range(rows) for col in range(cols)][:count]
+
+
+def pick_pages(catalog, count, pages=None):
+    """
+    挑选拼图用的页面：指定页码时直接使用，否则第一页（原封面）加上均匀分布的内页，跳过空白页
+    :param catalog: ImageCatalog 对象
+    :param count: 需要的页数
+    :param pages: 指定的页码列表（从1开始）
+    :return: 图片路径列表
+    """
+    files = catalog.files
+    if pages:
+        return [files[min(max(page, 1), len(files)) - 1] for page in pages[:count]]
+    picked = []
+    for slot in range(count):
+        index = slot * len(files) // count
+        # 从均匀分布的位置往后找第一张不是空白页的图片
+        while index < len(files) - 1 and (files[index] in picked or _is_blank(catalog, files[index])):
+            index += 1
+        picked.append(files[index])
+    return picked
+
+
+def _is_blank(catalog, image_path):
+    ink = pageanalysis.analyze_images([image_path], catalog, workers=1)[3][0]
+    return ink < pageanalysis.BLANK_INK
+
+
+def slot_image(image_path, width, height, cache_dir=CACHE_DIR):
+    """
+    裁剪缩放到格子尺寸的图片（居中裁剪铺满格子），结果以 JPEG 缓存在磁盘上
+    :return: JPEG 数据
+    """
+    cache_path = None
+    if cache_dir:
+        st = os.stat(image_path)
+        key = hashlib.sha1(f"{os.path.abspath(image_path)}\0{st.st_size}\0{st.st_mtime_ns}"
+                           f"\0{width}x{height}".encode("utf-8")).hexdigest()
+        cache_path = os.path.join(cache_dir, key[:2], key + ".jpg")
+        try:
+            with open(cache_path, "rb") as f:
+                return f.read()
+        except OSError:
+            pass
+    with Image.open(image_path) as img:
+        scale = max(width / img.width, height / img.height)
+        # JPEG 按 1/2~1/8 比例直接解码到不小于需要的尺寸
+        img.draft('RGB', (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+        img = img.convert('RGB')
+    scale = max(width / img.width, height / img.height)
+    resized = img.resize((max(width, round(img.width * scale)),
+                          max(height, round(img.height * scale))), Image.LANCZOS)
+    left = (resized.width - width) // 2
+    top = (resized.height - height) // 2
+    cropped = resized.crop((left, top, left + width, top + height))
+    data = io.BytesIO()
+    cropped.save(data, 'JPEG', quality=JPEG_QUALITY)
+    data = data.getvalue()
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        # 先写临时文件再替换，避免并行任务读到写了一半的缓存
+        tmp_path = f"{cache_path}.{os.getpid()}.{id(data)}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, cache_path)
+    return data
+
+
+def render_montage(image_folder, output_path, template="pin", pages=None,
+                   dpi=MONTAGE_DPI, count=GRID_COUNT, cache_dir=CACHE_DIR,
+                   catalog=None):
+    """
+    生成一卷的拼图封面
+    :param image_folder: 图片文件夹
+    :param output_path: 输出路径，.pdf 输出PDF，其他扩展名输出位图
+    :param template: 模板名称
+    :param pages: 指定的页码列表（从1开始），None 时自动挑选
+    :param dpi: 输出分辨率（模板按 MONTAGE_DPI 设计，按比例缩放）
+    :param count: 网格模板的格子数
+    :param cache_dir: 裁剪缩放结果的缓存目录，None 表示不缓存
+    :return: 输出路径
+    """
+    if catalog is None:
+        catalog = imagecatalog.ImageCatalog(image_folder)
+    slots = template_slots(template, count)
+    sources = pick_pages(catalog, len(slots), pages)
+    scale = dpi / MONTAGE_DPI
+    canvas_w, canvas_h = (round(v * scale) for v in MONTAGE_SIZE)
+    tiles = []
+    for (x, y, w, h), image_path in zip(slots, sources):
+        x, y, w, h = (round(v * scale) for v in (x, y, w, h))
+        tiles.append((x, y, w, h, slot_image(image_path, w, h, cache_dir)))
+
+    output_dir = os.path.dirname(output_path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    if output_path.lower().endswith(".pdf"):
+        # 每个格子是一个 JPEG XObject，页面尺寸与位图输出的打印尺寸相同
+        points = 72 / dpi
+        c = canvas.Canvas(output_path, pagesize=(canvas_w * points, canvas_h * points))
+        for x, y, w, h, data in tiles:
+            c.drawImage(ImageReader(io.BytesIO(data)), x * points,
+                        (canvas_h - y - h) * points, width=w * points, height=h * points)
+        c.showPage()
+        c.save()
+    else:
+        result = Image.new('RGB', (canvas_w, canvas_h), 'white')
+        for x, y, w, h, data in tiles:
+            with Image.open(io.BytesIO(data)) as tile:
+                result.paste(tile, (x, y))
+        options = {"quality": JPEG_QUALITY} if output_path.lower().endswith(
+            ('.jpg', '.jpeg')) else {}
+        result.save(output_path, dpi=(dpi, dpi), **options)
+    return output_path
+
+
+def render_series(series_folder, output_dir, template="pin", fmt="pdf",
+                  dpi=MONTAGE_DPI, count=GRID_COUNT, cache_dir=CACHE_DIR,
+                  workers=None):
+    """
+    一次生成整个系列的拼图封面：系列目录下每个包含图片的子文件夹是一卷
+    :return: {卷名: 输出路径或异常}
+    """
+    volumes = sorted(name for name in os.listdir(series_folder)
+                     if os.path.isdir(os.path.join(series_folder, name))
+                     and not name.startswith("."))
+    results = {}
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        futures = {name: executor.submit(
+            render_montage, os.path.join(series_folder, name),
+            os.path.join(output_dir, f"{name}.{fmt}"), template, None, dpi,
+            count, cache_dir) for name in volumes}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+    return results
+
+
+def main():
+    args = sys.argv[1:]
+    template = util.pop_option(args, "--template", "pin")
+    pages = util.pop_option(args, "--pages")
+    dpi = int(util.pop_option(args, "--dpi", MONTAGE_DPI))
+    count = int(util.pop_option(args, "--count", GRID_COUNT))
+    fmt = util.pop_option(args, "--format", "pdf").lstrip(".")
+    cache_dir = util.pop_option(args, "--cache-dir", CACHE_DIR)
+    workers = util.pop_option(args, "--workers")
+    series = util.pop_flag(args, "--series")
+    if util.pop_flag(args, "--no-cache"):
+        cache_dir = None
+    if len(args) < 2:
+        print("❌ 参数错误！正确用法：")
+        print(f"python {os.path.basename(__file__)} <图片文件夹> <输出文件.pdf|.jpg|.png> [--template pin|inverted|grid] [--pages 1,150,501] [--count 4] [--dpi 300] [--cache-dir 目录] [--no-cache]")
+        print(f"python {os.path.basename(__file__)} <系列目录> <输出目录> --series [--format pdf|jpg|png] [--template pin] [--workers 4]")
+        print("示例：")
+        print(f"python {os.path.basename(__file__)} ./xfefm ./cover.jpg --template pin --pages 1,2,5")
+        print(f"python {os.path.basename(__file__)} ./kenan ./covers --series --template inverted")
+        print("模板：pin 品字，inverted 倒品字，grid 网格（--count 格子数）；不指定 --pages 时自动挑选第一页和均匀分布的内页")
+        sys.exit(1)
+
+    try:
+        if series:
+            results = render_series(args[0], args[1], template, fmt, dpi, count,
+                                    cache_dir, int(workers) if workers else None)
+            failed = 0
+            for name, result in results.items():
+                if isinstance(result, Exception):
+                    failed += 1
+                    print(f"  ❌ {name}：{result}")
+                else:
+                    print(f"  ✅ {name}：{os.path.abspath(result)}")
+            print(f"📚 共 {len(results)} 卷，失败 {failed} 卷")
+            if failed:
+                sys.exit(1)
+        else:
+            page_list = [int(page) for page in pages.split(",")] if pages else None
+            output = render_montage(args[0], args[1], template, page_list, dpi,
+                                    count, cache_dir)
+            print(f"✅ 拼图封面生成完成！")
+            print(f"📁 输出路径：{os.path.abspath(output)}")
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"\n❌ 生成失败：{str(e)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
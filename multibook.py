@@ -0,0 +1,150 @@
+#  多配置拼版：同一本书（图片文件夹）按多个配置分别生成册子，方便比较输出效果
+#  所有配置先加载成 LayoutConfig 并校验，图片目录、横图分割和解码缓存只建立一次，
+#  然后每个配置在单独的子进程中渲染（fork 继承已经解码的图片，配置互不影响）
+#  用法：python multibook.py <图片文件夹> <输出目录> <配置1.ini> [配置2.ini ...]
+
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import util
+import bookconfig
+import imagecatalog
+import dankai
+
+
+def render_variant(image_folder, config, output_path):
+    """
+    按一个配置渲染册子（在子进程中执行，配置只写入子进程的 dankai 模块）
+    :return: 输出路径
+    """
+    config.apply(dankai)
+    dankai.generate_pdf_from_images(image_folder, output_path, config.page_size)
+    return output_path
+
+
+def prepare_catalog(image_folder, configs, cache_mb=imagecatalog.SHARED_CACHE_MB):
+    """
+    建立所有配置共用的图片目录：横图按每个配置的需要分割一次，需要解码的图片预先解码
+    :return: ImageCatalog 对象
+    """
+    catalog = imagecatalog.ImageCatalog(image_folder, cache_mb)
+    dankai.image_catalog = catalog
+    needed = []
+    for config in configs:
+        config.apply(dankai)
+        for image_path in dankai.collect_image_files(image_folder):
+            if image_path not in needed:
+                needed.append(image_path)
+    if not dankai.raster_dpi:
+        # PDF输出时 JPEG 直接嵌入原始数据，只有其他格式需要解码
+        needed = [path for path in needed
+                  if not path.lower().endswith(('.jpg', '.jpeg'))]
+    if not dankai.preview_mode:
+        cached = catalog.preload(needed)
+        print(f"🗂️ 图片目录：{len(catalog.files)} 张图片，预先解码 {cached}/{len(needed)} 张")
+    return catalog
+
+
+def render_all(image_folder, output_dir, configs, ext=".pdf", workers=None,
+               cache_mb=imagecatalog.SHARED_CACHE_MB):
+    """
+    按多个配置渲染同一本书
+    :param image_folder: 图片文件夹路径
+    :param output_dir: 输出目录，每个配置输出 <配置名><ext>
+    :param configs: LayoutConfig 列表
+    :param ext: 输出文件扩展名
+    :param workers: 同时渲染的配置数，默认使用全部CPU核心
+    :param cache_mb: 解码缓存上限（MB）
+    :return: {配置名: 输出路径或异常}
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    prepare_catalog(image_folder, configs, cache_mb)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if "fork" not in multiprocessing.get_all_start_methods():
+        workers = 1
+    workers = min(workers, len(configs))
+    jobs = [(config, os.path.join(output_dir, config.name + ext))
+            for config in configs]
+
+    results = {}
+    if workers <= 1:
+        for config, output_path in jobs:
+            try:
+                results[config.name] = render_variant(image_folder, config,
+                                                      output_path)
+            except Exception as e:
+                results[config.name] = e
+        return results
+
+    with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("fork")) as executor:
+        futures = [(config.name, executor.submit(render_variant, image_folder,
+                                                 config, output_path))
+                   for config, output_path in jobs]
+        for name, future in futures:
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                results[name] = e
+    return results
+
+
+def main():
+    args = sys.argv[1:]
+    workers = util.pop_option(args, "--workers")
+    cache_mb = int(util.pop_option(args, "--cache-mb", imagecatalog.SHARED_CACHE_MB))
+    dankai.color_mode = int(util.pop_option(args, "--color-mode", 0))
+    dankai.preview_mode = util.pop_flag(args, "--preview")
+    dankai.raster_dpi = int(util.pop_option(args, "--raster", 0))
+    dankai.raster_multipage = util.pop_flag(args, "--multipage")
+    dankai.analyze_pages = util.pop_flag(args, "--analyze")
+    dankai.drop_duplicates = util.pop_flag(args, "--drop-duplicates")
+    dankai.blank_mode = util.pop_option(args, "--blanks", "keep")
+    dankai.auto_color = util.pop_flag(args, "--auto-color")
+    dankai.select_codec = util.pop_flag(args, "--select-codec")
+    default_ext = ".png" if dankai.preview_mode else ".tif" if dankai.raster_dpi else ".pdf"
+    ext = util.pop_option(args, "--ext", default_ext)
+    if len(args) < 3:
+        print("❌ 参数错误！正确用法：")
+        print(f"python {os.path.basename(__file__)} <图片文件夹> <输出目录> <配置1.ini> [配置2.ini ...] [--workers 进程数] [--cache-mb 解码缓存MB] [--color-mode 0|1] [--preview] [--raster 300|600 [--multipage]] [--analyze] [--drop-duplicates] [--blanks keep|drop|pad] [--auto-color] [--select-codec] [--ext .pdf]")
+        print("示例：")
+        print(f"python {os.path.basename(__file__)} ./images ./compare configs/a52x2.ini configs/B52x2.ini configs/A42x2.ini configs/color.ini")
+        print("每个配置输出 <输出目录>/<配置名>.pdf；图片目录和解码缓存只建立一次，所有配置共用")
+        sys.exit(1)
+
+    image_folder, output_dir = args[0], args[1]
+    try:
+        configs = [bookconfig.LayoutConfig.from_file(path) for path in args[2:]]
+    except (OSError, ValueError) as e:
+        print(f"❌ 配置错误：{e}")
+        sys.exit(1)
+    names = [config.name for config in configs]
+    if len(set(names)) != len(names):
+        print("❌ 配置文件名重复，输出文件会互相覆盖")
+        sys.exit(1)
+
+    # 横图分割等中间文件放在本次运行独有的临时目录中（子进程继承 dankai.temp_root），结束后自动删除
+    with util.scratch_dir("multibook-") as temp_root:
+        dankai.temp_root = temp_root
+        results = render_all(image_folder, output_dir, configs, ext,
+                             int(workers) if workers else None, cache_mb)
+    failed = 0
+    print("\n📋 渲染结果：")
+    for name in names:
+        result = results[name]
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"  ❌ {name}：{result}")
+        else:
+            print(f"  ✅ {name}：{os.path.abspath(result)}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
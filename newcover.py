@@ -1,14 +1,20 @@
+#  封面拼接（位图版）：两张图片和竖排文字合成一张全分辨率PNG
+#  输出路径为 .pdf 时改用 cover.make_cover：图片原样嵌入，书脊文字为矢量文字，文件小、生成快
+
+import os
 import sys
 import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
-def merge_two_images_with_vertical_text(img1_path, img2_path, text_width_mm, text_content):
+def merge_two_images_with_vertical_text(img1_path, img2_path, text_width_mm, text_content,
+                                        save_path="merged_result.png"):
     """
     拼接两张图片，中间添加指定毫米宽度的白色背景+竖排黑色文字
     :param img1_path: 第一张图片路径
     :param img2_path: 第二张图片路径
     :param text_width_mm: 中间文字区域的宽度，单位mm
     :param text_content: 中间要显示的竖排文字内容
+    :param save_path: 输出图片路径
     """
     # -------------------------- 基础配置（固定） --------------------------
     DPI = 96  # 屏幕/打印通用DPI，96DPI是Windows/Linux默认，Mac为72，可根据需求微调
@@ -79,17 +85,17 @@ def merge_two_images_with_vertical_text(img1_path, img2_path, text_width_mm, tex
     final_img.paste(img2, (img1.width + text_width_pixel, 0))
 
     # -------------------------- 保存结果 --------------------------
-    save_path = "merged_result.png"
     final_img.save(save_path, quality=95)
     print(f"✅ 拼接完成！结果已保存至: {save_path}")
     print(f"📌 相关参数：文字区域宽度={text_width_mm}mm({text_width_pixel}px)，文字内容={text_content}")
 
 if __name__ == "__main__":
     # 校验命令行参数数量
-    if len(sys.argv) != 5:
+    if len(sys.argv) not in (5, 6):
         print("❌ 参数错误！正确运行方式：")
-        print("python img_merge_with_text.py <img1路径> <img2路径> <文字区域宽度mm> <竖排文字内容>")
+        print("python img_merge_with_text.py <img1路径> <img2路径> <文字区域宽度mm> <竖排文字内容> [输出路径]")
         print("📌 示例：python img_merge_with_text.py a.jpg b.png 20 测试竖排文字")
+        print("📌 输出路径为 .pdf 时生成矢量封面（图片原样嵌入，文字为矢量文字）")
         sys.exit(1)
     
     # 接收命令行传入的4个参数
@@ -97,8 +103,14 @@ if __name__ == "__main__":
     img2 = sys.argv[2]
     txt_width_mm = float(sys.argv[3])
     text = sys.argv[4]
+    output = sys.argv[5] if len(sys.argv) == 6 else "merged_result.png"
 
-    # 执行拼接
-    merge_two_images_with_vertical_text(img1, img2, txt_width_mm, text)
+    if output.lower().endswith(".pdf"):
+        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+        import cover
+        cover.make_cover(img1, img2, output, text, spine_mm=txt_width_mm)
+    else:
+        # 执行拼接
+        merge_two_images_with_vertical_text(img1, img2, txt_width_mm, text, output)
 
 
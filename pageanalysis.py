@@ -0,0 +1,279 @@
+#  页面分析：拼版前找出重复页（包括重新扫描的近似页）、空白页和彩色页
+#  每张图片只按缩略图尺寸解码（JPEG draft），计算 dHash、pHash、墨量（深色像素比例）
+#  和彩色像素比例，所有图片的哈希放在 numpy 数组里一次性两两比较
+#  用法：python pageanalysis.py <图片文件夹> [--json 报告.json]
+
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import util
+import imagecatalog
+
+# 分析用缩略图的长边（像素）
+THUMB_SIZE = 128
+# 比墨量时去掉的边缘比例（扫描件边缘常有阴影）
+BORDER_CROP = 0.04
+# 低于这个灰度的像素算作墨迹
+INK_LEVEL = 160
+# 墨量低于这个比例算空白页
+BLANK_INK = 0.003
+# 两张图片的 dHash 和 pHash 汉明距离都不超过阈值时算重复页
+DHASH_DISTANCE = 5
+PHASH_DISTANCE = 8
+# 16x16 缩略图各通道的标准差都低于这个值算纯色页面：纯色页面的哈希没有意义，
+# 只和纯色页面比较，各通道平均值相差都不超过 FLAT_DIFF 才算重复
+FLAT_STD = 2.0
+FLAT_DIFF = 3
+# 去掉纸张底色后色度（CbCr 距离）超过这个值的像素算彩色像素
+CHROMA_LEVEL = 24
+# 整页色度中位数不超过这个值时当作纸张底色（旧书发黄），先减去再判断彩色像素
+PAPER_CHROMA = 20
+# 彩色像素超过这个比例算彩色页
+COLOR_RATIO = 0.02
+# pHash 的DCT尺寸
+PHASH_SIZE = 32
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(PHASH_SIZE)
+
+
+def load_thumbnail(image_path, size=THUMB_SIZE):
+    """
+    按缩略图尺寸解码图片（JPEG 直接按 1/2~1/8 比例解码）
+    :return: RGB PIL图片
+    """
+    with Image.open(image_path) as img:
+        img.draft('RGB', (size, size))
+        img = img.convert('RGB')
+    img.thumbnail((size, size))
+    return img
+
+
+def image_stats(image_path):
+    """
+    计算一张图片的 dHash、pHash、16x16 彩色缩略图、墨量和彩色像素比例
+    :return: (dHash 8字节, pHash 8字节, 缩略图 768字节, 墨量, 彩色像素比例)
+    """
+    color = load_thumbnail(image_path)
+    # 纯色页面只能按颜色区分，缩略图保留颜色
+    tiny = np.asarray(color.resize((16, 16), Image.BOX), dtype=np.uint8)
+    thumb = color.convert('L')
+    # dHash：9x8 灰度图中每行相邻像素的明暗关系
+    small = np.asarray(thumb.resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    dhash = np.packbits(small[:, 1:] > small[:, :-1])
+    # pHash：32x32 灰度图的DCT低频部分（左上8x8，去掉直流分量）与中位数比较
+    pixels = np.asarray(thumb.resize((PHASH_SIZE, PHASH_SIZE), Image.BILINEAR),
+                        dtype=np.float64)
+    low = (_DCT @ pixels @ _DCT.T)[:8, :8].ravel()
+    phash = np.packbits(low > np.median(low[1:]))
+    # 墨量：去掉边缘后深色像素的比例
+    gray = np.asarray(thumb)
+    h, w = gray.shape
+    dy, dx = int(h * BORDER_CROP), int(w * BORDER_CROP)
+    inner = gray[dy:h - dy or None, dx:w - dx or None]
+    ink = float(np.count_nonzero(inner < INK_LEVEL)) / max(1, inner.size)
+    # 彩色像素：扫描件的纸张往往偏黄，先减去纸张底色（整页色度的中位数）
+    rgb = np.asarray(color, dtype=np.float32)[dy:h - dy or None, dx:w - dx or None]
+    rgb = rgb.reshape(-1, 3)
+    cb = rgb @ np.array([-0.1687, -0.3313, 0.5], dtype=np.float32)
+    cr = rgb @ np.array([0.5, -0.4187, -0.0813], dtype=np.float32)
+    paper_cb, paper_cr = np.median(cb), np.median(cr)
+    if np.hypot(paper_cb, paper_cr) > PAPER_CHROMA:
+        paper_cb = paper_cr = 0  # 整页大面积彩色，不是纸张底色
+    chroma = np.hypot(cb - paper_cb, cr - paper_cr)
+    color_ratio = float(np.count_nonzero(chroma > CHROMA_LEVEL)) / max(1, chroma.size)
+    return dhash.tobytes(), phash.tobytes(), tiny.tobytes(), ink, color_ratio
+
+
+def analyze_images(image_paths, catalog=None, workers=None):
+    """
+    计算所有图片的哈希、墨量和彩色像素比例（线程池并行解码，结果缓存在图片目录中）
+    :param image_paths: 图片路径列表（None 会被跳过）
+    :param catalog: ImageCatalog 对象，多配置运行时共用分析结果
+    :return: (dHash 数组 (n, 8), pHash 数组 (n, 8), 缩略图数组 (n, 768), 墨量数组 (n,),
+             彩色像素比例数组 (n,))，顺序与 image_paths 相同，None 对应的行为全0、墨量和比例为 nan
+    """
+    paths = [path for path in image_paths if path is not None]
+    stats = {}
+    todo = []
+    for path in paths:
+        if path in stats:
+            continue
+        stats[path] = catalog.get_derived(("analysis", path)) if catalog else None
+        if stats[path] is None:
+            todo.append(path)
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        for path, result in zip(todo, executor.map(_safe_stats, todo)):
+            stats[path] = result
+            if catalog is not None and result is not None:
+                catalog.derived(("analysis", path), lambda: result)
+
+    n = len(image_paths)
+    dhash = np.zeros((n, 8), dtype=np.uint8)
+    phash = np.zeros((n, 8), dtype=np.uint8)
+    tiny = np.zeros((n, 768), dtype=np.uint8)
+    ink = np.full(n, np.nan)
+    color_ratio = np.full(n, np.nan)
+    for index, path in enumerate(image_paths):
+        result = stats.get(path) if path is not None else None
+        if result is not None:
+            dhash[index] = np.frombuffer(result[0], dtype=np.uint8)
+            phash[index] = np.frombuffer(result[1], dtype=np.uint8)
+            tiny[index] = np.frombuffer(result[2], dtype=np.uint8)
+            ink[index] = result[3]
+            color_ratio[index] = result[4]
+    return dhash, phash, tiny, ink, color_ratio
+
+
+def _safe_stats(image_path):
+    try:
+        return image_stats(image_path)
+    except Exception as e:
+        print(f"无法分析图片 {image_path}: {e}")
+        return None
+
+
+def hamming_matrix(hashes):
+    """
+    两两汉明距离
+    :param hashes: (n, 8) uint8 数组
+    :return: (n, n) 距离矩阵
+    """
+    bits = np.unpackbits(hashes, axis=1).astype(np.uint8)
+    # 两个哈希的不同位数 = 各自1的个数之和 - 2 * 共同为1的个数
+    ones = bits.sum(axis=1, dtype=np.int32)
+    common = bits.astype(np.int32) @ bits.T.astype(np.int32)
+    return ones[:, None] + ones[None, :] - 2 * common
+
+
+def find_pages(image_paths, catalog=None, blank_ink=BLANK_INK,
+               dhash_distance=DHASH_DISTANCE, phash_distance=PHASH_DISTANCE,
+               flat_std=FLAT_STD, flat_diff=FLAT_DIFF):
+    """
+    找出重复页和空白页
+    :param image_paths: 图片路径列表（按页面顺序）
+    :return: (重复页 {页面索引: 与之重复的较早页面索引}, 空白页索引集合, 墨量数组)
+    """
+    dhash, phash, tiny, ink, _ = analyze_images(image_paths, catalog)
+    valid = ~np.isnan(ink)
+    blanks = set(np.flatnonzero(valid & (ink < blank_ink)).tolist())
+    # 空白页之间的哈希都很接近，只在有内容的页面之间找重复
+    candidates = np.flatnonzero(valid & ~(ink < blank_ink))
+    duplicates = {}
+    if len(candidates) > 1:
+        near = (hamming_matrix(dhash[candidates]) <= dhash_distance) & \
+               (hamming_matrix(phash[candidates]) <= phash_distance)
+        # 只看每页之前的页面，重复页归到最早出现的那一页
+        near = np.tril(near, k=-1)
+        pixels = tiny[candidates].reshape(len(candidates), -1, 3).astype(np.float64)
+        flat = (pixels.std(axis=1) < flat_std).all(axis=1)
+        if flat.any():
+            # 纯色页面不和有内容的页面比较，纯色页面之间按颜色比较
+            near[flat] = False
+            near[:, flat] = False
+            means = pixels[flat].mean(axis=1)
+            same = (np.abs(means[:, None] - means[None, :]) <= flat_diff).all(axis=2)
+            near[np.ix_(flat, flat)] = np.tril(same, k=-1)
+        for row in np.flatnonzero(near.any(axis=1)):
+            original = int(candidates[np.argmax(near[row])])
+            duplicates[int(candidates[row])] = duplicates.get(original, original)
+    return duplicates, blanks, ink
+
+
+def find_color_pages(image_paths, catalog=None, color_ratio=COLOR_RATIO):
+    """
+    按彩色像素比例把页面分成彩色页和黑白页
+    :param image_paths: 图片路径列表（None 占位算黑白页）
+    :return: 布尔数组，True 表示彩色页
+    """
+    ratios = analyze_images(image_paths, catalog)[4]
+    # nan（占位或无法读取的图片）比较结果为 False，按黑白页处理
+    return ratios > color_ratio
+
+
+def print_report(image_paths, duplicates, blanks, ink):
+    """
+    打印分析结果
+    """
+    def name(index):
+        return f"{index + 1}:{os.path.basename(image_paths[index])}"
+
+    print(f"🔍 页面分析：{len(image_paths)} 页，重复 {len(duplicates)} 页，空白 {len(blanks)} 页")
+    for index in sorted(duplicates):
+        print(f"  重复：{name(index)} 与 {name(duplicates[index])} 相同")
+    for index in sorted(blanks):
+        print(f"  空白：{name(index)}（墨量 {ink[index] * 100:.2f}%）")
+
+
+def screen_pages(image_paths, catalog=None, drop_duplicates=False,
+                 blank_mode="keep"):
+    """
+    拼版前的页面筛选
+    :param image_paths: 图片路径列表（可以包含 None 占位）
+    :param catalog: ImageCatalog 对象
+    :param drop_duplicates: 是否删除重复页
+    :param blank_mode: 空白页处理：keep 保留，drop 删除，pad 换成空白占位（与 pre_none 相同，不画图片和页码）
+    :return: 筛选后的图片路径列表
+    """
+    if blank_mode not in ("keep", "drop", "pad"):
+        raise ValueError(f"错误：空白页处理方式只能是 keep/drop/pad，当前为 '{blank_mode}'")
+    duplicates, blanks, ink = find_pages(image_paths, catalog)
+    print_report(image_paths, duplicates, blanks, ink)
+    result = []
+    for index, path in enumerate(image_paths):
+        if drop_duplicates and index in duplicates:
+            continue
+        if index in blanks:
+            if blank_mode == "drop":
+                continue
+            if blank_mode == "pad":
+                path = None
+        result.append(path)
+    return result
+
+
+def main():
+    args = sys.argv[1:]
+    json_path = util.pop_option(args, "--json")
+    if len(args) < 1:
+        print("❌ 参数错误！正确用法：")
+        print(f"python {os.path.basename(__file__)} <图片文件夹> [--json 报告.json]")
+        sys.exit(1)
+    catalog = imagecatalog.ImageCatalog(args[0])
+    image_paths = catalog.files
+    duplicates, blanks, ink = find_pages(image_paths, catalog)
+    print_report(image_paths, duplicates, blanks, ink)
+    color_pages = [path for path, is_color in
+                   zip(image_paths, find_color_pages(image_paths, catalog)) if is_color]
+    print(f"🎨 彩色页 {len(color_pages)} 页")
+    for path in color_pages:
+        print(f"  彩色：{image_paths.index(path) + 1}:{os.path.basename(path)}")
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "duplicates": {image_paths[k]: image_paths[v]
+                               for k, v in sorted(duplicates.items())},
+                "blanks": [image_paths[k] for k in sorted(blanks)],
+                "color": color_pages,
+                "ink": {path: (None if np.isnan(value) else round(float(value), 5))
+                        for path, value in zip(image_paths, ink)},
+            }, f, ensure_ascii=False, indent=1)
+        print(f"📁 报告已保存：{os.path.abspath(json_path)}")
+
+
+if __name__ == "__main__":
+    main()
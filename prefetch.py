@@ -0,0 +1,120 @@
+#  预读：按拼版顺序，用线程池提前读取后面几面要用的图片，读盘和编码同时进行
+#  图片在NAS或USB硬盘上时，逐张同步读取会让渲染循环一直在等磁盘；
+#  预读的数据按 MB 限制占用内存：提交读取时先按估计的大小占用预算，读完后换成实际大小，
+#  一面纸画完后立即释放它用到的数据（默认不预读，拼版脚本用 --prefetch-mb 打开）
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# 默认预读内存上限（MB）
+PREFETCH_MB = 256
+# 最多预读的面数
+PREFETCH_SIDES = 8
+# 读盘线程数（网络存储上并发读取可以掩盖延迟）
+PREFETCH_WORKERS = 4
+
+
+class Prefetcher:
+    """
+    按面预读：plan[i] 是第 i 面按绘制顺序用到的图片
+    渲染循环在画第 i 面之前调用 advance(i)，绘制时用 get 取预读结果
+    """
+
+    def __init__(self, plan, load, budget_mb=PREFETCH_MB,
+                 lookahead=PREFETCH_SIDES, workers=PREFETCH_WORKERS, estimate=None):
+        """
+        :param plan: 每一面用到的图片键列表
+        :param load: 读取函数 load(键) -> (数据, 占用字节数)，在线程池中执行
+        :param estimate: 估计读入后占用的字节数 estimate(键)，提交时先占用这么多预算；None 时按 0 估计
+        :param budget_mb: 预读数据占用的内存上限（MB）
+        :param lookahead: 最多预读的面数
+        :param workers: 读盘线程数
+        """
+        self.plan = plan
+        self.load = load
+        self.budget = budget_mb * 1024 * 1024
+        self.lookahead = lookahead
+        self.estimate = estimate or (lambda key: 0)
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+        self._lock = threading.Lock()
+        self._futures = {}  # 键 -> Future
+        self._held = 0  # 已提交的读取占用的字节数（未读完的按估计大小）
+        self._sizes = {}  # 键 -> 计入 _held 的字节数
+        self._next_side = 0  # 下一个要提交预读的面
+        # 每个键最后一次被使用的面，过了这一面就释放
+        self._last_use = {}
+        for side_index, keys in enumerate(plan):
+            for key in keys:
+                self._last_use[key] = side_index
+
+    def _load(self, key):
+        try:
+            value, size = self.load(key)
+        except Exception:
+            size = 0
+            raise
+        finally:
+            # 估计的大小换成实际大小
+            with self._lock:
+                self._held += size - self._sizes[key]
+                self._sizes[key] = size
+        return value, size
+
+    def advance(self, side_index):
+        """
+        开始绘制第 side_index 面：释放之前各面的数据，在内存上限内继续提交预读
+        """
+        for key in [key for key in self._futures
+                    if self._last_use[key] < side_index]:
+            self._release(key)
+        if self._next_side < side_index:
+            self._next_side = side_index
+        while self._next_side < len(self.plan) and \
+                self._next_side < side_index + self.lookahead:
+            # 当前面总是预读；后面的面只在加上估计大小后不超过内存上限时预读
+            keys = [key for key in dict.fromkeys(self.plan[self._next_side])
+                    if key not in self._futures]
+            sizes = [self.estimate(key) for key in keys]
+            with self._lock:
+                if self._next_side > side_index and \
+                        self._held + sum(sizes) > self.budget:
+                    break
+                self._held += sum(sizes)
+                self._sizes.update(zip(keys, sizes))
+            for key in keys:
+                self._futures[key] = self._executor.submit(self._load, key)
+            self._next_side += 1
+
+    def get(self, key):
+        """
+        取预读的数据（还在读取时等待读完）
+        :return: 数据，没有预读该键时返回 None
+        """
+        future = self._futures.get(key)
+        if future is None:
+            return None
+        try:
+            return future.result()[0]
+        except Exception:
+            return None  # 读取失败时由调用方自己读取，报错信息与不预读时一致
+
+    def _release(self, key):
+        future = self._futures.pop(key)
+        if not future.cancel():
+            try:
+                future.result()  # 正在读取时等它读完，再释放实际大小
+            except Exception:
+                pass
+        with self._lock:
+            self._held -= self._sizes.pop(key)
+
+    def close(self):
+        """
+        停止预读，释放所有数据
+        """
+        for future in self._futures.values():
+            future.cancel()
+        self._executor.shutdown(wait=True)
+        self._futures.clear()
+        self._sizes.clear()
+        self._held = 0
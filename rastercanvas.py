@@ -0,0 +1,434 @@
+#  位图画布：用 Pillow 模拟拼版脚本用到的 reportlab 画布接口
+#  拼版脚本里计算好的版面坐标（图片位置、页码、分割线）原样画到位图上，
+#  用于打样预览（--preview）：JPEG 直接按缩略图尺寸解码（draft），文字画成灰条，
+#  几秒钟就能检查整本书的拼版和页序，输出小PDF或者缩略图总览PNG
+#  也用于位图输出（--raster）：每一面纸按 300/600dpi 直接合成PNG/TIFF，
+#  多进程并行绘制，按顺序边绘制边写文件，打印机不需要再解释PDF
+
+import io
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageDraw, ImageFont, TiffImagePlugin
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+
+# 打样预览分辨率
+PREVIEW_DPI = 36
+# 缩略图总览每行的页面数
+CONTACT_COLUMNS = 8
+# 缩略图总览中页面之间的间距（像素）
+CONTACT_GUTTER = 12
+# 位图输出支持的文件格式
+RASTER_FORMATS = (".png", ".tif", ".tiff")
+# TIFF 压缩方式（LZW 打印机和RIP普遍支持）
+TIFF_COMPRESSION = "tiff_lzw"
+
+
+def open_draft(source, size=None):
+    """
+    打开图片，JPEG 直接按接近目标尺寸的比例解码（1/2、1/4、1/8），不解码全尺寸
+    :param source: 图片路径、文件对象、PIL图片或 ImageReader 对象
+    :param size: 目标尺寸 (宽, 高)，None 表示按原尺寸解码
+    :return: PIL图片
+    """
+    if isinstance(source, Image.Image):
+        return source
+    fp = getattr(source, "fp", None)  # reportlab ImageReader
+    if fp is not None:
+        fp.seek(0)
+        source = fp
+    elif getattr(source, "_image", None) is not None:
+        return source._image  # 由已解码的PIL图片创建的 ImageReader
+    img = Image.open(source)
+    if size is not None:
+        img.draft('RGB', (max(1, int(size[0])), max(1, int(size[1]))))
+    return img
+
+
+class RasterTextObject:
+    """
+    模拟 reportlab 的文本对象（beginText 返回的对象）
+    """
+
+    def __init__(self, canvas_obj, x=0, y=0):
+        self._canvas = canvas_obj
+        self._font = (canvas_obj._fontname, canvas_obj._fontsize)
+        self.setTextOrigin(x, y)
+
+    def setTextOrigin(self, x, y):
+        self._x0 = self._x = x
+        self._y0 = self._y = y
+
+    def moveCursor(self, dx, dy):
+        # 与 reportlab 相同，dy 以向下为正
+        self._x0 += dx
+        self._y0 -= dy
+        self._x, self._y = self._x0, self._y0
+
+    def setFont(self, font_name, font_size, leading=None):
+        self._font = (font_name, font_size)
+
+    def textOut(self, text):
+        font_name, font_size = self._font
+        self._x += self._canvas._draw_text(self._x, self._y, text, font_name,
+                                           font_size)
+
+
+class RasterCanvas:
+    """
+    用 Pillow 绘制的画布，接口与 reportlab Canvas 的常用部分一致
+    每页完成后保存在 pages 列表中；save 时按输出文件扩展名写出：
+    .png 输出缩略图总览，.pdf 输出每页一张图片的PDF；filename 为 None 时只保留 pages
+    """
+
+    def __init__(self, filename=None, pagesize=A4, dpi=PREVIEW_DPI, draft=True,
+                 greek=None):
+        """
+        :param filename: 输出文件路径
+        :param pagesize: 页面尺寸（点）
+        :param dpi: 分辨率
+        :param draft: 图片是否按目标尺寸快速解码
+        :param greek: 文字是否画成灰条（默认与 draft 相同）
+        """
+        self.filename = filename
+        self.pagesize = pagesize
+        self.dpi = dpi
+        self.draft = draft
+        self.greek = draft if greek is None else greek
+        self.scale = dpi / 72.0
+        self.pages = []
+        self._fontname = "Helvetica"
+        self._fontsize = 12
+        self._fill = (0, 0, 0)
+        self._stroke = (0, 0, 0)
+        self._line_width = 1
+        self._dash = None
+        self._fonts = {}
+        self._new_page()
+
+    # ---------- 坐标换算 ----------
+    def _px(self, value):
+        return int(round(value * self.scale))
+
+    def _point(self, x, y):
+        return self._px(x), self._height_px - self._px(y)
+
+    def _new_page(self):
+        width, height = self.pagesize
+        self._height_px = self._px(height)
+        self._page = Image.new('RGB', (self._px(width), self._height_px),
+                               'white')
+        self._draw = ImageDraw.Draw(self._page)
+        self._dirty = False
+
+    # ---------- 画布状态 ----------
+    def setFont(self, font_name, font_size, leading=None):
+        self._fontname = font_name
+        self._fontsize = font_size
+
+    def stringWidth(self, text, font_name=None, font_size=None):
+        return pdfmetrics.stringWidth(text, font_name or self._fontname,
+                                      font_size or self._fontsize)
+
+    def setFillColorRGB(self, r, g, b, alpha=None):
+        self._fill = (int(r * 255), int(g * 255), int(b * 255))
+
+    def setStrokeColorRGB(self, r, g, b, alpha=None):
+        self._stroke = (int(r * 255), int(g * 255), int(b * 255))
+
+    def setLineWidth(self, width):
+        self._line_width = width
+
+    def setDash(self, array=None, phase=0):
+        if array is None or array == []:
+            self._dash = None
+        elif isinstance(array, (int, float)):
+            self._dash = (array, phase or array)
+        else:
+            self._dash = tuple(array[:2])
+
+    # ---------- 绘制 ----------
+    def line(self, x1, y1, x2, y2):
+        width = max(1, self._px(self._line_width))
+        start, end = self._point(x1, y1), self._point(x2, y2)
+        if self._dash is None:
+            self._draw.line([start, end], fill=self._stroke, width=width)
+        else:
+            # Pillow 没有虚线，按线段长度切成小段
+            on, off = (max(1, self._px(v)) for v in self._dash)
+            dx, dy = end[0] - start[0], end[1] - start[1]
+            length = max(1, int((dx * dx + dy * dy) ** 0.5))
+            for pos in range(0, length, on + off):
+                stop = min(pos + on, length)
+                self._draw.line([(start[0] + dx * pos / length,
+                                  start[1] + dy * pos / length),
+                                 (start[0] + dx * stop / length,
+                                  start[1] + dy * stop / length)],
+                                fill=self._stroke, width=width)
+        self._dirty = True
+
+    def rect(self, x, y, width, height, stroke=1, fill=0):
+        left, bottom = self._point(x, y)
+        right, top = self._point(x + width, y + height)
+        self._draw.rectangle([left, top, right, bottom],
+                             outline=self._stroke if stroke else None,
+                             fill=self._fill if fill else None)
+        self._dirty = True
+
+    def _pil_font(self, font_name, size_px):
+        key = (font_name, size_px)
+        font = self._fonts.get(key)
+        if font is None:
+            path = getattr(getattr(pdfmetrics.getFont(font_name), "face", None),
+                           "filename", None)
+            try:
+                font = ImageFont.truetype(path, size_px) if path else \
+                    ImageFont.load_default(size_px)
+            except (OSError, TypeError):
+                font = ImageFont.load_default()
+            self._fonts[key] = font
+        return font
+
+    def _draw_text(self, x, y, text, font_name, font_size):
+        """
+        :return: 文字宽度（点），供文本对象移动光标
+        """
+        width = pdfmetrics.stringWidth(text, font_name, font_size)
+        if not text.strip():
+            return width
+        if self.greek:
+            # 打样时文字画成灰条，只看版面不看字形
+            left, bottom = self._point(x, y)
+            right, top = self._point(x + width, y + font_size * 0.6)
+            self._draw.rectangle([left, top, max(left, right), bottom],
+                                 fill=(170, 170, 170))
+        else:
+            size_px = max(1, self._px(font_size))
+            font = self._pil_font(font_name, size_px)
+            self._draw.text(self._point(x, y), text, fill=self._fill,
+                            font=font, anchor="ls")
+        self._dirty = True
+        return width
+
+    def drawString(self, x, y, text, *args, **kwargs):
+        self._draw_text(x, y, text, self._fontname, self._fontsize)
+
+    def beginText(self, x=0, y=0):
+        return RasterTextObject(self, x, y)
+
+    def drawText(self, text_obj):
+        pass  # 文本对象在 textOut 时已经画到页面上
+
+    def drawImage(self, image, x, y, width=None, height=None, mask=None,
+                  preserveAspectRatio=False, anchor='c', **kwargs):
+        img = open_draft(image)
+        img_w, img_h = img.size
+        width = img_w if width is None else width
+        height = img_h if height is None else height
+        if preserveAspectRatio:
+            # 与 reportlab 相同：在给定区域内等比缩放并居中
+            scale = min(width / img_w, height / img_h)
+            x += (width - img_w * scale) / 2
+            y += (height - img_h * scale) / 2
+            width, height = img_w * scale, img_h * scale
+        box = (max(1, self._px(width)), max(1, self._px(height)))
+        if self.draft:
+            img.draft('RGB', box)
+        if img.mode not in ('RGB', 'RGBA', 'L'):
+            img = img.convert('RGBA' if 'transparency' in img.info or
+                              img.mode in ('LA', 'PA') else 'RGB')
+        resample = Image.BILINEAR if self.draft else Image.LANCZOS
+        img = img.resize(box, resample)
+        left, top = self._point(x, y + height)
+        self._page.paste(img, (left, top),
+                         img if img.mode == 'RGBA' else None)
+        self._dirty = True
+        return box
+
+    # ---------- 书签（位图输出不支持，保持接口兼容） ----------
+    def bookmarkPage(self, key, **kwargs):
+        pass
+
+    def addOutlineEntry(self, title, key, level=0, closed=None):
+        pass
+
+    # ---------- 分页和保存 ----------
+    def showPage(self):
+        self.pages.append(self._page)
+        self._new_page()
+
+    def save(self):
+        if self._dirty:
+            self.showPage()
+        if self.filename is None:
+            return
+        if self.filename.lower().endswith(".png"):
+            save_contact_sheet(self.pages, self.filename)
+        else:
+            save_image_pdf(self.pages, self.filename, self.dpi)
+
+
+class PlanCanvas:
+    """
+    只记录图片绘制顺序的画布：把拼版函数空跑一遍，得到每一面按顺序用到的图片，
+    其他绘制操作全部忽略（用于预读）
+    """
+
+    def __init__(self):
+        self.images = []
+
+    def drawImage(self, image, *args, **kwargs):
+        self.images.append(image)
+
+    def stringWidth(self, text, font_name=None, font_size=None):
+        return 0
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+def save_contact_sheet(pages, output_path, columns=CONTACT_COLUMNS):
+    """
+    把所有页面拼成一张缩略图总览PNG，页面下方标注序号
+    :param pages: PIL图片列表
+    :param output_path: 输出PNG路径
+    :param columns: 每行的页面数
+    """
+    if not pages:
+        raise RuntimeError("错误：没有可以输出的页面！")
+    cell_w = max(page.width for page in pages)
+    cell_h = max(page.height for page in pages)
+    label_h = 14
+    columns = min(columns, len(pages))
+    rows = (len(pages) + columns - 1) // columns
+    sheet = Image.new('RGB', (columns * (cell_w + CONTACT_GUTTER) + CONTACT_GUTTER,
+                              rows * (cell_h + CONTACT_GUTTER + label_h) + CONTACT_GUTTER),
+                      (96, 96, 96))
+    draw = ImageDraw.Draw(sheet)
+    for index, page in enumerate(pages):
+        row, col = divmod(index, columns)
+        left = CONTACT_GUTTER + col * (cell_w + CONTACT_GUTTER)
+        top = CONTACT_GUTTER + row * (cell_h + CONTACT_GUTTER + label_h)
+        sheet.paste(page, (left, top))
+        draw.text((left, top + page.height + 2), str(index + 1), fill='white')
+    sheet.save(output_path)
+    print(f"✅ 缩略图总览已保存：{os.path.abspath(output_path)}（{len(pages)} 页）")
+
+
+def save_image_pdf(pages, output_path, dpi=PREVIEW_DPI):
+    """
+    把页面位图保存成PDF（每页一张图片）
+    """
+    if not pages:
+        raise RuntimeError("错误：没有可以输出的页面！")
+    pages[0].save(output_path, "PDF", resolution=dpi, save_all=True,
+                  append_images=pages[1:])
+    print(f"✅ 预览PDF已保存：{os.path.abspath(output_path)}（{len(pages)} 页）")
+
+
+def make_canvas(output_path, pagesize, preview=False):
+    """
+    创建拼版脚本使用的画布：正常模式为 reportlab 画布，预览模式为低分辨率位图画布
+    """
+    if preview:
+        return RasterCanvas(output_path, pagesize=pagesize)
+    from reportlab.pdfgen import canvas
+    return canvas.Canvas(output_path, pagesize=pagesize)
+
+
+def side_path(output_path, side_index):
+    """
+    位图输出时每一面的文件路径：<输出文件名>-0001.png
+    """
+    base, ext = os.path.splitext(output_path)
+    return f"{base}-{side_index + 1:04d}{ext}"
+
+
+def _render_side(draw_side, side_index, pagesize, dpi, output_path, multipage):
+    """
+    进程池中执行：绘制一面纸并编码
+    :return: 多页TIFF时返回单页TIFF的字节，否则写出文件并返回路径
+    """
+    canvas_obj = RasterCanvas(None, pagesize=pagesize, dpi=dpi, draft=False)
+    draw_side(canvas_obj, side_index)
+    canvas_obj.showPage()
+    page = canvas_obj.pages[-1]
+    if multipage:
+        buffer = io.BytesIO()
+        page.save(buffer, "TIFF", compression=TIFF_COMPRESSION, dpi=(dpi, dpi))
+        return buffer.getvalue()
+    path = side_path(output_path, side_index)
+    if path.lower().endswith(".png"):
+        page.save(path, dpi=(dpi, dpi))
+    else:
+        page.save(path, compression=TIFF_COMPRESSION, dpi=(dpi, dpi))
+    return path
+
+
+def render_sides(draw_side, side_count, pagesize, output_path, dpi=300,
+                 multipage=False, workers=None):
+    """
+    把每一面纸直接合成为位图文件，多进程并行绘制，按顺序写出
+    子进程以 fork 方式启动，继承拼版脚本已经加载的配置；不支持 fork 的平台在当前进程中顺序绘制
+    :param draw_side: 绘制函数 draw_side(画布, 面序号)，必须是模块级函数（或其 partial）
+    :param side_count: 总面数
+    :param pagesize: 纸张尺寸（点）
+    :param output_path: 输出路径，扩展名 .png/.tif/.tiff；每一面单独保存为 <文件名>-0001.png
+    :param dpi: 分辨率
+    :param multipage: 是否把所有面写进同一个多页TIFF
+    :param workers: 进程数，默认使用全部CPU核心
+    :return: 输出的文件路径列表
+    """
+    ext = os.path.splitext(output_path)[1].lower()
+    if ext not in RASTER_FORMATS:
+        raise ValueError(f"错误：位图输出只支持 {'/'.join(RASTER_FORMATS)} 文件，当前为 '{output_path}'")
+    if multipage and ext == ".png":
+        raise ValueError("错误：多页输出只支持TIFF文件！")
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if "fork" not in multiprocessing.get_all_start_methods():
+        workers = 1
+    tiff = TiffImagePlugin.AppendingTiffWriter(output_path, True) if multipage else None
+    outputs = [output_path] if multipage else []
+
+    def write(result, side_index):
+        if multipage:
+            tiff.write(result)
+            tiff.newFrame()
+        else:
+            outputs.append(result)
+        print(f"进度：第 {side_index + 1}/{side_count} 面 → {dpi}dpi 位图")
+
+    executor = None
+    try:
+        if workers <= 1:
+            for side_index in range(side_count):
+                write(_render_side(draw_side, side_index, pagesize, dpi,
+                                   output_path, multipage), side_index)
+        else:
+            executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("fork"))
+            # 同时最多 workers * 2 面在绘制，内存占用与总面数无关
+            pending = deque()
+            for side_index in range(side_count):
+                pending.append((side_index, executor.submit(
+                    _render_side, draw_side, side_index, pagesize, dpi,
+                    output_path, multipage)))
+                while len(pending) > workers * 2 or (pending and pending[0][1].done()):
+                    done_index, future = pending.popleft()
+                    write(future.result(), done_index)
+            while pending:
+                done_index, future = pending.popleft()
+                write(future.result(), done_index)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        if tiff is not None:
+            tiff.close()
+    print(f"✅ 位图输出完成：{side_count} 面，{dpi}dpi")
+    print(f"📁 输出路径：{os.path.abspath(outputs[0] if outputs else output_path)}")
+    return outputs
@@ -9,72 +9,31 @@ from PIL import Image
 import os
 import sys
 from PIL import Image, ImageDraw, ImageFont
-import configparser
+import functools
 from reportlab.lib.pagesizes import landscape
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import util
+import rastercanvas
+import bookconfig
+import sizebudget
+import codecselect
+import checkpoint
+import signatures
 
 fold_mode = 2  # 1 左翻页，2 右翻页
 
 def load_config(config_file):
     """
-    从配置文件加载配置
+    从配置文件加载配置，并写入本模块的配置变量（与 dankai 和 booklet 任务使用同一个解析器）
     :param config_file: 配置文件路径
-    :return: 配置对象
+    :return: LayoutConfig 配置对象
     """
-    config = configparser.ConfigParser()
-
-    # 设置默认值
-    config['page'] = {
-        'print_page_size': 'A5',
-        'current_a5_image_count': '1',
-        'line_width': '1',
-        'lr_padding': '16',
-        'center_padding': '16',
-        'pre_none': '0',
-        'start_index_offset': '0',
-        'print_page_index': 'true'
-    }
-
-    # 读取配置文件
-    if os.path.exists(config_file):
-        config.read(config_file, encoding='utf-8')
-    else:
-        raise FileNotFoundError(f"配置文件 {config_file} 不存在")
-
-    # 从配置中读取参数
-    global print_page_size, CURRENT_A5_IMAGE_COUNT
-    global LINE_WIDTH, lr_padding, center_padding, PRE_NONE, start_index_offset
-    global print_page_index, fold_mode, A5_SEQ_MAP, landscape_page_mode
-
-    # 读取配置参数
-    page_size_name = config.get('page', 'print_page_size', fallback='A5')
-    if page_size_name == 'A5':
-        print_page_size = A5
-    else:
-        print_page_size = A4  # 默认为A4
-
-    CURRENT_A5_IMAGE_COUNT = config.getint('page',
-                                           'current_a5_image_count',
-                                           fallback=1)
-    LINE_WIDTH = config.getint('page', 'line_width', fallback=1)
-    lr_padding = config.getint('page', 'lr_padding', fallback=16)
-    center_padding = config.getint('page', 'center_padding', fallback=16)
-    PRE_NONE = config.getint('page', 'pre_none', fallback=0)
-    start_index_offset = config.getint('page',
-                                       'start_index_offset',
-                                       fallback=0)
-    print_page_index = config.getboolean('page',
-                                         'print_page_index',
-                                         fallback=True)
-    fold_mode = config.getint('page', 'fold_mode', fallback=2)
-    landscape_page_mode = config.getboolean('page',
-                                            'landscape_page_mode',
-                                            fallback=True)
+    config = bookconfig.LayoutConfig.from_file(config_file)
+    config.apply(sys.modules[__name__])
 
     print(f"配置信息：")
-    print(f"  - 页面尺寸: {page_size_name}")
+    print(f"  - 页面尺寸: {config.print_page_size}")
     print(f"  - 每个A5页面图片数: {CURRENT_A5_IMAGE_COUNT}")
     print(f"  - 边距: 左右={lr_padding}, 中心={center_padding}")
     print(f"  - 打印页码: {print_page_index}")
@@ -105,9 +64,12 @@ def split_landscape_to_portrait(image_path, output_prefix="split"):
     """
     try:
         # 创建临时目录
-        temp_dir = "temp_split_images"
+        temp_dir = os.path.join(temp_root, "temp_split_images")
         os.makedirs(temp_dir, exist_ok=True)
         with Image.open(image_path) as img:
+            if preview_mode:
+                # 打样预览只需要缩略图，JPEG 直接按小尺寸解码
+                img.draft('RGB', (img.width // 8, img.height // 8))
             # 确保图片是RGB模式，以便可以保存为PNG
             if img.mode in ('P', 'PA'):
                 # P模式(调色板)和PA模式(带alpha通道的调色板)需要特殊处理
@@ -128,13 +90,14 @@ def split_landscape_to_portrait(image_path, output_prefix="split"):
             left_box = (0, 0, mid_point, height)
             left_img = img.crop(left_box)
             # 生成唯一的临时文件名
-            base_name = os.path.splitext(os.path.basename(image_path))[0]
-            left_path = os.path.join(temp_dir, f"{base_name}_left_temp.png")
+            left_path = os.path.join(temp_dir, util.scratch_name(
+                image_path, "_left_temp.png", temp_root, preview_mode))
             left_img.save(left_path, 'PNG')
             # 右半部分
             right_box = (mid_point, 0, width, height)
             right_img = img.crop(right_box)
-            right_path = os.path.join(temp_dir, f"{base_name}_right_temp.png")
+            right_path = os.path.join(temp_dir, util.scratch_name(
+                image_path, "_right_temp.png", temp_root, preview_mode))
             right_img.save(right_path, 'PNG')
             if fold_mode == 1:
                 return left_path, right_path
@@ -170,6 +133,21 @@ start_index_offset = 0
 print_page_index = True
 need_A4_pages = 0
 color_mode = 0  # 0 灰度模式，1 彩色模式
+preview_mode = False  # 打样预览：低分辨率位图，输出 .png 缩略图总览或 .pdf
+raster_dpi = 0  # 位图输出分辨率（300/600），0 表示输出PDF
+raster_multipage = False  # 位图输出是否写成一个多页TIFF
+render_workers = None  # 位图输出的绘制进程数，None 表示全部CPU核心，1 表示在当前进程中绘制（不 fork）
+select_codec = False  # 按内容为非 JPEG 图片选择编码（照片转 JPEG，线稿转黑白/灰度，少色图片用调色板）
+max_output_mb = 0  # 输出文件大小上限（MB），0 表示不限制；超出时自动降低大图片的 JPEG 质量
+temp_root = ""  # 临时图片（横图分割、重新编码）的存放目录，"" 表示当前目录；命令行运行时为本次运行独有的临时目录
+resume = False  # 断点续做：长任务总是按批次保存到 <输出文件名>.resume/，中断后加 --resume 重新运行时跳过已完成的批次
+signature_sheets = 0  # 分帖输出：每帖的纸张数，0 表示输出一个完整的PDF；每帖写成 <文件名>-0001.pdf 等编号文件
+hook_command = None  # 每个输出文件完成后执行的命令（如 lp），{file} 换成文件路径
+# 续做时需要保持不变的配置（变化后丢弃已完成的批次）
+CHECKPOINT_SETTINGS = ("CURRENT_A5_IMAGE_COUNT", "LINE_WIDTH", "lr_padding",
+                       "center_padding", "PRE_NONE", "start_index_offset",
+                       "print_page_index", "fold_mode", "landscape_page_mode",
+                       "color_mode")
 
 
 # 在页面中央绘制一条黑色虚线，分隔两个A5区域
@@ -236,6 +214,7 @@ def generate_pdf_from_images(image_folder: str, output_pdf: str, pagesize=A4):
         raise RuntimeError(f"错误：文件夹 '{image_folder}' 中未找到任何有效图片！")
     # 按文件名自然排序（保证图片顺序可控）
     image_files.sort(key=lambda x: os.path.basename(x))
+    source_files = list(image_files)
 
     # 重新组织图片：
     # 如果是 A5_IMAGES_1 或者 A5_IMAGES_4 ，如果原始图片里面有横图，则将图片分割为2张竖图
@@ -261,6 +240,15 @@ def generate_pdf_from_images(image_folder: str, output_pdf: str, pagesize=A4):
         image_files = new_image_files
 
     print(f"提示：共找到 {len(image_files)} 张有效图片（包含分割后的图片）")
+    if select_codec and not preview_mode and not raster_dpi:
+        # 按内容选择编码，PNG 等图片不再一律按 RGB 嵌入
+        image_files = codecselect.select_codecs(
+            image_files, temp_dir=os.path.join(temp_root, codecselect.TEMP_DIR))
+    if max_output_mb > 0 and not preview_mode and not raster_dpi:
+        # 按输出大小上限重新压缩过大的图片
+        image_files = sizebudget.fit_images(
+            image_files, max_output_mb,
+            temp_dir=os.path.join(temp_root, sizebudget.TEMP_DIR))
 
     # 前面补None，方便后续处理
     image_files = [None] * PRE_NONE + image_files
@@ -291,73 +279,117 @@ def generate_pdf_from_images(image_folder: str, output_pdf: str, pagesize=A4):
     # --------------- 第四步：初始化PDF画布（横向A4） ---------------
     if landscape_page_mode:
         pagesize = landscape(pagesize)
-        c = canvas.Canvas(output_pdf, pagesize=pagesize)
-    else:
-        c = canvas.Canvas(output_pdf, pagesize=pagesize)
     page_width, page_height = pagesize  # 获取页面尺寸（单位：点，1点=1/72英寸）
-
-    # A5区域尺寸（每个A5区域是A4页面的一半）
-    a5_width = page_width / 2
-    a5_height = page_height
+    if raster_dpi:
+        # 位图输出：每一面直接合成为PNG/TIFF，不生成PDF
+        rastercanvas.render_sides(
+            functools.partial(draw_pdf_page, image_files=image_files,
+                              page_width=page_width, page_height=page_height),
+            total_pdf_pages_needed, pagesize, output_pdf, raster_dpi,
+            raster_multipage, render_workers)
+        return
+
+    def draw_side(c, pdf_page_index):
+        draw_pdf_page(c, pdf_page_index, image_files, page_width, page_height)
+        print(
+            f"进度：第 {pdf_page_index+1} 页PDF → 已处理PDF页面 {pdf_page_index + 1}/{total_pdf_pages_needed}"
+        )
 
     # --------------- 第五步：处理每页PDF并添加到PDF ---------------
     # 迭代PDF页面而不是图片
-    for pdf_page_index in range(total_pdf_pages_needed):
-
-        if landscape_page_mode:  #水平画左右
-            draw_center_divider_line(c, page_width, page_height)
-            # 确定当前页面的A5区域位置
-            front_a5_x, front_a5_y = 0, 0
-            back_a5_x, back_a5_y = a5_width, 0
-            left_a5, right_a5 = 0, 1
-            # 根据配置绘制图片
-            draw_images_in_a5_region(
-                canvas_obj=c,
-                image_files=image_files,
-                left_or_right=left_a5,  # 正面A5区域索引
-                x_offset=front_a5_x,
-                y_offset=front_a5_y,
-                a5_width=a5_width,
-                a5_height=a5_height,
-                pdf_page_index=pdf_page_index)
-
-            draw_images_in_a5_region(
-                canvas_obj=c,
-                image_files=image_files,
-                left_or_right=right_a5,  # 背面A5区域索引
-                x_offset=back_a5_x,
-                y_offset=back_a5_y,
-                a5_width=a5_width,
-                a5_height=a5_height,
-                pdf_page_index=pdf_page_index)
-            print(
-                f"进度：第 {pdf_page_index+1} 页PDF → 已处理PDF页面 {pdf_page_index + 1}/{total_pdf_pages_needed}"
-            )
-        else:
-            draw_2x2_in_single_page(canvas_obj=c,
-                                    image_files=image_files,
-                                    x_offset=0,
-                                    y_offset=0,
-                                    a5_width=page_width,
-                                    a5_height=page_height,
-                                    pdf_page_index=pdf_page_index)
-            print(
-                f"进度：第 {pdf_page_index+1} 页PDF → 已处理PDF页面 {pdf_page_index + 1}/{total_pdf_pages_needed}"
-            )
-        c.showPage()
+    written = None
+    if signature_sheets > 0 and not preview_mode:
+        # 分帖输出：每帖写成一个编号的PDF，写完就可以开始打印
+        written = signatures.render_signatures(
+            draw_side, [output_pdf] * total_pdf_pages_needed, pagesize,
+            signature_sheets, hook_command)
+    elif checkpoint.is_long(total_pdf_pages_needed) and not preview_mode:
+        # 长任务：按批次保存到工作目录，续做时跳过上次已完成的批次，最后合并
+        side_outputs = [output_pdf] * total_pdf_pages_needed
+        state = {
+            "sources": checkpoint.file_signature(source_files),
+            "images": checkpoint.scratch_relative(image_files, temp_root),
+            "pagesize": pagesize,
+            "settings": {name: globals()[name] for name in CHECKPOINT_SETTINGS},
+        }
+        checkpoint.render_sides(draw_side, side_outputs, pagesize, state,
+                                checkpoint.work_dir_for(output_pdf), resume)
+    else:
+        c = rastercanvas.make_canvas(output_pdf, pagesize, preview_mode)
+        for pdf_page_index in range(total_pdf_pages_needed):
+            draw_side(c, pdf_page_index)
+            c.showPage()
 
-    # --------------- 第六步：保存PDF文件 ---------------
-    c.showPage()
-    c.save()
+        # --------------- 第六步：保存PDF文件 ---------------
+        c.showPage()
+        c.save()
+    if max_output_mb > 0 and not preview_mode:
+        # 按实际大小检查输出预算（超出时报错退出，不执行钩子命令）
+        sizebudget.check_outputs(written or [output_pdf], max_output_mb)
     print(f"\n✅ PDF生成完成！")
-    print(f"📁 输出路径：{os.path.abspath(output_pdf)}")
-    print(f"📄 PDF页数：{total_pdf_pages_needed}")
+    if written is not None:
+        print(f"📁 分帖输出：{len(written)} 个文件，每帖 {signature_sheets} 张纸，按编号顺序打印")
+    else:
+        print(f"📁 输出路径：{os.path.abspath(output_pdf)}")
+        print(f"📄 PDF页数：{total_pdf_pages_needed}")
+        if hook_command:
+            signatures.run_hook(hook_command, output_pdf)
     print(f"📘 打印说明：")
     print(f"   1. 横向打印A4纸张")
     print(f"   2. 每页PDF包含{images_per_pdf_page}张图片")
     print(f"   3. 打印完成后对折装订成A5册子")
 
 
+def draw_pdf_page(canvas_obj, pdf_page_index, image_files, page_width,
+                  page_height):
+    """
+    绘制一页PDF（打印纸的一面），PDF输出和位图输出共用
+    :param canvas_obj: 画布对象（reportlab 画布或位图画布）
+    :param pdf_page_index: 当前PDF页面索引
+    :param image_files: 所有图片文件列表
+    :param page_width: 页面宽度
+    :param page_height: 页面高度
+    """
+    # A5区域尺寸（每个A5区域是A4页面的一半）
+    a5_width = page_width / 2
+    a5_height = page_height
+
+    if landscape_page_mode:  #水平画左右
+        draw_center_divider_line(canvas_obj, page_width, page_height)
+        # 确定当前页面的A5区域位置
+        front_a5_x, front_a5_y = 0, 0
+        back_a5_x, back_a5_y = a5_width, 0
+        left_a5, right_a5 = 0, 1
+        # 根据配置绘制图片
+        draw_images_in_a5_region(
+            canvas_obj=canvas_obj,
+            image_files=image_files,
+            left_or_right=left_a5,  # 正面A5区域索引
+            x_offset=front_a5_x,
+            y_offset=front_a5_y,
+            a5_width=a5_width,
+            a5_height=a5_height,
+            pdf_page_index=pdf_page_index)
+
+        draw_images_in_a5_region(
+            canvas_obj=canvas_obj,
+            image_files=image_files,
+            left_or_right=right_a5,  # 背面A5区域索引
+            x_offset=back_a5_x,
+            y_offset=back_a5_y,
+            a5_width=a5_width,
+            a5_height=a5_height,
+            pdf_page_index=pdf_page_index)
+    else:
+        draw_2x2_in_single_page(canvas_obj=canvas_obj,
+                                image_files=image_files,
+                                x_offset=0,
+                                y_offset=0,
+                                a5_width=page_width,
+                                a5_height=page_height,
+                                pdf_page_index=pdf_page_index)
+
+
 def draw_2x2_in_single_page(canvas_obj, image_files, x_offset, y_offset,
                             a5_width, a5_height, pdf_page_index):
     """
@@ -748,29 +780,56 @@ def draw_images_in_a5_region(canvas_obj, image_files, left_or_right, x_offset,
 # --------------- 命令行调用入口 ---------------
 if __name__ == "__main__":
     # 检查命令行参数数量
-    if len(sys.argv) < 4:
+    args = sys.argv[1:]
+    preview_mode = util.pop_flag(args, "--preview")
+    raster_dpi = int(util.pop_option(args, "--raster", 0))
+    raster_multipage = util.pop_flag(args, "--multipage")
+    max_mb = util.pop_option(args, "--max-mb")
+    select_codec = util.pop_flag(args, "--select-codec")
+    resume = util.pop_flag(args, "--resume")
+    signature_sheets = int(util.pop_option(args, "--signatures", signature_sheets))
+    hook_command = util.pop_option(args, "--hook")
+    if len(args) < 3:
         print("❌ 参数错误！正确用法：")
         print(
-            f"python {os.path.basename(__file__)} <图片文件夹路径> <输出PDF文件路径> <配置文件路径>"
+            f"python {os.path.basename(__file__)} <图片文件夹路径> <输出PDF文件路径> <配置文件路径> [颜色模式] [--preview] [--raster 300|600 [--multipage]] [--max-mb 200] [--select-codec] [--resume] [--signatures 5] [--hook 命令]"
         )
         print("示例：")
         print(
             f"python {os.path.basename(__file__)} ./images ./output.pdf config.ini"
         )
+        print(
+            f"python {os.path.basename(__file__)} ./images ./proof.png config.ini --preview"
+        )
+        print(
+            f"python {os.path.basename(__file__)} ./images ./sheets.tif config.ini --raster 600 --multipage"
+        )
+        print("--preview 打样预览：低分辨率快速检查拼版和页序，输出 .png 缩略图总览或 .pdf 小文件")
+        print("--raster 位图输出：每一面纸直接合成为指定分辨率的 .png/.tif 文件（<文件名>-0001.png）")
+        print("--multipage 与 --raster 一起使用，所有面写进同一个多页TIFF")
+        print("--select-codec 按内容为 PNG 等图片选择编码：照片转 JPEG，线稿转黑白，灰度图转单通道，少色图片用调色板")
+        print("--max-mb 输出文件大小上限（MB），超出时自动降低大图片的 JPEG 质量（也可在配置文件中设置 max_output_mb）")
+        print(f"--resume 断点续做：超过 {checkpoint.BATCH_SHEETS} 张纸的任务每 {checkpoint.BATCH_SHEETS} 张纸保存一次到 <输出文件名>.resume/，中断后用同样的命令加 --resume 重新运行，从最后完成的批次继续")
+        print("--signatures 分帖输出：每N张纸写成一个编号的PDF（<文件名>-0001.pdf），写完一帖就可以开始打印")
+        print("--hook 每个输出文件完成后执行的命令，如 --hook \"lp -d office\"（文件路径加在末尾，或用 {file} 指定位置）")
         sys.exit(1)
 
     # 获取命令行参数
-    input_folder = sys.argv[1]
-    output_file = sys.argv[2]
-    config_file = sys.argv[3]
+    input_folder = args[0]
+    output_file = args[1]
+    config_file = args[2]
     # 加载配置
     config = load_config(config_file)
-    if len(sys.argv) == 5:
-        color_mode = int(sys.argv[4])
+    if max_mb is not None:
+        max_output_mb = float(max_mb)
+    if len(args) == 4:
+        color_mode = int(args[3])
     else:
         color_mode = 0
     try:
-        generate_pdf_from_images(input_folder, output_file, print_page_size)
+        # 中间文件放在本次运行独有的临时目录中，结束后自动删除
+        with util.scratch_dir("shuangkai-") as temp_root:
+            generate_pdf_from_images(input_folder, output_file, print_page_size)
     except Exception as e:
         print(f"\n❌ 生成失败：{str(e)}")
         sys.exit(1)
@@ -0,0 +1,112 @@
+#  分帖输出：整本册子要等到 save() 才写出PDF，最后一张图片编码完之前没法开始打印
+#  分帖模式下每完成一帖（若干张纸，按顺序叠起来与整本输出相同）就写成一个编号的PDF：<文件名>-0001.pdf、-0002.pdf……
+#  可选的钩子命令（如 lp）对每个文件执行一次，在后台按文件顺序执行，不耽误后面的生成；
+#  命令中的 {file} 换成文件路径，没有 {file} 时把路径加在命令末尾
+
+import os
+import shlex
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import rastercanvas
+
+# 每帖的纸张数（与 dankai2a4 每5张A4纸一册相同）
+SIGNATURE_SHEETS = 5
+
+
+def signature_path(output_path, number):
+    """
+    第 number 帖的文件路径（从1开始）：<输出文件名>-0001.pdf
+    """
+    base, ext = os.path.splitext(output_path)
+    return f"{base}-{number:04d}{ext}"
+
+
+def run_hook(command, path):
+    """
+    对一个文件执行钩子命令
+    :return: 命令的返回码
+    """
+    args = shlex.split(command)
+    if any("{file}" in arg for arg in args):
+        args = [arg.replace("{file}", path) for arg in args]
+    else:
+        args.append(path)
+    try:
+        returncode = subprocess.run(args).returncode
+    except OSError as e:
+        print(f"⚠️ 钩子命令无法执行：{' '.join(args)}（{e}）")
+        return -1
+    if returncode:
+        print(f"⚠️ 钩子命令失败（返回 {returncode}）：{' '.join(args)}")
+    else:
+        print(f"🖨️ 钩子命令完成：{' '.join(args)}")
+    return returncode
+
+
+class HookRunner:
+    """
+    在后台线程中按提交顺序执行钩子命令（打印机要按顺序收到文件）
+    """
+
+    def __init__(self, command=None):
+        """
+        :param command: 钩子命令，None 表示不执行
+        """
+        self.command = command
+        self.executor = ThreadPoolExecutor(max_workers=1) if command else None
+        self.futures = []
+
+    def submit(self, path):
+        if self.executor is not None:
+            self.futures.append(self.executor.submit(run_hook, self.command, path))
+
+    def wait(self):
+        """
+        等待所有钩子命令执行完
+        :return: 失败的命令数
+        """
+        if self.executor is None:
+            return 0
+        self.executor.shutdown(wait=True)
+        return sum(1 for future in self.futures if future.result() != 0)
+
+
+def render_signatures(draw_side, side_outputs, pagesize, sheets=SIGNATURE_SHEETS,
+                      hook=None):
+    """
+    分帖绘制：每 sheets 张纸保存为一个编号的PDF，保存后立即执行钩子命令
+    :param draw_side: draw_side(画布, 面索引)，绘制一面（不调用 showPage）
+    :param side_outputs: 每一面的输出路径（自动分色时彩色/黑白分别编号）
+    :param pagesize: 页面尺寸
+    :param sheets: 每帖的纸张数
+    :param hook: 钩子命令
+    :return: 按完成顺序排列的文件列表
+    """
+    hooks = HookRunner(hook)
+    numbers = {}
+    written = []
+    try:
+        for start in range(0, len(side_outputs), sheets * 2):
+            canvases = {}
+            for side_index in range(start, min(len(side_outputs), start + sheets * 2)):
+                output_path = side_outputs[side_index]
+                if output_path not in canvases:
+                    numbers[output_path] = numbers.get(output_path, 0) + 1
+                    path = signature_path(output_path, numbers[output_path])
+                    canvases[output_path] = (path, rastercanvas.make_canvas(path, pagesize))
+                c = canvases[output_path][1]
+                draw_side(c, side_index)
+                c.showPage()
+            for path, c in canvases.values():
+                c.save()
+                print(f"📤 分帖完成：{os.path.abspath(path)}")
+                written.append(path)
+                hooks.submit(path)
+    finally:
+        failed = hooks.wait()
+    if failed:
+        print(f"⚠️ {failed} 个文件的钩子命令失败")
+    return written
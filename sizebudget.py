@@ -0,0 +1,173 @@
+#  输出大小预算：打印机的缓冲区有大小限制（如 200MB），册子PDF要控制在限制以内
+#  按图片的文件大小估算PDF大小（JPEG 原样嵌入，其他格式按压缩后的大小估算），
+#  超出预算时给每张图片分配字节预算：小于预算的图片原样使用，大图片在线程池中
+#  二分查找能放进预算的最高 JPEG 质量，重新压缩后的图片放在临时目录中
+
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+from reportlab import rl_config
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import util
+
+# 预算中留给PDF结构、页码文字等的比例
+OVERHEAD_RATIO = 0.03
+# 每张图片在PDF中的额外开销（字节）
+IMAGE_OVERHEAD = 2048
+# reportlab 默认用 ASCII85 编码图片数据，嵌入后是原来的 5/4
+EMBED_RATIO = 1.25 if rl_config.useA85 else 1.0
+# JPEG 质量的查找范围
+QUALITY_MAX = 95
+QUALITY_MIN = 30
+# 不降低色度采样时能达到这个质量就使用 4:4:4，否则再试 4:2:0
+SUBSAMPLING_QUALITY = 80
+# 重新压缩的图片存放目录
+TEMP_DIR = "temp_budget_images"
+
+
+def image_budgets(sizes, budget):
+    """
+    分配每张图片的字节预算：所有图片使用同一个上限，小于上限的图片保持原样，
+    上限取能让总大小不超过预算的最大值
+    :param sizes: 每张图片的估计大小（字节）
+    :param budget: 所有图片的总预算（字节）
+    :return: 上限（字节），总大小本来就不超过预算时返回 None
+    """
+    sizes = np.sort(np.asarray(sizes, dtype=np.float64))
+    if sizes.sum() <= budget:
+        return None
+    # 上限落在 sizes[k-1] 和 sizes[k] 之间时：前 k 张原样，其余 n-k 张各用上限
+    n = len(sizes)
+    below = np.concatenate(([0.0], np.cumsum(sizes)))[:n]
+    caps = (budget - below) / (n - np.arange(n))
+    k = np.flatnonzero(caps <= sizes)[0]
+    return max(0, int(caps[k]))
+
+
+def encode_jpeg(img, quality, subsampling):
+    data = io.BytesIO()
+    img.save(data, 'JPEG', quality=quality, subsampling=subsampling,
+             optimize=True)
+    return data.getvalue()
+
+
+def search_quality(img, target, subsampling):
+    """
+    二分查找不超过 target 字节的最高 JPEG 质量
+    :return: (质量, JPEG数据)，最低质量也放不下时返回 None
+    """
+    best = None
+    low, high = QUALITY_MIN, QUALITY_MAX
+    while low <= high:
+        quality = (low + high) // 2
+        data = encode_jpeg(img, quality, subsampling)
+        if len(data) <= target:
+            best = (quality, data)
+            low = quality + 1
+        else:
+            high = quality - 1
+    return best
+
+
+def fit_image(image_path, target, temp_dir=TEMP_DIR):
+    """
+    把一张图片重新压缩到 target 字节以内
+    :return: (新图片路径, 质量, 色度采样, 大小)
+    """
+    with Image.open(image_path) as img:
+        img = img.convert('L' if img.mode in ('L', '1', 'LA', 'I;16') else 'RGB')
+    # 4:4:4 能保持较高质量时优先使用，否则试 4:2:0（灰度图片没有色度）
+    found = search_quality(img, target, 0)
+    subsampling = 0
+    if img.mode == 'RGB' and (found is None or found[0] < SUBSAMPLING_QUALITY):
+        reduced = search_quality(img, target, 2)
+        if reduced is not None and (found is None or reduced[0] > found[0]):
+            found, subsampling = reduced, 2
+    if found is None:
+        # 最低质量也放不下：用最低质量，整体可能超出预算
+        subsampling = 2 if img.mode == 'RGB' else 0
+        found = (QUALITY_MIN, encode_jpeg(img, QUALITY_MIN, subsampling))
+    quality, data = found
+    os.makedirs(temp_dir, exist_ok=True)
+    # temp_dir 在任务的临时目录中，同一张图片按不同的预算（不同配置）压缩时保存为不同的文件
+    output_path = os.path.join(temp_dir, util.scratch_name(
+        image_path, "_budget.jpg", os.path.dirname(temp_dir), target))
+    with open(output_path, 'wb') as f:
+        f.write(data)
+    return output_path, quality, subsampling, len(data)
+
+
+def fit_images(image_files, max_output_mb, catalog=None, workers=None,
+               temp_dir=TEMP_DIR):
+    """
+    让所有图片嵌入PDF后的总大小不超过 max_output_mb
+    :param image_files: 图片路径列表（可以包含 None 占位）
+    :param max_output_mb: 输出文件大小上限（MB）
+    :param catalog: ImageCatalog 对象，多配置运行时共用压缩结果
+    :param workers: 压缩线程数，默认使用全部CPU核心
+    :return: 新的图片路径列表，超出预算的图片换成重新压缩后的路径
+    """
+    paths = list(dict.fromkeys(path for path in image_files if path is not None))
+    if not paths:
+        return image_files
+    sizes = [os.path.getsize(path) * EMBED_RATIO + IMAGE_OVERHEAD for path in paths]
+    budget = max_output_mb * 1024 * 1024 * (1 - OVERHEAD_RATIO)
+    cap = image_budgets(sizes, budget)
+    total_mb = sum(sizes) / 1024 / 1024
+    if cap is None:
+        print(f"📦 输出预算 {max_output_mb:g}MB：估计 {total_mb:.1f}MB，图片保持原样")
+        return image_files
+
+    target = int((cap - IMAGE_OVERHEAD) / EMBED_RATIO)
+    todo = [path for path, size in zip(paths, sizes) if size > cap]
+    results = {}
+    pending = []
+    for path in todo:
+        key = ("budget", path, target, temp_dir)
+        result = catalog.get_derived(key) if catalog else None
+        if result is None:
+            pending.append(path)
+        else:
+            results[path] = result
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+        for path, result in zip(pending, executor.map(
+                lambda path: fit_image(path, target, temp_dir), pending)):
+            results[path] = result
+            if catalog is not None:
+                catalog.derived(("budget", path, target, temp_dir), lambda: result)
+    if catalog is not None:
+        for output_path, quality, _, _ in results.values():
+            catalog.jpeg_quality[output_path] = quality
+
+    fitted = sum(size for path, size in zip(paths, sizes) if path not in results)
+    fitted += sum(result[3] * EMBED_RATIO + IMAGE_OVERHEAD
+                  for result in results.values())
+    qualities = [result[1] for result in results.values()]
+    print(f"📦 输出预算 {max_output_mb:g}MB：估计 {total_mb:.1f}MB，"
+          f"重新压缩 {len(results)} 张（每张不超过 {target / 1024:.0f}KB，"
+          f"质量 {min(qualities)}~{max(qualities)}），预计 {fitted / 1024 / 1024:.1f}MB")
+    if fitted > budget:
+        raise RuntimeError(f"错误：最低质量 {QUALITY_MIN} 仍超出输出预算 {max_output_mb:g}MB"
+                           f"（预计 {fitted / 1024 / 1024:.1f}MB），请减少页数或提高上限")
+    return [results[path][0] if path in results else path for path in image_files]
+
+
+def check_outputs(output_paths, max_output_mb):
+    """
+    生成后检查输出文件的实际大小（预算按估计值分配，自动分色等还会改变图片），
+    任何一个文件超出上限时抛出 RuntimeError
+    :param output_paths: 输出文件路径列表
+    :param max_output_mb: 输出文件大小上限（MB）
+    """
+    limit = max_output_mb * 1024 * 1024
+    over = [(path, os.path.getsize(path)) for path in output_paths
+            if os.path.getsize(path) > limit]
+    if over:
+        raise RuntimeError(f"错误：输出文件超出大小上限 {max_output_mb:g}MB："
+                           + "，".join(f"{os.path.basename(path)} {size / 1024 / 1024:.1f}MB"
+                                       for path, size in over))
@@ -31,6 +31,17 @@ function splitpic() {
     # 设置fuzz值，用于定义"白色"的范围
     local fuzz_value="40%"
 
+    # 分割用的临时目录，每次运行独有（不在目标目录中用固定的文件名，同时运行不会互相覆盖）
+    local scratch
+    scratch=$(mktemp -d "${TMPDIR:-/tmp}/splitpic.XXXXXX")
+    # 出错、Ctrl-C 退出（EXIT）或函数返回（RETURN）时都删除临时目录；
+    # 函数被 source 到交互式 shell 中使用时，返回后恢复原来的 EXIT 处理
+    local cleanup previous_exit
+    cleanup="rm -rf $(printf '%q' "$scratch")"
+    previous_exit=$(trap -p EXIT)
+    trap "$cleanup" EXIT
+    trap "$cleanup; ${previous_exit:-trap - EXIT}; trap - RETURN" RETURN
+
     # 遍历源目录中的所有图片文件，按文件名排序
     for img_ext in "${img_extensions[@]}"; do
         for img_file in $(find "$src_dir" -maxdepth 1 -name "$img_ext" -type f | sort); do
@@ -59,11 +70,11 @@ function splitpic() {
                     local right_part="${dst_dir}/${filename_no_ext}-1.png"
                     
                     # 分割图片
-                    convert "$img_file" -crop ${half_width}x+0+0 +repage "${dst_dir}/temp_left.png"
-                    convert "$img_file" -crop ${half_width}x+${half_width}+0 +repage "${dst_dir}/temp_right.png"
+                    convert "$img_file" -crop ${half_width}x+0+0 +repage "${scratch}/temp_left.png"
+                    convert "$img_file" -crop ${half_width}x+${half_width}+0 +repage "${scratch}/temp_right.png"
                     
                     # 使用magick命令移除白色边缘并保存为PNG格式
-                    if magick "${dst_dir}/temp_left.png" \
+                    if magick "${scratch}/temp_left.png" \
                         -fuzz "$fuzz_value" \
                         -trim \
                         +repage \
@@ -71,10 +82,10 @@ function splitpic() {
                         echo "左半部分处理成功: $left_part"
                     else
                         echo "左半部分处理失败，使用默认输出"
-                        mv "${dst_dir}/temp_left.png" "$left_part"
+                        mv "${scratch}/temp_left.png" "$left_part"
                     fi
 
-                    if magick "${dst_dir}/temp_right.png" \
+                    if magick "${scratch}/temp_right.png" \
                         -fuzz "$fuzz_value" \
                         -trim \
                         +repage \
@@ -82,11 +93,11 @@ function splitpic() {
                         echo "右半部分处理成功: $right_part"
                     else
                         echo "右半部分处理失败，使用默认输出"
-                        mv "${dst_dir}/temp_right.png" "$right_part"
+                        mv "${scratch}/temp_right.png" "$right_part"
                     fi
 
                     # 清理临时文件
-                    rm -f "${dst_dir}/temp_left.png" "${dst_dir}/temp_right.png"
+                    rm -f "${scratch}/temp_left.png" "${scratch}/temp_right.png"
                 fi
 
                 echo "完成处理: $filename"
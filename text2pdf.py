@@ -5,7 +5,6 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 import os
 import sys
-import re
 
 
 # 尝试导入 PyPDF2 用于合并 PDF
@@ -21,6 +20,8 @@ except ImportError:
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import util
+import txtsource
+import textlayout
 
 # ==================== 配置常量 ====================
 # 页面配置
@@ -47,181 +48,76 @@ A6_HEIGHT = PAGE_HEIGHT / 2
 
 # 文本渲染配置
 TEXT_FONT_SIZE = 10
+TITLE_FONT_SIZE = 12
 TEXT_LINE_SPACE = 3
 MARGIN = 10  # 区域内边距
+# 文本开头和空行之后的段落首行缩进
+INDENT = "    "
+# 没有标题的长文本每隔多少行切成一个排版单元，进程池中排队的文本量与书的长度无关
+CHAPTER_MAX_LINES = 2000
+# 章节排版进程数，None 表示使用全部CPU核心，1 表示不使用进程池
+layout_workers = None
 
 
-def read_text_file(file_path):
+def current_typography():
     """
-    读取txt文件内容
-    :param file_path: txt文件路径
-    :return: 文件内容字符串
+    汇总排版参数，换行和A6区域分配由 textlayout 完成（与 epub2pdf 共用两阶段排版）
+    西文按单词换行，行首保留原文的空白
+    :return: 排版参数字典
     """
-    with open(file_path, 'r', encoding='utf-8') as file:
-        content = file.read()
-    return content
-
-
-
-def draw_text_in_a6_region_with_cursor(canvas_obj,
-                                       text,
-                                       start_cursor,
-                                       x,
-                                       y,
-                                       width,
-                                       height,
-                                       font_size=TEXT_FONT_SIZE,
-                                       font_name=DEFAULT_FONT):
+    return {
+        "font_name": DEFAULT_FONT,
+        "font_path": FONT_PATH if DEFAULT_FONT == FONT_NAME else "",
+        "font_size": TEXT_FONT_SIZE,
+        "title_size": TITLE_FONT_SIZE,
+        "line_space": TEXT_LINE_SPACE,
+        "indent": INDENT,
+        "max_width": A6_WIDTH - 2 * MARGIN,
+        "region_top": A6_HEIGHT - MARGIN,
+        "region_bottom": MARGIN,
+        "word_wrap": True,
+    }
+
+
+def txt_chapters(lines):
     """
-    在指定的A6区域内绘制文本，使用游标模式
-    :param canvas_obj: PDF画布对象
-    :param text: 完整文本内容
-    :param start_cursor: 开始位置游标
-    :param x: 区域左下角x坐标
-    :param y: 区域左下角y坐标
-    :param width: 区域宽度
-    :param height: 区域高度
-    :param font_size: 字体大小
-    :param font_name: 字体名称
-    :return: (end_cursor, has_more_text) - 结束游标位置和是否还有更多文本
+    把txt的行转换成 textlayout 的章节（段落列表），逐行读取，不把整本书读入内存
+    标题行开始新的章节，没有标题的长文本每 CHAPTER_MAX_LINES 行切开；
+    文本开头和空行之后的行首行缩进，其余行原样换行，空行占一行高度
+    :param lines: 行文本迭代器
+    :return: 段落列表迭代器
     """
-    # 设置字体
-    canvas_obj.setFont(font_name, font_size)
-
-    # 文本边距
-    margin = MARGIN
-    available_width = width - 2 * margin
-    available_height = height - 2 * margin
-
-    # 绘制文本行
-    text_y = y + height - margin  # 从顶部开始
-    line_height = font_size + TEXT_LINE_SPACE
-
-    current_cursor = start_cursor
-
-    # 逐行处理文本直到区域用完或文本处理完毕
-    while current_cursor < len(text) and (text_y - line_height) >= (y +
-                                                                    margin):
-        # 检查是否是新段落的开始
-        # 检查是否是段落开头（在游标位置之前的前两个字符是'\n\n'，或游标在文本开头）
-        is_paragraph_start = (
-            current_cursor == 0 or  # 文本开头
-            (current_cursor >= 2
-             and text[current_cursor - 2:current_cursor] == '\n\n')  # 段落分隔后
-        )
-
-        # 找到当前行的文本
-        line_start = current_cursor
-        line_end = line_start
+    chapter = []
+    paragraph_start = True
+    for line in lines:
+        text = line.rstrip('\r\n')
+        if not text.strip():
+            chapter.append(("br", ""))
+            paragraph_start = True
+            continue
+        if chapter and (textlayout.check_is_title(text) or
+                        len(chapter) >= CHAPTER_MAX_LINES):
+            yield chapter
+            chapter = []
+        chapter.append(("l", INDENT + text if paragraph_start else text))
+        paragraph_start = False
+    if chapter:
+        yield chapter
 
-        # 确定当前行是否需要缩进，计算可用宽度
-        if is_paragraph_start:
-            indent_text = "    "  # 4个空格缩进
-            current_line_available_width = available_width - canvas_obj.stringWidth(
-                indent_text, font_name, font_size)
-        else:
-            current_line_available_width = available_width
-
-        # 寻找合适的换行点
-        while line_end < len(text):
-            # 检查是否遇到换行符
-            if text[line_end] == '\n':
-                line_end += 1  # 包含换行符
-                break
-
-            # 检查当前行的宽度
-            test_line = text[line_start:line_end + 1]
-            # 检查是否新段落开始
-            if '\n\n' in test_line and test_line.rindex(
-                    '\n\n') == len(test_line) - 2:
-                # 如果当前行包含段落结束符，截断到段落结束符
-                line_end = line_start + test_line.rindex('\n\n')
-                break
-
-            line_width = canvas_obj.stringWidth(test_line, font_name,
-                                                font_size)
-
-            # 如果当前行宽度超过可用宽度，回退到上一个合适的断点
-            if line_width > current_line_available_width:
-                if line_end == line_start:
-                    # 单个字符就超宽，强制换行
-                    line_end += 1
-                    break
-                else:
-                    # 找到上一个空格作为断点
-                    space_pos = test_line.rfind(' ')
-                    if space_pos > 0:
-                        line_end = line_start + space_pos + 1
-                    else:
-                        # 没有空格，强制在当前字符处断开
-                        line_end -= 1
-                    break
-            else:
-                line_end += 1
-
-        # 获取当前行文本
-        current_line = text[line_start:line_end].rstrip('\n')
-
-        # 检查是否遇到段落分隔符
-        if '\n\n' in current_line:
-            paragraph_end_pos = current_line.index('\n\n')
-            current_line = current_line[:paragraph_end_pos]
-            # 修正游标位置，确保下一次处理从新段落开始
-            actual_end = line_start + paragraph_end_pos + 2  # 加上'\n\n'的长度
-        else:
-            actual_end = line_end
-
-        # 绘制当前行
-        if current_line:
-            # 检查是否为章节标题（第x章 或 第x回 开头）
-            chapter_pattern = r'^第[一二三四五六七八九十零\d]+[章节回篇卷].*'
-            if re.match(chapter_pattern, current_line.strip()):
-                # 设置章节标题字体大小
-                title_font_size = 12
-                canvas_obj.setFont(font_name, title_font_size)
-                
-                # 居中显示
-                text_width = canvas_obj.stringWidth(current_line, font_name, title_font_size)
-                center_x = x + (width - text_width) / 2
-                text_y -= line_height
-                canvas_obj.drawString(center_x, text_y - title_font_size, current_line)
-                # 恢复默认字体大小
-                canvas_obj.setFont(font_name, font_size)
-            else:
-                # 普通文本处理
-                if is_paragraph_start:
-                    # 第一行添加缩进
-                    indented_line = "    " + current_line  # 4个空格缩进
-                    canvas_obj.drawString(x + margin, text_y - font_size,
-                                          indented_line)
-                else:
-                    # 非第一行不添加缩进
-                    canvas_obj.drawString(x + margin, text_y - font_size,
-                                          current_line)
-
-        # 更新游标和Y坐标
-        current_cursor = actual_end
-        text_y -= line_height
-
-        # 检查是否已经处理完整个文本
-        if current_cursor >= len(text):
-            break
-
-    # 返回结束游标和是否还有更多文本
-    has_more_text = current_cursor < len(text)
-    return current_cursor, has_more_text
 
 def generate_custom_order_pdfs(text_file_path, front_pdf, back_pdf,
                                render_order):
     """
     从txt文件生成两个PDF（正面和背面），按照自定义顺序交替渲染内容
+    章节在进程池中并行拆分成行，再顺序分配A6区域并绘制
     :param text_file_path: txt文件路径
     :param front_pdf: 正面PDF文件路径
     :param back_pdf: 背面PDF文件路径
     :param render_order: 渲染顺序列表，包含8个元素，每个元素是(页码, 位置索引)的元组
     """
-    # 读取txt文件
-    text_content = read_text_file(text_file_path)
+    # 逐行读取txt文件（自动探测 UTF-8 / GBK / GB18030 / Big5 编码，内存映射，不把整本书读入内存）
+    source = txtsource.TextSource(text_file_path)
+    print(f"文本编码：{source.encoding}")
 
     # 初始化两个PDF画布（A4竖版）
     front_c = canvas.Canvas(front_pdf, pagesize=A4)
@@ -243,50 +139,62 @@ def generate_custom_order_pdfs(text_file_path, front_pdf, back_pdf,
         ]
     ]
 
-    cursor = 0  # 初始化游标
-    has_more_text = True
+    # 区域内所有行写进同一个文本对象，字体只在标题和正文切换时设置
+    region_text = util.RegionText()
     sheet_count = 0  # 双面打印对计数器
-    a6_index = 0
-
-    while has_more_text:
-        print(f"正在处理第 {sheet_count + 1} 个双面打印对...")
+    started = -1  # 已经开始绘制的最后一个A6区域
+
+    def a6_region(a6_index):
+        """
+        开始绘制到指定的A6区域（依次绘制经过的区域边框，每8个区域换一张纸）
+        :return: (画布, 区域左下角x坐标, 区域左下角y坐标)
+        """
+        nonlocal started, sheet_count
+        while started < a6_index:
+            started += 1
+            region_text.flush()
+            if started > 0 and started % 8 == 0:
+                front_c.showPage()
+                back_c.showPage()
+                sheet_count += 1
+            print(f"正在处理第 {sheet_count + 1} 个双面打印对...")
+            page_idx, pos_idx = render_order[started % 8]
+            print(f"  渲染第 {started} 个A6区域 (第{page_idx+1}页, 位置{pos_idx})")
+            # 绘制A6区域边框（可选，便于查看布局）
+            x_offset, y_offset = page_positions[page_idx][pos_idx]
+            (front_c if page_idx == 0 else back_c).rect(
+                x_offset, y_offset, A6_WIDTH, A6_HEIGHT, stroke=1, fill=0)
         page_idx, pos_idx = render_order[a6_index % 8]
-        # 选择当前应该渲染的画布（正面或背面）
-        if page_idx == 0:  # 正面页
-            current_canvas = front_c
-        else:  # 背面页
-            current_canvas = back_c
-
-        print(f"  渲染第 {a6_index} 个A6区域 (第{page_idx+1}页, 位置{pos_idx})")
-
-        # 获取当前A6区域的物理位置
         x_offset, y_offset = page_positions[page_idx][pos_idx]
+        return (front_c if page_idx == 0 else back_c), x_offset, y_offset
 
-        # 绘制A6区域边框（可选，便于查看布局）
-        current_canvas.rect(x_offset,
-                            y_offset,
-                            A6_WIDTH,
-                            A6_HEIGHT,
-                            stroke=1,
-                            fill=0)
-
-        # 在A6区域内绘制文本，并更新游标
-        cursor, has_more_text = draw_text_in_a6_region_with_cursor(
-            canvas_obj=current_canvas,
-            text=text_content,
-            start_cursor=cursor,
-            x=x_offset,
-            y=y_offset,
-            width=A6_WIDTH,
-            height=A6_HEIGHT,
-            font_name=DEFAULT_FONT)
-
-        if a6_index % 8 == 7:
-            front_c.showPage()
-            back_c.showPage()
-            sheet_count += 1
-
-        a6_index += 1
+    typography = current_typography()
+    a6_index = 0
+    cursor_y = None
+    # 第一阶段在进程池中并行拆分行，第二阶段在这里顺序分配A6区域并绘制
+    for blocks in textlayout.layout_chapters(
+            txt_chapters(line for _, line in source.lines()), typography,
+            None, layout_workers):
+        ops, a6_index, cursor_y = textlayout.place_blocks(
+            blocks, a6_index, cursor_y, typography)
+        for op in ops:
+            if op[0] != "line":
+                continue
+            _, index, text_y, text, text_width, size, align, _ = op
+            current_canvas, x_offset, y_offset = a6_region(index)
+            if align == "center":
+                line_x = x_offset + (A6_WIDTH - text_width) / 2
+            else:
+                line_x = x_offset + MARGIN
+            region_text.line(current_canvas, index, line_x, y_offset + text_y,
+                             text, typography["font_name"], size)
+    # 最后一个区域没有文字时也画出边框
+    a6_region(a6_index)
+    region_text.flush()
+    if a6_index % 8 == 7:
+        front_c.showPage()
+        back_c.showPage()
+        sheet_count += 1
 
     # 保存两个PDF
     front_c.save()
@@ -294,8 +202,7 @@ def generate_custom_order_pdfs(text_file_path, front_pdf, back_pdf,
 
     print(f"✅ 正面PDF生成完成！路径：{os.path.abspath(front_pdf)}")
     print(f"✅ 背面PDF生成完成！路径：{os.path.abspath(back_pdf)}")
-    print(f"📝 从位置 0 到位置 {cursor} 的文本已被处理")
-    print(f"📝 原始文本长度: {len(text_content)}, 已处理长度: {cursor}")
+    print(f"📝 共使用了 {a6_index + 1} 个A6区域")
     print(f"📄 每个PDF共生成了 {sheet_count} 页")
     
     return front_pdf, back_pdf, sheet_count
@@ -383,12 +290,17 @@ def main():
     if len(sys.argv) >= 3:
         merge_pdf_path = sys.argv[2]
     print(f"渲染顺序：{render_order}")
-    
-    _, _, sheet_count = generate_custom_order_pdfs(input_txt_file, front_pdf_file,
-                                back_pdf_file, render_order)
-    
-    # 如果提供了合并PDF路径，则合并PDF
-    if merge_pdf_path:
+
+    if not merge_pdf_path:
+        generate_custom_order_pdfs(input_txt_file, front_pdf_file, back_pdf_file,
+                                   render_order)
+        return
+    # 合并时正面和背面PDF只是中间文件，放在本次运行独有的临时目录中，同时运行多本书不会互相覆盖
+    with util.scratch_dir("text2pdf-") as scratch:
+        front_pdf_file = os.path.join(scratch, front_pdf_file)
+        back_pdf_file = os.path.join(scratch, back_pdf_file)
+        generate_custom_order_pdfs(input_txt_file, front_pdf_file, back_pdf_file,
+                                   render_order)
         merge_front_back_pdfs(front_pdf_file, back_pdf_file, merge_pdf_path)
     
 
@@ -0,0 +1,476 @@
+#  文本排版：段落换行、A6区域分配、章节排版缓存
+#  换行结果只和文本内容、排版参数有关，与章节落在哪个A6区域无关，
+#  因此可以按章节缓存到磁盘，重新生成时直接回放给渲染器
+#  排版分两个阶段：
+#    第一阶段（layout_chapters）：各章节互不依赖，在进程池中并行拆分成行
+#    第二阶段（place_blocks）：顺序地把行分配到A6区域，只做坐标计算
+
+import hashlib
+import json
+import os
+import re
+import string
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+import fontchain
+
+# 排版算法版本号，修改换行/标题逻辑后需要递增，使旧缓存失效
+LAYOUT_VERSION = 1
+# 章节排版缓存的大小上限（MB），超过时按修改时间删除最久未用的条目，删到上限的 80%
+CACHE_MAX_MB = 256
+# 每写入多少个缓存条目检查一次大小
+CACHE_PRUNE_INTERVAL = 200
+
+# 每种字体的单字符宽度表（字体单位，1000 = 1个字号）
+_char_widths = {}
+
+
+# ==================== 标题检测 ====================
+# 正则和字符集合只在模块加载时构建一次，逐段检测时不再重复编译
+CHINESE_NUMBERS = frozenset('零一二三四五六七八九十百千万亿○')
+# 第x章、第x节、第x篇、第x回、章x、节x、篇x、回x
+CHAPTER_PATTERN = re.compile(
+    r'^(?:第[一二三四五六七八九十零\d]+[章节篇回]|[章节篇回][一二三四五六七八九十零\d]+)')
+# 第x卷、卷x、第x部、上下卷、前后篇
+VOLUME_PATTERN = re.compile(
+    r'^(?:第[一二三四五六七八九十零\d]+[卷部]|卷[一二三四五六七八九十零\d]|[上下]卷|[前后]篇)')
+# 中文标点符号
+CHINESE_PUNCTUATION = '，。！？；：""''（）【】《》〈〉「」『』〈〉〔〕…—–'
+ALL_PUNCTUATION = frozenset(string.punctuation + CHINESE_PUNCTUATION)
+TITLE_KEYWORDS = ('序', '引言', '前言', '后记', '目录', '简介', '概要', '总结', '结论')
+
+# 标题层级：卷/部为一级，章/节/回及其他标题为二级
+LEVEL_VOLUME = 0
+LEVEL_CHAPTER = 1
+
+
+def detect_title(text):
+    """
+    检测文本是否为标题，并给出标题层级
+    :param text: 段落文本
+    :return: LEVEL_VOLUME / LEVEL_CHAPTER，不是标题时返回 None
+    """
+    if not text:
+        return None
+    # 去除首尾空白
+    text = text.strip()
+    if not text:
+        return None
+
+    # 检查是否只包含中文数字
+    if all(c in CHINESE_NUMBERS for c in text if c.strip()):
+        return LEVEL_CHAPTER
+
+    # 检查卷数模式和章节模式
+    if VOLUME_PATTERN.match(text):
+        return LEVEL_VOLUME
+    if CHAPTER_PATTERN.match(text):
+        return LEVEL_CHAPTER
+
+    # 检查是否全是标点符号
+    if all(c in ALL_PUNCTUATION or c.isspace() for c in text):
+        return None  # 全是标点符号不是标题
+
+    # 如果文本较短且看起来像标题（如只有一行），检查是否包含标题关键词
+    if len(text) <= 15 and '\n' not in text and '\r' not in text:
+        if any(keyword in text for keyword in TITLE_KEYWORDS):
+            return LEVEL_CHAPTER
+
+    return None
+
+
+def check_is_title(str):
+    """
+    中文检测是否为标题
+    """
+    return detect_title(str) is not None
+
+
+def chapter_heading(paragraphs):
+    """
+    取章节的标题（第一个HTML标题或第一个被识别为标题的段落）
+    :param paragraphs: 段落列表
+    :return: {"title": 标题, "level": 层级}，没有标题时返回 None
+    """
+    for kind, value in paragraphs:
+        if kind == "img":
+            continue
+        text = value.strip()
+        if kind == "h" and text:
+            return {"title": text, "level": LEVEL_CHAPTER}
+        level = detect_title(text)
+        if level is not None:
+            return {"title": text, "level": level}
+    return None
+
+
+def char_width(font_name, ch):
+    """
+    获取单个字符的宽度（字体单位），按字体缓存
+    """
+    widths = _char_widths.get(font_name)
+    if widths is None:
+        widths = _char_widths[font_name] = {}
+    w = widths.get(ch)
+    if w is None:
+        w = widths[ch] = pdfmetrics.stringWidth(ch, font_name, 1000)
+    return w
+
+
+def typography_chain(typography):
+    """
+    取排版参数对应的字体回退链，没有配置后备字体时返回 None
+    """
+    fallback_fonts = typography.get("fallback_fonts")
+    if not fallback_fonts:
+        return None
+    return fontchain.get_chain([typography["font_name"]] +
+                               [name for name, _ in fallback_fonts])
+
+
+def break_text_lines(text, font_name, font_size, max_width, chain=None,
+                     word_wrap=False):
+    """
+    将一段文本按可用宽度拆分成多行
+    逐字符累加宽度，不再对每个前缀重复调用 stringWidth
+    :param text: 段落文本
+    :param font_name: 字体名称
+    :param font_size: 字体大小
+    :param max_width: 每行可用宽度
+    :param chain: 字体回退链，缺字的字符按后备字体计算宽度
+    :param word_wrap: 超宽时在行内最后一个空格之后断行（西文按单词换行），没有空格时按字符断行
+    :return: [[行文本, 行宽度], ...]，用到后备字体的行为
+             [行文本, 行宽度, [[字体序号, 片段文本], ...]]
+    """
+    if chain is not None:
+        font_names = chain.font_names
+
+        def width_of(ch):
+            return char_width(font_names[chain.font_index(ch)], ch)
+    else:
+        def width_of(ch):
+            return char_width(font_name, ch)
+
+    scale = 0.001 * font_size
+    lines = []
+    line_start = 0
+    while line_start < len(text):
+        line_end = line_start
+        total = 0
+        # 寻找合适的换行点
+        while line_end < len(text):
+            # 检查是否遇到换行符
+            if text[line_end] == '\n':
+                line_end += 1  # 包含换行符
+                break
+            w = width_of(text[line_end])
+            # 如果当前行宽度超过可用宽度，回退到上一个合适的断点
+            if scale * (total + w) > max_width:
+                space = text.rfind(' ', line_start + 1, line_end + 1) if word_wrap else -1
+                if space > 0 and text[line_start:space].strip():
+                    line_end = space + 1
+                elif line_end > line_start + 1:
+                    line_end -= 1
+                break
+            total += w
+            line_end += 1
+        if line_end == line_start:
+            # 单个字符就超宽，强制换行
+            line_end += 1
+        current_line = text[line_start:line_end].rstrip('\n')
+        line_width = scale * sum(width_of(ch) for ch in current_line)
+        runs = chain.runs(current_line) if chain is not None else None
+        if runs and (len(runs) > 1 or runs[0][0] != 0):
+            # 只有用到后备字体的行才记录字体片段
+            lines.append([current_line, line_width, runs])
+        else:
+            lines.append([current_line, line_width])
+        line_start = line_end
+    return lines
+
+
+def layout_chapter(paragraphs, typography):
+    """
+    对一个章节排版：判断标题、加缩进、拆分行
+    :param paragraphs: 段落列表，每项为 (类型, 内容)，类型为 "p"（正文段落）、
+                       "h"（HTML标题）、"img"（图片路径），以及纯文本按行排版时的
+                       "l"（正文行，不加缩进，保留行首空白）和 "br"（空行，占一行高度）
+    :param typography: 排版参数字典，"word_wrap" 为 True 时按单词换行（见 break_text_lines）
+    :return: 排版块列表，可直接序列化为JSON
+    """
+    font_name = typography["font_name"]
+    font_size = typography["font_size"]
+    chain = typography_chain(typography)
+    blocks = []
+    for kind, value in paragraphs:
+        if kind == "img":
+            blocks.append({"type": "image", "src": value})
+            continue
+        if kind == "br":
+            line_height = font_size + typography["line_space"]
+            blocks.append({"type": "text", "title": False, "size": font_size,
+                           "align": "left", "advance": line_height,
+                           "line_height": line_height, "lines": [["", 0]]})
+            continue
+        text = value.strip()
+        if len(text) == 0:
+            continue
+        if kind == "h":
+            is_title = True
+            size = font_size + 3
+        else:
+            is_title = check_is_title(text)
+            if is_title:
+                size = typography["title_size"]
+            else:
+                size = font_size
+                text = value.rstrip() if kind == "l" else typography["indent"] + text
+        line_height = size + typography["line_space"]
+        blocks.append({
+            "type": "text",
+            "title": is_title,
+            "size": size,
+            "align": "center" if is_title else "left",
+            "advance": line_height + 3 if size > font_size else line_height,
+            "line_height": line_height,
+            "lines": break_text_lines(text, font_name, size,
+                                      typography["max_width"], chain,
+                                      typography.get("word_wrap", False)),
+        })
+    return blocks
+
+
+class LayoutCache:
+    """
+    章节排版结果的磁盘缓存
+    键为章节内容和排版参数的哈希，任何一项变化都会得到新的键；
+    命中时更新条目的修改时间，打开缓存时和每写入 CACHE_PRUNE_INTERVAL 个条目后按大小上限淘汰
+    （jobserver、watchbook 等常驻进程反复调整排版参数时缓存不会无限增长）
+    """
+
+    def __init__(self, cache_dir, max_mb=CACHE_MAX_MB):
+        """
+        :param cache_dir: 缓存目录
+        :param max_mb: 大小上限（MB），0 表示不限制
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self.prune()
+
+    def key(self, paragraphs, typography):
+        payload = json.dumps([LAYOUT_VERSION, typography, paragraphs],
+                             ensure_ascii=False,
+                             sort_keys=True)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'r', encoding='utf-8') as f:
+                blocks = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        try:
+            os.utime(self._path(key))  # 最近使用的条目最后淘汰
+        except OSError:
+            pass
+        return blocks
+
+    def put(self, key, blocks):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，避免并行任务读到写了一半的缓存
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(blocks, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        self._puts += 1
+        if self._puts % CACHE_PRUNE_INTERVAL == 0:
+            self.prune()
+
+    def prune(self):
+        """
+        缓存超过大小上限时删除修改时间最早的条目，直到不超过上限的 80%
+        :return: 删除的条目数
+        """
+        if not self.max_bytes or not os.path.isdir(self.cache_dir):
+            return 0
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue  # 其他进程刚刚删除
+                entries.append((st.st_mtime_ns, st.st_size, path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return 0
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes * 0.8:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+
+def layout_chapter_cached(paragraphs, typography, cache=None):
+    """
+    带缓存的章节排版，缓存命中时直接返回上次的排版结果
+    """
+    if cache is None:
+        return layout_chapter(paragraphs, typography)
+    key = cache.key(paragraphs, typography)
+    blocks = cache.get(key)
+    if blocks is None:
+        blocks = layout_chapter(paragraphs, typography)
+        cache.put(key, blocks)
+    return blocks
+
+
+def ensure_font(font_name, font_path):
+    """
+    确保字体已注册（进程池的子进程以 spawn 方式启动时不会继承主进程注册的字体）
+    """
+    if font_path and font_name not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(font_name, font_path))
+
+
+def _layout_chapter_worker(paragraphs, typography):
+    """
+    进程池中执行的章节排版
+    """
+    ensure_font(typography["font_name"], typography.get("font_path"))
+    for font_name, font_path in typography.get("fallback_fonts") or []:
+        ensure_font(font_name, font_path)
+    return layout_chapter(paragraphs, typography)
+
+
+def layout_chapters(chapters, typography, cache=None, workers=None):
+    """
+    第一阶段：并行排版所有章节，按原顺序逐章返回排版结果
+    缓存命中的章节直接返回；未命中的章节提交到进程池，
+    同时最多只有 workers * 4 个章节在排队，内存占用与书的长度无关
+    :param chapters: 章节迭代器，每个章节是段落列表
+    :param typography: 排版参数字典
+    :param cache: LayoutCache 对象，为 None 时不使用缓存
+    :param workers: 进程数，默认使用全部CPU核心，1 表示在当前进程中顺序排版
+    :return: 排版块列表的迭代器
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for paragraphs in chapters:
+            yield layout_chapter_cached(paragraphs, typography, cache)
+        return
+
+    executor = None  # 全部命中缓存时不启动进程池
+    pending = deque()  # (缓存键, 排版结果或Future)
+    try:
+        for paragraphs in chapters:
+            key = cache.key(paragraphs, typography) if cache else None
+            blocks = cache.get(key) if cache else None
+            if blocks is None:
+                if executor is None:
+                    executor = ProcessPoolExecutor(max_workers=workers)
+                blocks = executor.submit(_layout_chapter_worker, paragraphs,
+                                         typography)
+            pending.append((key, blocks))
+            # 按顺序输出已经排好的章节，控制排队的章节数量
+            while pending and (len(pending) > workers * 4 or
+                               not hasattr(pending[0][1], "result") or
+                               pending[0][1].done()):
+                yield _finish_pending(pending.popleft(), cache)
+        while pending:
+            yield _finish_pending(pending.popleft(), cache)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def _finish_pending(item, cache):
+    """
+    取出排队章节的排版结果，新排版的章节写入缓存
+    """
+    key, blocks = item
+    if hasattr(blocks, "result"):
+        blocks = blocks.result()
+        if cache is not None:
+            cache.put(key, blocks)
+    return blocks
+
+
+def place_blocks(blocks, a6_index, cursor_y, typography):
+    """
+    将排版块依次分配到A6区域（顺序执行，只做坐标计算）
+    :param blocks: layout_chapter 返回的排版块
+    :param a6_index: 当前A6区域索引
+    :param cursor_y: 当前区域内下一行的y坐标（相对区域底部），None 表示新区域
+    :param typography: 排版参数字典
+    :return: (ops, a6_index, cursor_y)
+             ops 为绘制指令列表：
+             ("line", A6索引, y, 文本, 宽度, 字号, 对齐, 字体片段或None)
+             ("image", A6索引, 图片路径)
+             ("end", A6索引) - 该A6区域已结束
+    """
+    region_top = typography["region_top"]
+    region_bottom = typography["region_bottom"]
+    ops = []
+    for block in blocks:
+        if block["type"] == "image":
+            if a6_index >= 1 and cursor_y is not None:  # 处理没绘制完的页面
+                ops.append(("end", a6_index))
+                a6_index += 1
+            ops.append(("image", a6_index, block["src"]))
+            ops.append(("end", a6_index))
+            a6_index += 1
+            cursor_y = None
+            continue
+        size = block["size"]
+        for line in block["lines"]:
+            text, width = line[0], line[1]
+            if cursor_y is None:
+                cursor_y = region_top
+            # 检查当前行是否还有足够的垂直空间
+            if cursor_y - block["line_height"] < region_bottom:
+                ops.append(("end", a6_index))
+                a6_index += 1
+                cursor_y = region_top
+            if text:
+                ops.append(("line", a6_index, cursor_y - size, text, width,
+                            size, block["align"],
+                            line[2] if len(line) > 2 else None))
+            cursor_y -= block["advance"]
+    return ops, a6_index, cursor_y
+
+
+def measure_regions(chapters, typography, cache=None, workers=None):
+    """
+    只排版不绘制：执行换行和A6区域分配，统计需要的A6区域数量
+    不创建画布、不读取图片，耗时只有完整渲染的一小部分
+    :return: 使用的A6区域数量
+    """
+    a6_index = 0
+    cursor_y = None
+    for blocks in layout_chapters(chapters, typography, cache, workers):
+        _, a6_index, cursor_y = place_blocks(blocks, a6_index, cursor_y,
+                                             typography)
+    return a6_index + 1
@@ -0,0 +1,143 @@
+#  TXT文本读取：内存映射 + 编码探测 + 逐段解码
+#  支持 UTF-8 / GBK(GB18030) / Big5 等编码的网络小说，
+#  文件通过 mmap 映射，按行解码并逐段返回，内存占用只与单个段落有关
+
+import codecs
+import mmap
+import os
+
+# 编码探测时读取的文件前缀长度
+SAMPLE_SIZE = 256 * 1024
+# 无法按字节换行切分的编码（UTF-16）每次解码的块大小
+CHUNK_SIZE = 1024 * 1024
+
+
+def _gb2312_ratio(text):
+    """
+    计算文本中的汉字能用 GB2312 编码的比例
+    简体中文按 GB18030 解码后几乎全部落在 GB2312 范围内，
+    而 Big5 文本按 GB18030 解码会得到大量生僻字
+    """
+    hanzi = set(ch for ch in text if '一' <= ch <= '鿿')
+    if not hanzi:
+        return 1.0
+    common = 0
+    for ch in hanzi:
+        try:
+            ch.encode('gb2312')
+            common += 1
+        except UnicodeEncodeError:
+            pass
+    return common / len(hanzi)
+
+
+def _try_decode(sample, encoding):
+    try:
+        return sample.decode(encoding)
+    except UnicodeDecodeError:
+        return None
+
+
+def detect_encoding(sample):
+    """
+    根据文件前缀探测编码
+    :param sample: 文件开头的字节
+    :return: 编码名称
+    """
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith(codecs.BOM_UTF16_LE) or sample.startswith(
+            codecs.BOM_UTF16_BE):
+        return 'utf-16'
+    # 在最后一个换行处截断，避免末尾被截断的多字节字符导致误判
+    cut = sample.rfind(b'\n')
+    if cut > 0:
+        sample = sample[:cut]
+    if _try_decode(sample, 'utf-8') is not None:
+        return 'utf-8'
+    gb_text = _try_decode(sample, 'gb18030')
+    big5_text = _try_decode(sample, 'big5')
+    if gb_text is not None and big5_text is not None:
+        # 两种编码都能解码时，按常用汉字比例判断
+        return 'gb18030' if _gb2312_ratio(gb_text) >= 0.9 else 'big5'
+    if big5_text is not None:
+        return 'big5'
+    # GB18030 几乎能解码任意字节，作为最后的选择（解码错误会被替换）
+    return 'gb18030'
+
+
+class TextSource:
+    """
+    基于内存映射的文本文件读取器
+    """
+
+    def __init__(self, path, encoding=None):
+        self.path = path
+        self.size = os.path.getsize(path)
+        self.encoding = encoding
+        if self.encoding is None:
+            with open(path, 'rb') as f:
+                self.encoding = detect_encoding(f.read(SAMPLE_SIZE))
+
+    def lines(self, start=0):
+        """
+        从指定字节偏移开始逐行解码
+        :param start: 起始字节偏移（必须位于行首）
+        :return: (行首字节偏移, 行文本) 迭代器
+        """
+        if self.size == 0:
+            return
+        encoding = self.encoding
+        if encoding.startswith('utf-16'):
+            yield from self._chunked_lines()
+            return
+        with open(self.path, 'rb') as f, mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = start
+            if encoding == 'utf-8-sig':
+                encoding = 'utf-8'
+                if pos == 0 and mm[:3] == codecs.BOM_UTF8:
+                    pos = 3
+            # UTF-8、GB18030、Big5 的多字节字符中都不会出现换行符的字节，
+            # 可以直接在字节层面按换行切分
+            while pos < self.size:
+                newline = mm.find(b'\n', pos)
+                end = self.size if newline < 0 else newline + 1
+                yield pos, mm[pos:end].decode(encoding, errors='replace')
+                pos = end
+
+    def _chunked_lines(self):
+        """
+        UTF-16 文本用增量解码器分块解码（此时不提供字节偏移）
+        """
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors='replace')
+        rest = ''
+        with open(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                text = rest + decoder.decode(chunk, final=not chunk)
+                lines = text.split('\n')
+                rest = lines.pop()
+                for line in lines:
+                    yield None, line + '\n'
+                if not chunk:
+                    break
+        if rest:
+            yield None, rest
+
+    def paragraphs(self, start=0):
+        """
+        逐段返回非空段落（网络小说通常一行一段）
+        :param start: 起始字节偏移
+        :return: (段落字节偏移, 段落文本) 迭代器
+        """
+        for offset, line in self.lines(start):
+            text = line.strip()
+            if text:
+                yield offset, text
+
+    def read(self):
+        """
+        一次性解码整个文件（供需要完整文本的脚本使用）
+        """
+        return ''.join(line for _, line in self.lines())
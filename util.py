@@ -1,3 +1,10 @@
+import contextlib
+import hashlib
+import os
+import shutil
+import tempfile
+
+
 def genNumberSeqByA4Page(m):
     """
     生成A4纸张的页面排列顺序
@@ -44,6 +51,125 @@ def genNumberSeqByA4Page(m):
     
     return result
 
+
+def pop_option(args, name, default=None):
+    """
+    从命令行参数列表中取出带值的选项（如 --fit-sheets 40），并从列表中移除
+    其余位置参数保持原有顺序，便于脚本继续按位置读取
+    :param args: 命令行参数列表（会被修改）
+    :param name: 选项名称
+    :param default: 未提供该选项时的默认值
+    :return: 选项的值
+    """
+    if name in args:
+        index = args.index(name)
+        if index + 1 >= len(args):
+            raise ValueError(f"错误：选项 {name} 缺少参数值！")
+        value = args[index + 1]
+        del args[index:index + 2]
+        return value
+    return default
+
+
+def pop_flag(args, name):
+    """
+    从命令行参数列表中取出开关选项（如 --measure），并从列表中移除
+    :param args: 命令行参数列表（会被修改）
+    :param name: 选项名称
+    :return: 是否提供了该选项
+    """
+    if name in args:
+        args.remove(name)
+        return True
+    return False
+
+
+@contextlib.contextmanager
+def scratch_dir(prefix="pdfbook-"):
+    """
+    为一个任务创建独立的临时目录（横图分割、重新编码等中间文件），
+    退出时（包括出错和 Ctrl-C）自动删除，同时运行的多个任务不会写到同一个目录
+    :param prefix: 目录名前缀
+    :return: 临时目录路径
+    """
+    path = tempfile.mkdtemp(prefix=prefix)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def scratch_name(image_path, suffix, scratch="", *variant):
+    """
+    临时目录中的中间文件名：原文件名加上路径（和生成参数）的短哈希，
+    同一文件夹中的 001.jpg 和 001.png、不同文件夹中的同名图片不会互相覆盖
+    临时目录中的图片（横图分割等的结果）按相对于临时目录的路径计算哈希，每次运行得到相同的文件名（续做时拼版状态不变）
+    :param image_path: 原图路径
+    :param suffix: 文件名后缀（包括扩展名），如 "_budget.jpg"
+    :param scratch: 任务的临时目录，"" 表示没有
+    :param variant: 影响文件内容的生成参数
+    :return: 文件名（不含目录）
+    """
+    path = os.path.abspath(image_path)
+    if scratch:
+        scratch = os.path.abspath(scratch)
+        if path.startswith(os.path.join(scratch, "")):
+            path = os.path.relpath(path, scratch)
+    digest = hashlib.sha1(repr((path,) + variant).encode("utf-8")).hexdigest()[:8]
+    return f"{os.path.splitext(os.path.basename(image_path))[0]}-{digest}{suffix}"
+
+
+class RegionText:
+    """
+    把同一个A6区域的所有文字行（包括页码）合并到一个 BT/ET 文本对象中，
+    行与行之间使用相对移动（Td），字体只在真正改变时才重新设置（Tf），
+    比每行单独 setFont + drawString 生成的内容流更小，渲染更快
+    """
+
+    def __init__(self):
+        self.region = None
+        self.canvas_obj = None
+        self.text_obj = None
+        self.x = self.y = 0
+        self.font = None
+
+    def line(self, canvas_obj, region, x, y, text, font_name, font_size,
+             runs=None):
+        """
+        在区域的文本对象中添加一行文字，区域改变时先输出上一个区域的文本对象
+        :param canvas_obj: ReportLab PDF画布对象
+        :param region: 区域标识（如A6区域索引）
+        :param x: 行起点的x坐标（页面坐标）
+        :param y: 基线的y坐标（页面坐标）
+        :param runs: 字体片段 [(字体名称, 片段文本), ...]，为 None 时整行使用 font_name
+        """
+        if self.text_obj is None or self.region != region:
+            self.flush()
+            self.region = region
+            self.canvas_obj = canvas_obj
+            self.text_obj = canvas_obj.beginText(x, y)
+        else:
+            # moveCursor 的 dy 以向下为正
+            self.text_obj.moveCursor(x - self.x, self.y - y)
+        self.x, self.y = x, y
+        for run_font, run_text in runs or [(font_name, text)]:
+            if self.font != (run_font, font_size):
+                self.text_obj.setFont(run_font, font_size)
+                self.font = (run_font, font_size)
+            self.text_obj.textOut(run_text)
+
+    def flush(self):
+        """
+        把当前区域的文本对象写入画布（绘制图片、换页和保存之前都要调用）
+        """
+        if self.text_obj is not None:
+            self.canvas_obj.drawText(self.text_obj)
+        self.region = None
+        self.canvas_obj = None
+        self.text_obj = None
+        self.font = None
+
+
 # 测试函数
 if __name__ == "__main__":
     # 测试1张纸的情况
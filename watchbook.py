@@ -0,0 +1,341 @@
+#  收件箱监视：扫描站把扫描完成的整卷图片文件夹放进收件箱，自动用 dankai 生成册子PDF放进发件箱
+#  文件夹停止变化一段时间后才开始生成（防止拷贝到一半就开始）；
+#  配置按以下顺序选择：文件夹内的 booklet.ini > 收件箱中同名的 <文件夹名>.ini >
+#  规则文件中匹配文件夹名的配置 > 配置目录中名称是文件夹名前缀的配置 > 默认配置
+#  同一卷重新放入时，图片和配置都没有变化就直接使用发件箱中已有的结果；
+#  生成失败的文件夹在 RETRY_SECONDS 秒后重试，从收件箱移走再放回时立即重试
+#  有 inotify_simple 库时用 inotify 等待文件变化，否则定时轮询
+#  用法：python watchbook.py <收件箱> <发件箱> [--configs 配置目录] [--rules 规则.ini]
+
+import configparser
+import fnmatch
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from inotify_simple import INotify, flags
+except ImportError:
+    INotify = None
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import util
+import imagecatalog
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 轮询间隔（秒）
+POLL_INTERVAL = 5
+# 文件夹停止变化多久后开始生成（秒）
+SETTLE_SECONDS = 30
+# 同时生成的册子数
+BUILD_WORKERS = 2
+# 生成失败后多久重试（秒）
+RETRY_SECONDS = 600
+# 文件夹内的配置文件名
+SIDECAR_NAME = "booklet.ini"
+# 发件箱中记录已生成结果的状态文件
+STATE_FILE = ".watchbook.json"
+
+
+def folder_snapshot(folder):
+    """
+    文件夹内容的快照：(文件数, 总大小, 最新修改时间)，用于判断文件夹是否还在变化
+    """
+    count = total = latest = 0
+    for root, _, files in os.walk(folder):
+        for name in files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except OSError:
+                continue  # 文件正在被移动
+            count += 1
+            total += st.st_size
+            latest = max(latest, st.st_mtime_ns)
+    return count, total, latest
+
+
+def folder_fingerprint(folder, config_file):
+    """
+    文件夹中的图片和所用配置的指纹，内容没有变化时指纹相同
+    """
+    digest = hashlib.sha1()
+    for image_path in imagecatalog.list_images(folder):
+        st = os.stat(image_path)
+        digest.update(f"{os.path.basename(image_path)}\0{st.st_size}\0"
+                      f"{st.st_mtime_ns}\n".encode("utf-8"))
+    with open(config_file, "rb") as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def load_rules(rules_file):
+    """
+    读取文件夹名规则：[rules] 段中每项为 文件夹名通配符 = 配置文件
+    :return: [(通配符, 配置文件路径), ...]，按文件中的顺序
+    """
+    if not rules_file:
+        return []
+    parser = configparser.ConfigParser(delimiters=("=",))
+    parser.optionxform = str  # 通配符区分大小写
+    parser.read(rules_file, encoding="utf-8")
+    if not parser.has_section("rules"):
+        return []
+    base = os.path.dirname(os.path.abspath(rules_file))
+    return [(pattern, os.path.join(base, config))
+            for pattern, config in parser.items("rules")]
+
+
+def match_config(folder, inbox, config_dir, rules, default_config):
+    """
+    为文件夹选择配置文件
+    :return: 配置文件路径，没有可用配置时返回 None
+    """
+    name = os.path.basename(folder)
+    for sidecar in (os.path.join(folder, SIDECAR_NAME),
+                    os.path.join(inbox, name + ".ini")):
+        if os.path.isfile(sidecar):
+            return sidecar
+    for pattern, config in rules:
+        if fnmatch.fnmatch(name, pattern):
+            return config
+    if config_dir and os.path.isdir(config_dir):
+        # 配置名是文件夹名的前缀（如 kenan.ini 对应 kenan_vol03），取最长的匹配
+        best = None
+        for filename in os.listdir(config_dir):
+            stem, ext = os.path.splitext(filename)
+            if ext == ".ini" and name.startswith(stem) and \
+                    (best is None or len(stem) > len(best)):
+                best = stem
+        if best is not None:
+            return os.path.join(config_dir, best + ".ini")
+    return default_config
+
+
+class BookWatcher:
+    """
+    监视收件箱，文件夹稳定后排队生成
+    """
+
+    def __init__(self, inbox, outbox, config_dir=None, rules_file=None,
+                 default_config=None, settle=SETTLE_SECONDS,
+                 interval=POLL_INTERVAL, workers=BUILD_WORKERS, retry=RETRY_SECONDS):
+        self.inbox = inbox
+        self.outbox = outbox
+        self.config_dir = config_dir
+        self.rules = load_rules(rules_file)
+        self.default_config = default_config
+        self.settle = settle
+        self.interval = interval
+        self.retry = retry
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.snapshots = {}  # 文件夹 -> (快照, 快照最后变化的时间)
+        self.building = {}  # 文件夹 -> (指纹, Future)
+        self.decided = {}  # 文件夹 -> 已经处理过的快照（快照不变时不再计算指纹）
+        self.state_path = os.path.join(outbox, STATE_FILE)
+        self.state = self._load_state()
+        self.inotify = None
+        if INotify is not None:
+            self.inotify = INotify()
+            self.inotify.add_watch(inbox, flags.CREATE | flags.MOVED_TO |
+                                   flags.CLOSE_WRITE | flags.DELETE)
+
+    def _load_state(self):
+        if os.path.exists(self.state_path):
+            with open(self.state_path, encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+    def _save_state(self):
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, self.state_path)
+
+    def wait(self):
+        """
+        等待下一次扫描：有 inotify 时收件箱有变化就提前醒来
+        """
+        if self.inotify is not None:
+            self.inotify.read(timeout=int(self.interval * 1000))
+        else:
+            time.sleep(self.interval)
+
+    def scan(self):
+        """
+        扫描一次收件箱：记录每个文件夹的快照，稳定的文件夹提交生成
+        :return: 本次提交的文件夹数
+        """
+        now = time.monotonic()
+        submitted = 0
+        names = sorted(name for name in os.listdir(self.inbox)
+                       if not name.startswith(".") and
+                       os.path.isdir(os.path.join(self.inbox, name)))
+        for folder in [folder for folder in self.snapshots
+                       if os.path.basename(folder) not in names]:
+            del self.snapshots[folder]  # 文件夹被移走
+            self.decided.pop(folder, None)
+            record = self.state.get(os.path.basename(folder), {})
+            if record.get("status") == "failed" and record.get("retry_at"):
+                # 放回收件箱时不用等到重试时间
+                record["retry_at"] = 0
+                self._save_state()
+        for name in names:
+            folder = os.path.join(self.inbox, name)
+            snapshot = folder_snapshot(folder)
+            previous = self.snapshots.get(folder)
+            if previous is None or previous[0] != snapshot:
+                self.snapshots[folder] = (snapshot, now)
+                continue
+            if now - previous[1] < self.settle or folder in self.building or \
+                    (self.decided.get(folder) == snapshot and not self._retry_due(name)):
+                continue
+            self.decided[folder] = snapshot
+            if self.submit(folder):
+                submitted += 1
+        self._collect()
+        return submitted
+
+    def _retry_due(self, name):
+        """
+        上次生成失败的文件夹是否到了重试时间
+        """
+        record = self.state.get(name, {})
+        return record.get("status") == "failed" and time.time() >= record.get("retry_at", 0)
+
+    def submit(self, folder):
+        """
+        文件夹已经稳定：内容或配置有变化时提交生成
+        :return: 是否提交
+        """
+        name = os.path.basename(folder)
+        config_file = match_config(folder, self.inbox, self.config_dir,
+                                   self.rules, self.default_config)
+        if config_file is None:
+            if self.state.get(name, {}).get("status") != "no-config":
+                print(f"⚠️ {name}：没有匹配的配置，跳过")
+                self.state[name] = {"status": "no-config"}
+                self._save_state()
+            return False
+        try:
+            fingerprint = folder_fingerprint(folder, config_file)
+        except (OSError, RuntimeError) as e:
+            print(f"⚠️ {name}：{e}")
+            return False
+        record = self.state.get(name, {})
+        if record.get("fingerprint") == fingerprint:
+            if record.get("status") == "failed":
+                if not self._retry_due(name):
+                    return False  # 内容没有变化，等到重试时间再生成
+                print(f"🔁 {name}：重试上次失败的生成")
+            elif os.path.exists(record.get("output", "")):
+                return False  # 内容没有变化，使用已有结果
+        output = os.path.abspath(os.path.join(self.outbox, name + ".pdf"))
+        print(f"📥 {name}：使用配置 {os.path.basename(config_file)} 生成")
+        self.building[folder] = (fingerprint, self.executor.submit(
+            build_booklet, folder, output, config_file))
+        return True
+
+    def _collect(self):
+        """
+        记录已经完成的生成结果
+        """
+        for folder in [folder for folder, (_, future) in self.building.items()
+                       if future.done()]:
+            fingerprint, future = self.building.pop(folder)
+            name = os.path.basename(folder)
+            output, ok = future.result()
+            self.state[name] = {"fingerprint": fingerprint, "output": output,
+                                "status": "done" if ok else "failed",
+                                "time": time.strftime("%Y-%m-%d %H:%M:%S")}
+            if not ok:
+                self.state[name]["retry_at"] = time.time() + self.retry
+            self._save_state()
+            if ok:
+                print(f"📤 {name}：{os.path.abspath(output)}")
+            else:
+                print(f"❌ {name}：生成失败，日志见 {output}.log（{self.retry:g} 秒后重试）")
+
+    def pending(self):
+        """
+        是否还有文件夹在等待稳定（或稳定后还没有处理）
+        """
+        return any(self.decided.get(folder) != snapshot
+                   for folder, (snapshot, _) in self.snapshots.items())
+
+    def run(self, once=False):
+        """
+        :param once: 只处理当前已经稳定的文件夹，处理完后退出（不等待新的文件夹）
+        """
+        print(f"👀 监视 {os.path.abspath(self.inbox)} → {os.path.abspath(self.outbox)}"
+              f"（{'inotify' if self.inotify else '轮询'}，稳定 {self.settle} 秒后生成）")
+        try:
+            while True:
+                self.scan()
+                if once and not self.building and not self.pending():
+                    break
+                self.wait()
+        except KeyboardInterrupt:
+            print("\n停止监视")
+        finally:
+            self.executor.shutdown(wait=True)
+            self._collect()
+
+
+def build_booklet(folder, output, config_file):
+    """
+    在单独的进程中运行 dankai 生成册子（每个册子的配置和临时文件互不影响）
+    工作目录是运行结束后自动删除的临时目录，发件箱中不留下中间文件
+    :return: (输出路径, 是否成功)
+    """
+    tmp_output = output + ".part.pdf"
+    with open(output + ".log", "w", encoding="utf-8") as log, \
+            util.scratch_dir("watchbook-") as work_dir:
+        result = subprocess.run(
+            [sys.executable, os.path.join(SCRIPT_DIR, "dankai.py"),
+             os.path.abspath(folder), os.path.abspath(tmp_output),
+             os.path.abspath(config_file)],
+            cwd=work_dir, stdout=log, stderr=subprocess.STDOUT)
+    # dankai 出错时只打印信息，以输出文件是否生成为准
+    if result.returncode != 0 or not os.path.exists(tmp_output):
+        return output, False
+    os.replace(tmp_output, output)
+    return output, True
+
+
+def main():
+    args = sys.argv[1:]
+    config_dir = util.pop_option(args, "--configs",
+                                 os.path.join(SCRIPT_DIR, "configs"))
+    rules_file = util.pop_option(args, "--rules")
+    default_config = util.pop_option(args, "--default-config")
+    settle = float(util.pop_option(args, "--settle", SETTLE_SECONDS))
+    interval = float(util.pop_option(args, "--interval", POLL_INTERVAL))
+    workers = int(util.pop_option(args, "--workers", BUILD_WORKERS))
+    retry = float(util.pop_option(args, "--retry", RETRY_SECONDS))
+    once = util.pop_flag(args, "--once")
+    if len(args) < 2:
+        print("❌ 参数错误！正确用法：")
+        print(f"python {os.path.basename(__file__)} <收件箱> <发件箱> [--configs 配置目录] [--rules 规则.ini] [--default-config 配置.ini] [--settle 秒] [--interval 秒] [--workers 数量] [--retry 秒] [--once]")
+        print("示例：")
+        print(f"python {os.path.basename(__file__)} ./inbox ./outbox --rules rules.ini --default-config configs/default.ini")
+        print(f"规则文件格式：[rules] 段中每行 文件夹名通配符 = 配置文件，如 *连环画* = configs/连环画.ini")
+        print(f"文件夹内放 {SIDECAR_NAME}，或在收件箱中放 <文件夹名>.ini，可以为单个文件夹指定配置")
+        print("--settle 文件夹停止变化多少秒后开始生成（默认30）")
+        print("--retry 生成失败多少秒后重试（默认600），把文件夹移出收件箱再放回会立即重试")
+        print("--once 处理完已经放入的文件夹后退出")
+        sys.exit(1)
+    inbox, outbox = args[0], args[1]
+    if not os.path.isdir(inbox):
+        print(f"❌ 收件箱不存在：{inbox}")
+        sys.exit(1)
+    os.makedirs(outbox, exist_ok=True)
+    BookWatcher(inbox, outbox, config_dir, rules_file, default_config,
+                settle, interval, workers, retry).run(once)
+
+
+if __name__ == "__main__":
+    main()